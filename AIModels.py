@@ -1,39 +1,69 @@
 import ModelInterfaces
+import ForcedAlignment
 import torch
 import numpy as np
+import time
 
 
 class NeuralASR(ModelInterfaces.IASRModel):
-    word_locations_in_samples = None
-    audio_transcript = None
-
-    def __init__(self, model: torch.nn.Module, decoder) -> None:
+    def __init__(self, model: torch.nn.Module, decoder, labels: list = None, blank: int = None) -> None:
         super().__init__()
         self.model = model
         self.decoder = decoder  # Decoder from CTC-outputs to transcripts
+        # Label of every CTC output, for forced alignment (alignReference)
+        self.labels = list(labels if labels is not None else getattr(decoder, 'labels', None) or [])
+        self.blank = blank if blank is not None else getattr(decoder, 'blank_idx', 0)
+        self._last_result = None
 
     def getTranscript(self) -> str:
         """Get the transcripts of the process audio"""
-        assert(self.audio_transcript != None,
-               'Can get audio transcripts without having processed the audio')
-        return self.audio_transcript
+        assert self._last_result is not None, \
+            'Can get audio transcripts without having processed the audio'
+        return self._last_result.transcript
 
     def getWordLocations(self) -> list:
         """Get the pair of words location from audio"""
-        assert(self.word_locations_in_samples != None,
-               'Can get word locations without having processed the audio')
+        assert self._last_result is not None, \
+            'Can get word locations without having processed the audio'
 
-        return self.word_locations_in_samples
+        return [location._asdict() for location in self._last_result.word_locations]
 
-    def processAudio(self, audio: torch.Tensor):
-        """Process the audio"""
+    def transcribe(self, audio: torch.Tensor, word_timestamps: bool = True) -> ModelInterfaces.ASRResult:
+        """Process the audio and return its result, without keeping state (CTC word locations are free)"""
+        start = time.perf_counter()
         audio_length_in_samples = audio.shape[1]
         with torch.inference_mode():
             nn_output = self.model(audio)
 
-            self.audio_transcript, self.word_locations_in_samples = self.decoder(
+            audio_transcript, word_locations_in_samples = self.decoder(
                 nn_output[0, :, :].detach(), audio_length_in_samples, word_align=True)
 
+        return ModelInterfaces.ASRResult.fromWordDicts(audio_transcript, word_locations_in_samples,
+                                                       time.perf_counter() - start)
+
+    def processAudio(self, audio: torch.Tensor):
+        """Process the audio"""
+        self._last_result = self.transcribe(audio)
+
+    def getEmissions(self, audio: torch.Tensor) -> np.ndarray:
+        """Log-probabilities over the labels per frame, shaped (frames, labels)"""
+        with torch.inference_mode():
+            nn_output = self.model(audio)[0].float()
+        # Some models end in a softmax, others return logits
+        if bool(torch.all(nn_output >= 0)) and bool(torch.allclose(nn_output.sum(dim=-1),
+                                                                   torch.ones(nn_output.shape[0]), atol=1e-3)):
+            return torch.log(nn_output.clamp_min(1e-10)).numpy()
+        return torch.log_softmax(nn_output, dim=-1).numpy()
+
+    def alignReference(self, audio: torch.Tensor, reference_text: str) -> list:
+        """
+        Force-align reference_text to the audio: {'word', 'start_ts', 'end_ts',
+        'confidence'} per word, times in samples (see ForcedAlignment.align_words)
+        """
+        log_probs = self.getEmissions(audio)
+        return ForcedAlignment.align_words(log_probs, reference_text, self.labels, self.blank,
+                                           samples_per_frame=audio.shape[1] / log_probs.shape[0])
+
 
 class NeuralTTS(ModelInterfaces.ITextToSpeechModel):
     def __init__(self, model: torch.nn.Module, sampling_rate: int) -> None:
@@ -57,9 +87,11 @@ class NeuralTranslator(ModelInterfaces.ITranslationModel):
 
     def translateSentence(self, sentence: str) -> str:
         """Get the transcripts of the process audio"""
-        tokenized_text = self.tokenizer(sentence, return_tensors='pt')
-        translation = self.model.generate(**tokenized_text)
-        translated_text = self.tokenizer.batch_decode(
-            translation, skip_special_tokens=True)[0]
+        return self.translateSentences([sentence])[0]
 
-        return translated_text
+    def translateSentences(self, sentences: list) -> list:
+        """Translate a batch of sentences with one padded generate call"""
+        tokenized_text = self.tokenizer(sentences, return_tensors='pt', padding=True)
+        with torch.inference_mode():
+            translation = self.model.generate(**tokenized_text)
+        return self.tokenizer.batch_decode(translation, skip_special_tokens=True)
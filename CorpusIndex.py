@@ -0,0 +1,536 @@
+"""
+Precomputed, memory-mapped index of the sentence corpora in databases/.
+
+For every sentence of databases/data_<language>.csv the index stores the
+tokenized words, the IPA of each word, the IPA of the sentence, the word
+count and the category, so sampling and scoring look them up instead of
+running the phoneme converter on every request. Inverted indices from
+phonemes and from words to sentences back the "practice these sounds"
+sampling (findPracticeSentences); together with word bigram postings they
+also shortlist the sentence a learner read in open-reading mode
+(identifySentence).
+
+Build (once, and again whenever a CSV changes):
+    python CorpusIndex.py            # all languages
+    python CorpusIndex.py en hi      # selected languages
+    python CorpusIndex.py --pairs    # data_de_en_2.pickle -> pandas-free columns
+
+File layout: b'PTCI', uint32 version, uint32 header length, a JSON header
+describing the arrays, then the arrays themselves, each 8-byte aligned.
+Strings are kept as one UTF-8 blob plus an int32 offsets array.
+"""
+
+import bisect
+import contextlib
+import csv
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+import numpy as np
+from string import punctuation
+import PhonemeInventory
+import WordMetrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process dev server, nothing to serialize against
+    fcntl = None
+
+SAMPLE_FOLDER = "./databases/"
+SENTENCE_PAIRS_PICKLE = "./data_de_en_2.pickle"
+SENTENCE_PAIRS_PATH = SAMPLE_FOLDER + "pairs_de_en.idx"
+AVAILABLE_LANGUAGES = ["hi", "mr", "en"]
+CSV_ENCODINGS = ["utf-8", "utf-8-sig", "latin-1", "cp1252"]
+
+INDEX_MAGIC = b"PTCI"
+INDEX_VERSION = 3
+_ALIGNMENT = 8
+
+# Word-count limits of the categories 1 (easy), 2 (medium) and 3 (hard)
+CATEGORY_LIMITS = [0, 8, 20, 100_000]
+
+# Practice sampling returns the PRACTICE_TOP_K sentences with the highest
+# idf-weighted density of the requested terms; the smoothing keeps one hit
+# in a two-word sentence from outranking several hits in a longer one.
+PRACTICE_TOP_K = 20
+PRACTICE_LENGTH_SMOOTHING = 10
+
+# Open reading: the transcript's words and word bigrams shortlist
+# OPEN_READING_CANDIDATES sentences, which are rescored by word edit
+# distance. The best one counts as read if at most OPEN_READING_MAX_WER of
+# its words had to be changed to get the transcript.
+OPEN_READING_CANDIDATES = 10
+OPEN_READING_MAX_WER = 0.5
+
+
+def get_sentence_category(sentence: str) -> int:
+    """Return 1 (easy), 2 (medium), or 3 (hard) based on word count."""
+    word_count = len(sentence.split())
+    for cat in range(len(CATEGORY_LIMITS) - 1):
+        if CATEGORY_LIMITS[cat] < word_count <= CATEGORY_LIMITS[cat + 1]:
+            return cat + 1
+    return 3  # fallback
+
+
+def get_csv_path(language: str) -> str:
+    return os.path.join(SAMPLE_FOLDER, "data_" + language + ".csv")
+
+
+def get_index_path(language: str) -> str:
+    return os.path.join(SAMPLE_FOLDER, "corpus_" + language + ".idx")
+
+
+def read_sentences(csv_path: str) -> list:
+    """Sentences of a ';'-separated corpus CSV with a 'sentence' column."""
+    last_err = None
+    for encoding in CSV_ENCODINGS:
+        try:
+            with open(csv_path, newline="", encoding=encoding) as handle:
+                return [row["sentence"] for row in csv.DictReader(handle, delimiter=";")]
+        except UnicodeDecodeError as exc:
+            last_err = exc
+    raise last_err
+
+
+def normalize_word(word: str) -> str:
+    return "".join(ch for ch in word if ch not in punctuation).lower()
+
+
+def get_normalized_words(sentence: str) -> list:
+    return [word for word in (normalize_word(word) for word in sentence.split()) if word]
+
+
+def get_word_bigrams(words: list) -> list:
+    return [first + " " + second for first, second in zip(words, words[1:])]
+
+
+def hash_sentence(sentence: str) -> int:
+    digest = hashlib.blake2b(sentence.strip().encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_source_header(csv_path: str) -> dict:
+    """Header fields identifying the contents of the CSV a file is built from."""
+    return {"source_size": os.path.getsize(csv_path), "source_hash": hash_file(csv_path)}
+
+
+def is_built_from(header: dict, csv_path: str) -> bool:
+    """
+    Whether a file with this header was built from the current contents of
+    csv_path. Compares a content hash, so edits that keep the size and
+    copies that keep the mtime are both caught.
+    """
+    try:
+        if header.get("source_size") != os.path.getsize(csv_path):
+            return False
+        return header.get("source_hash") == hash_file(csv_path)
+    except OSError:
+        return False
+
+
+# ─── Strings ────────────────────────────────────────────────────────────────
+def pack_strings(strings: list):
+    """One UTF-8 blob plus int32 offsets (len(strings) + 1 entries)."""
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int32)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return blob, offsets
+
+
+class StringTable:
+    """Read-only list of strings over a UTF-8 blob and its offsets."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray) -> None:
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def fromStrings(cls, strings: list) -> "StringTable":
+        return cls(*pack_strings(strings))
+
+    def __getitem__(self, idx: int) -> str:
+        return self.blob[self.offsets[idx]:self.offsets[idx + 1]].tobytes().decode("utf-8")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def slice(self, start: int, end: int) -> list:
+        return [self[idx] for idx in range(start, end)]
+
+
+# ─── Inverted index ─────────────────────────────────────────────────────────
+def build_postings(term_lists: list) -> dict:
+    """
+    CSR postings of per-sentence term lists: the postings of the term
+    vocabulary[t] are sentence_ids/counts[indptr[t]:indptr[t + 1]]. The
+    vocabulary is sorted, so terms are looked up by binary search.
+    """
+    number_of_sentences = len(term_lists)
+    vocabulary = {term: term_id for term_id, term in
+                  enumerate(sorted({term for terms in term_lists for term in terms}))}
+    term_ids = [vocabulary[term] for terms in term_lists for term in terms]
+    sentence_ids = np.repeat(np.arange(number_of_sentences, dtype=np.int64),
+                             [len(terms) for terms in term_lists])
+
+    keys, counts = np.unique(np.array(term_ids, dtype=np.int64) * max(number_of_sentences, 1)
+                             + sentence_ids, return_counts=True)
+    posting_terms, posting_sentences = np.divmod(keys, max(number_of_sentences, 1))
+    indptr = np.zeros(len(vocabulary) + 1, dtype=np.int32)
+    np.cumsum(np.bincount(posting_terms, minlength=len(vocabulary)), out=indptr[1:])
+    vocabulary_blob, vocabulary_offsets = pack_strings(list(vocabulary))
+    return {
+        "vocabulary_blob": vocabulary_blob,
+        "vocabulary_offsets": vocabulary_offsets,
+        "indptr": indptr,
+        "sentence_ids": posting_sentences.astype(np.int32),
+        "counts": counts.astype(np.uint16),
+        "lengths": np.bincount(sentence_ids, minlength=number_of_sentences).astype(np.uint16),
+    }
+
+
+class InvertedIndex:
+    """Term -> sentence postings of one index file, with weighted retrieval."""
+
+    def __init__(self, arrays: dict) -> None:
+        self.vocabulary = StringTable(arrays["vocabulary_blob"], arrays["vocabulary_offsets"])
+        self.indptr = arrays["indptr"]
+        self.sentence_ids = arrays["sentence_ids"]
+        self.counts = arrays["counts"]
+        self.lengths = arrays["lengths"]
+
+    def termId(self, term: str) -> int:
+        """Position of term in the sorted vocabulary, or -1; decodes O(log n) strings."""
+        idx = bisect.bisect_left(self.vocabulary, term)
+        if idx < len(self.vocabulary) and self.vocabulary[idx] == term:
+            return idx
+        return -1
+
+    def scores(self, terms: list) -> np.ndarray:
+        """Per sentence, the idf-weighted occurrences of terms per (smoothed) sentence length."""
+        number_of_sentences = len(self.lengths)
+        term_ids = {self.termId(term) for term in terms} - {-1}
+        if not term_ids:
+            return np.zeros(number_of_sentences, dtype=np.float64)
+        sentence_ids, weights = [], []
+        for term_id in term_ids:
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            idf = np.log(1 + number_of_sentences / (end - start))
+            sentence_ids.append(self.sentence_ids[start:end])
+            weights.append(self.counts[start:end] * idf)
+        totals = np.bincount(np.concatenate(sentence_ids), weights=np.concatenate(weights),
+                             minlength=number_of_sentences)
+        return totals / (self.lengths.astype(np.float64) + PRACTICE_LENGTH_SMOOTHING)
+
+
+# ─── Building ───────────────────────────────────────────────────────────────
+@contextlib.contextmanager
+def file_lock(path: str):
+    """
+    Exclusive lock for read-modify-write of path across processes (every
+    gunicorn worker has its own copy of the tables), held on path + '.lock'.
+    """
+    with open(path + ".lock", "a") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def write_arrays(path: str, header: dict, arrays: dict) -> None:
+    """
+    Write named numpy arrays to path in the index file layout. The data goes
+    to a temporary file of its own that replaces path once complete, so
+    readers and concurrent writers never see a partial file.
+    """
+    header = dict(header, arrays={})
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = [array.dtype.str, offset, int(array.size)]
+        offset += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    prefix_length = 12 + len(header_bytes)
+    padding = -prefix_length % _ALIGNMENT
+
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".",
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(INDEX_MAGIC + struct.pack("<II", INDEX_VERSION, len(header_bytes)))
+            handle.write(header_bytes + b"\0" * padding)
+            for array in arrays.values():
+                data = np.ascontiguousarray(array).tobytes()
+                handle.write(data + b"\0" * (-len(data) % _ALIGNMENT))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def build_corpus_index(language: str, csv_path: str = None, output_path: str = None,
+                       phonem_converter=None) -> str:
+    """Convert every sentence of a corpus once and write its index file."""
+    import RuleBasedModels
+
+    csv_path = csv_path or get_csv_path(language)
+    output_path = output_path or get_index_path(language)
+    phonem_converter = phonem_converter or RuleBasedModels.get_phonem_converter(language)
+
+    source = get_source_header(csv_path)
+    sentences = read_sentences(csv_path)
+    words, words_ipa, sentences_ipa = [], [], []
+    sentence_word_offsets = np.zeros(len(sentences) + 1, dtype=np.int32)
+    for idx, sentence in enumerate(sentences):
+        sentence_words = sentence.split()
+        sentence_words_ipa = phonem_converter.convertToPhonemBatch(sentence_words)
+        words.extend(sentence_words)
+        words_ipa.extend(sentence_words_ipa)
+        sentences_ipa.append(" ".join(sentence_words_ipa))
+        sentence_word_offsets[idx + 1] = len(words)
+
+    inventory = PhonemeInventory.get_phoneme_inventory(language)
+    phoneme_postings = build_postings([inventory.tokenize(ipa) for ipa in sentences_ipa])
+    normalized_words = [get_normalized_words(sentence) for sentence in sentences]
+    word_postings = build_postings(normalized_words)
+    bigram_postings = build_postings([get_word_bigrams(words) for words in normalized_words])
+
+    hashes = np.array([hash_sentence(sentence) for sentence in sentences], dtype=np.uint64)
+    hash_order = np.argsort(hashes, kind="stable").astype(np.int32)
+
+    arrays = {}
+    for name, strings in (("sentence", sentences), ("sentence_ipa", sentences_ipa),
+                          ("word", words), ("word_ipa", words_ipa)):
+        arrays[name + "_blob"], arrays[name + "_offsets"] = pack_strings(strings)
+    arrays["sentence_word_offsets"] = sentence_word_offsets
+    arrays["word_count"] = np.diff(sentence_word_offsets).astype(np.uint16)
+    arrays["category"] = np.array([get_sentence_category(sentence) for sentence in sentences],
+                                  dtype=np.uint8)
+    arrays["sentence_hash"] = hashes[hash_order]
+    arrays["sentence_hash_order"] = hash_order
+    for prefix, postings in (("phoneme_", phoneme_postings), ("word_index_", word_postings),
+                             ("bigram_index_", bigram_postings)):
+        for name, array in postings.items():
+            arrays[prefix + name] = array
+
+    write_arrays(output_path, dict(source, language=language, number_of_sentences=len(sentences)), arrays)
+    return output_path
+
+
+# ─── Loading ────────────────────────────────────────────────────────────────
+class MappedArrays:
+    """Named arrays of an index file, memory-mapped read-only."""
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:4] != INDEX_MAGIC:
+            raise ValueError(f"{path} is not a corpus index file")
+        version, header_length = struct.unpack("<II", self._mmap[4:12])
+        if version != INDEX_VERSION:
+            raise ValueError(f"{path} has index version {version}, expected {INDEX_VERSION}")
+        self.header = json.loads(self._mmap[12:12 + header_length].decode("utf-8"))
+
+        data_start = 12 + header_length
+        data_start += -data_start % _ALIGNMENT
+        self.arrays = {
+            name: np.frombuffer(self._mmap, dtype=np.dtype(dtype), count=size,
+                                offset=data_start + offset)
+            for name, (dtype, offset, size) in self.header["arrays"].items()
+        }
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.arrays[name]
+
+
+class CorpusIndex:
+    """
+    Precomputed words, IPA and categories of one language's corpus.
+
+    Sentence IDs are row numbers of the source CSV. Pages are shared by all
+    worker processes that map the same file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.data = MappedArrays(path)
+        self.header = self.data.header
+        self.language = self.header["language"]
+        self.sentences = self._strings("sentence")
+        self.sentences_ipa = self._strings("sentence_ipa")
+        self.words = self._strings("word")
+        self.words_ipa = self._strings("word_ipa")
+        self.sentence_word_offsets = self.data["sentence_word_offsets"]
+        self.word_count = self.data["word_count"]
+        self.category = self.data["category"]
+        self.phoneme_index = self._invertedIndex("phoneme_")
+        self.word_index = self._invertedIndex("word_index_")
+        self.bigram_index = self._invertedIndex("bigram_index_")
+
+    def _invertedIndex(self, prefix: str) -> InvertedIndex:
+        return InvertedIndex({name[len(prefix):]: array for name, array in self.data.arrays.items()
+                              if name.startswith(prefix)})
+
+    def _strings(self, name: str) -> StringTable:
+        return StringTable(self.data[name + "_blob"], self.data[name + "_offsets"])
+
+    def __len__(self):
+        return len(self.sentences)
+
+    def isFreshFor(self, csv_path: str) -> bool:
+        return is_built_from(self.header, csv_path)
+
+    def getSentence(self, sentence_id: int) -> str:
+        return self.sentences[sentence_id]
+
+    def getSentenceIpa(self, sentence_id: int) -> str:
+        return self.sentences_ipa[sentence_id]
+
+    def getWords(self, sentence_id: int) -> list:
+        return self.words.slice(self.sentence_word_offsets[sentence_id],
+                                self.sentence_word_offsets[sentence_id + 1])
+
+    def getWordsIpa(self, sentence_id: int) -> list:
+        return self.words_ipa.slice(self.sentence_word_offsets[sentence_id],
+                                    self.sentence_word_offsets[sentence_id + 1])
+
+    def findSentence(self, sentence: str) -> int:
+        """ID of a sentence given its exact text (surrounding spaces ignored), or -1."""
+        sentence = sentence.strip()
+        hashes = self.data["sentence_hash"]
+        value = np.uint64(hash_sentence(sentence))
+        position = int(np.searchsorted(hashes, value))
+        while position < len(hashes) and hashes[position] == value:
+            sentence_id = int(self.data["sentence_hash_order"][position])
+            if self.sentences[sentence_id].strip() == sentence:
+                return sentence_id
+            position += 1
+        return -1
+
+    def findPracticeSentences(self, phonemes: list = (), words: list = (), category: int = 0,
+                              k: int = PRACTICE_TOP_K) -> np.ndarray:
+        """
+        IDs of the (at most k) sentences richest in the given phonemes and
+        words, best first. Phonemes may be IPA strings of several phonemes;
+        category 0 allows every category.
+        """
+        inventory = PhonemeInventory.get_phoneme_inventory(self.language)
+        phoneme_terms = [token for ipa in phonemes for token in inventory.tokenize(ipa)]
+        word_terms = [word for text in words for word in get_normalized_words(text)]
+        scores = self.phoneme_index.scores(phoneme_terms) + self.word_index.scores(word_terms)
+        if category:
+            scores[self.category != category] = 0
+        return _top_k(scores, k)
+
+    def identifySentence(self, transcript: str, k: int = OPEN_READING_CANDIDATES):
+        """
+        (sentence ID, word error rate) of the corpus sentence that best
+        explains a transcript of it being read, or (-1, 1.0) if none is
+        close enough.
+        """
+        words = get_normalized_words(transcript)
+        scores = self.word_index.scores(words) + self.bigram_index.scores(get_word_bigrams(words))
+        candidates = _top_k(scores, k)
+        if len(words) == 0 or len(candidates) == 0:
+            return -1, 1.0
+
+        candidate_words = [get_normalized_words(self.sentences[idx]) for idx in candidates]
+        distances = WordMetrics.edit_distance_matrix([words], candidate_words)[0]
+        error_rates = distances / np.maximum([len(words) for words in candidate_words], 1)
+        best = int(np.argmin(error_rates))
+        if error_rates[best] > OPEN_READING_MAX_WER:
+            return -1, 1.0
+        return int(candidates[best]), float(error_rates[best])
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the (at most k) highest positive scores, best first."""
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    return candidates[np.argsort(-scores[candidates], kind="stable")].astype(np.int32)
+
+
+class StringColumns:
+    """Named string columns of a file written by write_string_columns."""
+
+    def __init__(self, path: str) -> None:
+        self.data = MappedArrays(path)
+        self.header = self.data.header
+        self.columns = {name: StringTable(self.data[name + "_blob"], self.data[name + "_offsets"])
+                        for name in self.header["columns"]}
+
+    def __getitem__(self, name: str) -> StringTable:
+        return self.columns[name]
+
+    def __len__(self):
+        return self.header["number_of_rows"]
+
+
+def write_string_columns(path: str, columns: dict, header: dict = None) -> str:
+    lengths = {len(strings) for strings in columns.values()}
+    assert len(lengths) <= 1, "All columns need the same length"
+    arrays = {}
+    for name, strings in columns.items():
+        arrays[name + "_blob"], arrays[name + "_offsets"] = pack_strings(list(strings))
+    write_arrays(path, dict(header or {}, columns=list(columns),
+                            number_of_rows=lengths.pop() if lengths else 0), arrays)
+    return path
+
+
+def convert_sentence_pairs(pickle_path: str = SENTENCE_PAIRS_PICKLE,
+                           output_path: str = SENTENCE_PAIRS_PATH) -> str:
+    """One-off conversion of the pickled de/en DataFrame; the only place pandas is needed."""
+    import pandas as pd
+    table = pd.read_pickle(pickle_path)
+    return write_string_columns(output_path, {
+        str(column): [str(value) for value in table[column]] for column in table.columns
+    })
+
+
+def load_corpus_index(language: str, path: str = None, csv_path: str = None):
+    """The language's CorpusIndex, or None if it was not built or is stale."""
+    path = path or get_index_path(language)
+    csv_path = csv_path or get_csv_path(language)
+    if not os.path.exists(path):
+        print(f"[CorpusIndex] No index for '{language}' - run: python CorpusIndex.py {language}")
+        return None
+    try:
+        index = CorpusIndex(path)
+    except Exception as exc:
+        print(f"[CorpusIndex] Could not load {path}: {exc!r}")
+        return None
+    if not index.isFreshFor(csv_path):
+        print(f"[CorpusIndex] {path} was not built from the current {csv_path} - rebuild it")
+        return None
+    return index
+
+
+if __name__ == "__main__":
+    if "--pairs" in sys.argv:
+        sys.argv.remove("--pairs")
+        print(f"[CorpusIndex] wrote {convert_sentence_pairs()}")
+        if len(sys.argv) == 1:
+            sys.exit(0)
+    for _lang in sys.argv[1:] or AVAILABLE_LANGUAGES:
+        _start = time.time()
+        _path = build_corpus_index(_lang)
+        print(f"[CorpusIndex] {_lang}: wrote {_path} "
+              f"({os.path.getsize(_path) / 1e6:.1f} MB) in {time.time() - _start:.1f}s")
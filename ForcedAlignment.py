@@ -0,0 +1,134 @@
+"""
+CTC forced alignment of a known sentence to a recording.
+
+A CTC acoustic model gives log-probabilities over its labels for every audio
+frame (emissions). When the sentence is known it does not need decoding:
+Viterbi finds the most likely path through its labels (blank, l1, blank, l2,
+..., blank), which gives every word's first and last frame and the posterior
+the model assigns to the word's labels on the frames they are aligned to.
+"""
+
+import numpy as np
+
+# Labels CTC models commonly use between words
+WORD_SEPARATORS = (" ", "|")
+
+
+def tokenize_words(text: str, labels: list) -> list:
+    """
+    (word, label IDs) per whitespace-separated word, by longest match over
+    the lowercased word. Characters without a label (punctuation) are skipped.
+    """
+    label_ids = {label: idx for idx, label in enumerate(labels) if label}
+    longest = max((len(label) for label in label_ids), default=1)
+    words = []
+    for word in text.split():
+        lowered, ids, position = word.lower(), [], 0
+        while position < len(lowered):
+            for length in range(min(longest, len(lowered) - position), 0, -1):
+                label_id = label_ids.get(lowered[position:position + length])
+                if label_id is not None and lowered[position:position + length] not in WORD_SEPARATORS:
+                    ids.append(label_id)
+                    position += length
+                    break
+            else:
+                position += 1
+        words.append((word, ids))
+    return words
+
+
+def ctc_viterbi(log_probs: np.ndarray, targets: list, blank: int = 0) -> np.ndarray:
+    """
+    Most likely CTC path of targets through log_probs (frames, labels): the
+    state per frame in the blank-interleaved sequence, where state 2k + 1 is
+    targets[k] and even states are blanks. Raises ValueError if the
+    recording has too few frames for the targets.
+    """
+    frames = log_probs.shape[0]
+    extended = np.full(2 * len(targets) + 1, blank, dtype=np.int64)
+    extended[1::2] = targets
+    states = len(extended)
+    emissions = log_probs[:, extended]
+
+    # A label may be reached from two states back unless it repeats the previous label
+    can_skip = np.zeros(states, dtype=bool)
+    can_skip[2:] = (extended[2:] != blank) & (extended[2:] != extended[:-2])
+
+    score = np.full(states, -np.inf)
+    score[:2] = emissions[0, :2]
+    backpointers = np.zeros((frames, states), dtype=np.int8)  # states moved forward into each state
+    for frame in range(1, frames):
+        candidates = np.full((3, states), -np.inf)
+        candidates[0] = score
+        candidates[1, 1:] = score[:-1]
+        candidates[2, 2:] = np.where(can_skip[2:], score[:-2], -np.inf)
+        backpointers[frame] = candidates.argmax(axis=0)
+        score = candidates[backpointers[frame], np.arange(states)] + emissions[frame]
+
+    final = states - 1 if states == 1 or score[-1] >= score[-2] else states - 2
+    if not np.isfinite(score[final]):
+        raise ValueError(f"{frames} frames are too few to align {len(targets)} labels")
+
+    path = np.empty(frames, dtype=np.int64)
+    path[-1] = final
+    for frame in range(frames - 1, 0, -1):
+        path[frame - 1] = path[frame] - backpointers[frame, path[frame]]
+    return path
+
+
+def align_words(log_probs: np.ndarray, text: str, labels: list, blank: int = 0,
+                samples_per_frame: float = 1.0) -> list:
+    """
+    {'word', 'start_ts', 'end_ts', 'confidence'} for every word of text, with
+    times in samples and confidence the mean posterior of the word's labels
+    over their aligned frames. Words without any label get an empty span
+    and confidence 0.
+    """
+    words = tokenize_words(text, labels)
+    separator = next((labels.index(label) for label in WORD_SEPARATORS if label in labels), None)
+
+    targets, word_of_target = [], []
+    for word_idx, (_, ids) in enumerate(words):
+        if separator is not None and targets and ids:
+            targets.append(separator)
+            word_of_target.append(-1)
+        targets += ids
+        word_of_target += [word_idx] * len(ids)
+    if not targets:
+        return [{"word": word, "start_ts": 0.0, "end_ts": 0.0, "confidence": 0.0} for word, _ in words]
+
+    path = ctc_viterbi(log_probs, targets, blank)
+
+    # Word of every state: labels and the blanks between labels of the same word
+    word_of_state = np.full(2 * len(targets) + 1, -1)
+    word_of_state[1::2] = word_of_target
+    inner_blanks = np.flatnonzero(word_of_state[1:-2:2] == word_of_state[3::2]) * 2 + 2
+    word_of_state[inner_blanks] = word_of_state[inner_blanks - 1]
+
+    frame_words = word_of_state[path]
+    in_word = frame_words >= 0
+    frames = np.flatnonzero(in_word)
+    first = np.full(len(words), log_probs.shape[0])
+    last = np.full(len(words), -1)
+    np.minimum.at(first, frame_words[in_word], frames)
+    np.maximum.at(last, frame_words[in_word], frames)
+
+    on_label = in_word & (path % 2 == 1)
+    posteriors = np.exp(log_probs[np.flatnonzero(on_label), np.asarray(targets)[path[on_label] // 2]])
+    label_frames = np.bincount(frame_words[on_label], minlength=len(words))
+    confidence = np.bincount(frame_words[on_label], weights=posteriors, minlength=len(words)) \
+        / np.maximum(label_frames, 1)
+
+    alignment, previous_end = [], 0.0
+    for word_idx, (word, _) in enumerate(words):
+        if last[word_idx] < 0:
+            alignment.append({"word": word, "start_ts": previous_end, "end_ts": previous_end, "confidence": 0.0})
+            continue
+        previous_end = float((last[word_idx] + 1) * samples_per_frame)
+        alignment.append({
+            "word":       word,
+            "start_ts":   float(first[word_idx] * samples_per_frame),
+            "end_ts":     previous_end,
+            "confidence": float(confidence[word_idx]),
+        })
+    return alignment
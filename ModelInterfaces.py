@@ -1,6 +1,45 @@
 
 import abc
+import time
 import numpy as np
+from typing import NamedTuple
+
+
+class WordLocation(NamedTuple):
+    """A transcribed word and its start and end in samples"""
+    word: str
+    start_ts: float
+    end_ts: float
+
+
+class PhonemeLocation(NamedTuple):
+    """A recognized phoneme (IPA) and its start and end in samples"""
+    phoneme: str
+    start_ts: float
+    end_ts: float
+
+
+class ASRResult(NamedTuple):
+    """Immutable result of one transcription"""
+    transcript: str
+    word_locations: tuple  # of WordLocation
+    processing_time_s: float = 0.0
+    # Set by phoneme-recognition models, which output IPA instead of text
+    ipa: str = None
+    phoneme_locations: tuple = ()  # of PhonemeLocation
+    # Decoder tokens of models that can time the words later (see IASRModel.alignWords)
+    tokens: tuple = ()
+    # Set by reference-guided decoding (see IASRModel.transcribeWithReference):
+    # the log-probability of every decoded text token, and the positions of
+    # those the model chose over the reference
+    token_log_probs: tuple = ()
+    disagreement_positions: tuple = ()
+
+    @classmethod
+    def fromWordDicts(cls, transcript: str, word_locations: list, processing_time_s: float = 0.0):
+        """Result from word locations given as {'word', 'start_ts', 'end_ts'} dicts"""
+        return cls(transcript, tuple(WordLocation(location["word"], location["start_ts"], location["end_ts"])
+                                     for location in word_locations), processing_time_s)
 
 
 class IASRModel(metaclass=abc.ABCMeta):
@@ -28,6 +67,35 @@ class IASRModel(metaclass=abc.ABCMeta):
         """Process the audio"""
         raise NotImplementedError
 
+    def transcribe(self, audio, word_timestamps: bool = True) -> ASRResult:
+        """
+        Process the audio and return its result. Models may leave out the word
+        locations when word_timestamps is False and they cost extra time.
+        This default reads the result back through getTranscript and
+        getWordLocations, so it is only safe for concurrent use in models
+        that override it without shared state
+        """
+        start = time.perf_counter()
+        self.processAudio(audio)
+        return ASRResult.fromWordDicts(self.getTranscript(), self.getWordLocations(),
+                                       time.perf_counter() - start)
+
+    def transcribeWithReference(self, audio, reference_text: str, word_timestamps: bool = True) -> ASRResult:
+        """
+        Transcribe a recording of reference_text. Models that can use the
+        expected text to decode faster override this; the transcript must be
+        the one transcribe() gives
+        """
+        return self.transcribe(audio, word_timestamps=word_timestamps)
+
+    def alignWords(self, audio, tokens: tuple = ()) -> tuple:
+        """
+        Word locations of audio transcribed with word_timestamps=False, from
+        the tokens of its ASRResult. Models that can time already decoded
+        tokens override this; the default transcribes the audio again
+        """
+        return self.transcribe(audio).word_locations
+
 
 class ITranslationModel(metaclass=abc.ABCMeta):
     @classmethod
@@ -40,6 +108,10 @@ class ITranslationModel(metaclass=abc.ABCMeta):
         """Get the translation of the sentence"""
         raise NotImplementedError
 
+    def translateSentences(self, sentences: list) -> list:
+        """Translate each sentence"""
+        return [self.translateSentence(sentence) for sentence in sentences]
+
 
 class ITextToSpeechModel(metaclass=abc.ABCMeta):
     @classmethod
@@ -63,3 +135,7 @@ class ITextToPhonemModel(metaclass=abc.ABCMeta):
     def convertToPhonem(self, str) -> str:
         """Convert sentence to phonemes"""
         raise NotImplementedError
+
+    def convertToPhonemBatch(self, words: list) -> list:
+        """Convert each word to phonemes"""
+        return [self.convertToPhonem(word) for word in words]
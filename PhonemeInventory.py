@@ -0,0 +1,176 @@
+import re
+import threading
+import unicodedata
+import numpy as np
+from string import punctuation
+from typing import List
+
+try:
+    import panphon
+except ImportError:  # comes with epitran; without it every substitution costs 1
+    panphon = None
+
+# Substituting two phonemes costs MIN_SUBSTITUTION_COST plus
+# FEATURE_DISTANCE_WEIGHT times the fraction of articulatory features
+# (panphon) they differ in, capped at 1. p/b or i/ɪ cost about 0.43,
+# unrelated phonemes cost the full 1, as insertions and deletions do.
+MIN_SUBSTITUTION_COST = 0.35
+FEATURE_DISTANCE_WEIGHT = 2.0
+
+IGNORED_SYMBOLS = set(punctuation) | {'ˈ', 'ˌ', '।', '॥', '‿'}
+TIE_BARS = {'͡', '͜'}
+# Spellings panphon does not know, mapped to the ones it does
+FEATURE_ALIASES = {'g': 'ɡ', 'ʧ': 't͡ʃ', 'ʤ': 'd͡ʒ', 'ʦ': 't͡s'}
+
+LANGUAGE_SYMBOLS = {
+    'en': ['p', 'b', 't', 'd', 'k', 'g', 'f', 'v', 'θ', 'ð', 's', 'z', 'ʃ', 'ʒ',
+           'h', 'ʧ', 'ʤ', 'm', 'n', 'ŋ', 'l', 'r', 'w', 'j',
+           'i', 'ɪ', 'ɛ', 'æ', 'ɑ', 'ɔ', 'ʊ', 'u', 'ə', 'eɪ', 'aɪ', 'aʊ', 'oʊ', 'ɔɪ'],
+    'hi': ['p', 'pʰ', 'b', 'b̤', 't', 'tʰ', 'd', 'd̤', 'ʈ', 'ʈʰ', 'ɖ', 'ɖ̤',
+           'k', 'kʰ', 'ɡ', 'ɡ̤', 't͡ʃ', 't͡ʃʰ', 'd͡ʒ', 'd͡ʒ̤', 'm', 'n', 'ɳ', 'ŋ', 'ɲ',
+           's', 'ʃ', 'ʂ', 'ɦ', 'f', 'z', 'r', 'ɽ', 'ɽ̥', 'l', 'ʋ', 'j',
+           'ə', 'aː', 'ɪ', 'iː', 'ʊ', 'uː', 'eː', 'æː', 'oː', 'ɔː'],
+    'mr': ['p', 'pʰ', 'b', 'b̤', 't', 'tʰ', 'd', 'd̤', 'ʈ', 'ʈʰ', 'ɖ', 'ɖ̤',
+           'k', 'kʰ', 'ɡ', 'ɡ̤', 't͡ɕ', 't͡ɕʰ', 'd͡ʑ', 'd͡ʑ̤', 't͡s', 'd͡z', 'm', 'n', 'ɳ',
+           'ŋ', 'ɲ', 's', 'ʃ', 'ʂ', 'ɦ', 'r', 'l', 'ɭ', 'ʋ', 'j',
+           'ə', 'aː', 'i', 'iː', 'u', 'uː', 'e', 'o', 'əi', 'əu'],
+}
+# Phonemes written as several letters without a tie bar
+LANGUAGE_MULTI_LETTER_UNITS = {
+    'en': ['eɪ', 'aɪ', 'aʊ', 'oʊ', 'ɔɪ'],
+}
+
+# The phoneme recognizer (phoneme_ctc.py, trained on espeak-ng IPA) spells
+# some phonemes differently from the language's text-to-IPA converter:
+# espeak writes length marks (iː), ɹ, r-coloured vowels (ɚ, ɜː), reduced
+# vowels (ɐ, ᵻ) and flaps (ɾ) where eng_to_ipa writes i, r, ər, ə, ɪ and t.
+# Recognized IPA is respelled with these (longest match first) before it is
+# compared with the reference, so a correct reading is not a mismatch.
+LANGUAGE_RECOGNIZER_SPELLINGS = {
+    'en': {'ɜːɹ': 'ər', 'ɜː': 'ər', 'ɜ': 'ər', 'ɝ': 'ər', 'ɚ': 'ər', 'ɐ': 'ə', 'ʌ': 'ə', 'ᵻ': 'ɪ',
+           'ɹ': 'r', 'ɾ': 't', 'ʔ': 't', 'ɡ': 'g', 'tʃ': 'ʧ', 'dʒ': 'ʤ', 'l̩': 'əl', 'n̩': 'ən',
+           'əʊ': 'oʊ', 'ɒ': 'ɑ', 'eə': 'ɛr', 'ɪə': 'ɪr', 'ʊə': 'ʊr', 'oː': 'ɔ', 'ː': ''},
+}
+
+_feature_table = None
+
+
+def _get_feature_vector(symbol: str):
+    global _feature_table
+    if panphon is None:
+        return None
+    if _feature_table is None:
+        _feature_table = panphon.FeatureTable()
+    segments = _feature_table.word_to_vector_list(
+        ''.join(FEATURE_ALIASES.get(ch, ch) for ch in symbol), numeric=True)
+    if len(segments) == 0:
+        return None
+    return np.mean(np.array(segments, dtype=np.float32), axis=0)
+
+
+class PhonemeInventory:
+    """
+    Per-language table of phonemes with integer IDs and substitution costs.
+
+    IPA strings are split into phonemes once (diacritics, length marks and
+    tie-barred affricates stay with their base letter; stress marks and
+    punctuation are dropped) and encoded as int32 arrays. Phonemes that are
+    not in the seed list get a new ID on first sight, and the cost matrix is
+    extended the next time it is requested.
+    """
+
+    def __init__(self, language: str, symbols: list = (), multi_letter_units: list = (),
+                 recognizer_spellings: dict = None) -> None:
+        self.language = language
+        self.recognizer_spellings = recognizer_spellings or {}
+        self._respelled = re.compile('|'.join(
+            re.escape(spelling) for spelling in sorted(self.recognizer_spellings, key=len, reverse=True)))
+        self.symbols: List[str] = []
+        self._ids: dict = {}
+        self._features: list = []
+        self._units = sorted(multi_letter_units, key=len, reverse=True)
+        self._costs = np.zeros((0, 0), dtype=np.float32)
+        self._lock = threading.Lock()
+        for symbol in symbols:
+            self._getId(symbol)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def tokenize(self, ipa: str) -> List[str]:
+        tokens = []
+        join_next = False
+        idx = 0
+        while idx < len(ipa):
+            char = ipa[idx]
+            if char.isspace() or char in IGNORED_SYMBOLS:
+                join_next = False
+                idx += 1
+                continue
+            if join_next or unicodedata.combining(char) or unicodedata.category(char) == 'Lm':
+                if tokens:
+                    tokens[-1] += char
+                join_next = char in TIE_BARS
+                idx += 1
+                continue
+            unit = next((unit for unit in self._units if ipa.startswith(unit, idx)), char)
+            tokens.append(unit)
+            idx += len(unit)
+        return tokens
+
+    def respellRecognized(self, ipa: str) -> str:
+        """Recognizer IPA in the converter's spelling (see LANGUAGE_RECOGNIZER_SPELLINGS)."""
+        if not self.recognizer_spellings:
+            return ipa
+        return self._respelled.sub(lambda match: self.recognizer_spellings[match.group(0)], ipa)
+
+    def encode(self, ipa: str) -> np.ndarray:
+        return np.array([self._getId(token) for token in self.tokenize(ipa)], dtype=np.int32)
+
+    def substitutionCosts(self) -> np.ndarray:
+        """Cost matrix indexed by phoneme ID, covering every ID handed out so far."""
+        with self._lock:
+            if self._costs.shape[0] != len(self.symbols):
+                self._costs = self._buildCosts()
+            return self._costs
+
+    def _getId(self, symbol: str) -> int:
+        phoneme_id = self._ids.get(symbol)
+        if phoneme_id is None:
+            with self._lock:
+                phoneme_id = self._ids.get(symbol)
+                if phoneme_id is None:
+                    phoneme_id = len(self.symbols)
+                    self.symbols.append(symbol)
+                    self._ids[symbol] = phoneme_id
+        return phoneme_id
+
+    def _buildCosts(self) -> np.ndarray:
+        number_of_symbols = len(self.symbols)
+        for symbol in self.symbols[len(self._features):]:
+            self._features.append(_get_feature_vector(symbol))
+        known = np.array([vector is not None for vector in self._features], dtype=bool)
+        costs = np.ones((number_of_symbols, number_of_symbols), dtype=np.float32)
+        if known.any():
+            features = np.stack([vector for vector in self._features if vector is not None])
+            # Features are -1/0/+1, so |a - b| / 2 is the per-feature mismatch
+            distance = np.abs(features[:, None, :] - features[None, :, :]).mean(axis=-1) / 2
+            costs[np.ix_(known, known)] = np.minimum(
+                1.0, MIN_SUBSTITUTION_COST + FEATURE_DISTANCE_WEIGHT * distance)
+        np.fill_diagonal(costs, 0.0)
+        return costs
+
+
+_inventories: dict = {}
+_inventories_lock = threading.Lock()
+
+
+def get_phoneme_inventory(language: str) -> PhonemeInventory:
+    """Process-wide inventory for a language, created on first use."""
+    with _inventories_lock:
+        if language not in _inventories:
+            _inventories[language] = PhonemeInventory(
+                language, LANGUAGE_SYMBOLS.get(language, []),
+                LANGUAGE_MULTI_LETTER_UNITS.get(language, []),
+                LANGUAGE_RECOGNIZER_SPELLINGS.get(language))
+        return _inventories[language]
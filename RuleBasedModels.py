@@ -1,14 +1,86 @@
 import ModelInterfaces
-import torch
 import numpy as np
 import epitran
 import eng_to_ipa
+import eng_to_ipa.transcribe
+import bisect
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# Word-final schwa that Epitran writes but Hindi/Marathi speakers drop
+FINAL_SCHWA_PATTERN = re.compile(r'ə(?=\s|$)')
+
+# Optional on-disk tier of the phoneme cache, kept across restarts
+PHONEM_CACHE_PATH = os.environ.get('PHONEM_CACHE_PATH')
+PHONEM_CACHE_SIZE = 50_000
+
+
+# ─── Process-wide registries ────────────────────────────────────────────────
+# One converter per language and one Epitran per language code, created on
+# first use and shared by sampling, scoring and the corpus index builder.
+_phonem_converters: dict = {}
+_phonem_converter_stats: dict = {}
+_language_locks: dict = {}
+_epitran_models: dict = {}
+_registry_lock = threading.Lock()
+
+
+def _get_rss_bytes() -> int:
+    """Resident set size of this process, 0 where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as handle:
+            return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def get_epitran(code: str) -> epitran.Epitran:
+    """Shared Epitran instance for a language-script code such as 'hin-Deva'."""
+    with _registry_lock:
+        lock = _language_locks.setdefault('epitran:' + code, threading.Lock())
+    with lock:
+        if code not in _epitran_models:
+            _epitran_models[code] = epitran.Epitran(code)
+        return _epitran_models[code]
 
 
 def get_phonem_converter(language: str):
+    """The language's shared (cached) converter, loaded on first use."""
+    converter = _phonem_converters.get(language)
+    if converter is not None:
+        return converter
+    with _registry_lock:
+        lock = _language_locks.setdefault(language, threading.Lock())
+    with lock:
+        if language not in _phonem_converters:
+            start, rss_before = time.time(), _get_rss_bytes()
+            _phonem_converters[language] = CachedPhonemConverter(
+                _get_uncached_phonem_converter(language), language,
+                case_sensitive=(language != 'en'), cache_path=PHONEM_CACHE_PATH)
+            _phonem_converter_stats[language] = {
+                'load_time_s': time.time() - start,
+                'rss_delta_mb': (_get_rss_bytes() - rss_before) / 2 ** 20,
+            }
+            print(f"[RuleBasedModels] Loaded '{language}' phoneme converter in "
+                  f"{_phonem_converter_stats[language]['load_time_s']:.2f}s "
+                  f"(+{_phonem_converter_stats[language]['rss_delta_mb']:.1f} MB RSS)")
+        return _phonem_converters[language]
+
+
+def get_phonem_converter_stats() -> dict:
+    """Load time, RSS growth while loading, and cache statistics per loaded language."""
+    return {language: dict(_phonem_converter_stats[language], **converter.getStats())
+            for language, converter in list(_phonem_converters.items())}
+
+
+def _get_uncached_phonem_converter(language: str):
     if language == 'de':
-        phonem_converter = EpitranPhonemConverter(
-            epitran.Epitran('deu-Latn'))
+        phonem_converter = EpitranPhonemConverter(get_epitran('deu-Latn'))
     elif language == 'en':
         phonem_converter = EngPhonemConverter()
     elif language == 'hi':
@@ -43,7 +115,7 @@ class HindiIPA(ModelInterfaces.ITextToPhonemModel):
 
     def __init__(self):
         super().__init__()
-        self.epitran_model = epitran.Epitran('hin-Deva')
+        self.epitran_model = get_epitran('hin-Deva')
 
     def convertToPhonem(self, text: str) -> str:
         if not text or text == '-':
@@ -54,9 +126,7 @@ class HindiIPA(ModelInterfaces.ITextToPhonemModel):
 
     def _fix_schwa_deletion(self, ipa: str) -> str:
         """Remove word-final schwa (ə) that Epitran adds but Hindi speakers drop."""
-        import re
-        ipa = re.sub(r'ə(?=\s|$)', '', ipa)
-        return ipa
+        return FINAL_SCHWA_PATTERN.sub('', ipa)
 
 class MarathiIPA(ModelInterfaces.ITextToPhonemModel):
     """
@@ -69,7 +139,7 @@ class MarathiIPA(ModelInterfaces.ITextToPhonemModel):
 
     def __init__(self):
         super().__init__()
-        self.epitran_model = epitran.Epitran('mar-Deva')
+        self.epitran_model = get_epitran('mar-Deva')
 
     def convertToPhonem(self, text: str) -> str:
         if not text or text == '-':
@@ -80,16 +150,189 @@ class MarathiIPA(ModelInterfaces.ITextToPhonemModel):
 
     def _fix_schwa_deletion(self, ipa: str) -> str:
         """Remove word-final schwa (ə) that Epitran adds but Marathi speakers drop."""
-        import re
-        ipa = re.sub(r'ə(?=\s|$)', '', ipa)
-        return ipa
+        return FINAL_SCHWA_PATTERN.sub('', ipa)
+
+class EnglishLexicon:
+    """
+    eng_to_ipa's CMU dictionary, loaded once into memory.
+
+    eng_to_ipa.convert opens its SQLite database and queries it on every
+    call. Here the whole table is read once into two parallel sorted tuples
+    (words, CMU pronunciation variants) and searched with bisect.
+    """
+
+    def __init__(self, database_path: str = None) -> None:
+        if database_path is None:
+            database_path = os.path.join(os.path.dirname(eng_to_ipa.transcribe.__file__),
+                                         'resources', 'CMU_dict.db')
+        connection = sqlite3.connect(database_path)
+        try:
+            rows = connection.execute(
+                'SELECT word, phonemes FROM dictionary ORDER BY word, id').fetchall()
+        finally:
+            connection.close()
+
+        words, pronunciations = [], []
+        for word, phonemes in rows:
+            if words and words[-1] == word:
+                pronunciations[-1].append(phonemes)
+            else:
+                words.append(word)
+                pronunciations.append([phonemes])
+        self.words = tuple(words)
+        self.pronunciations = tuple(tuple(variants) for variants in pronunciations)
+
+    def __len__(self):
+        return len(self.words)
+
+    def lookup(self, word: str) -> tuple:
+        """CMU pronunciations of a lower-case word, empty if it is unknown."""
+        idx = bisect.bisect_left(self.words, word)
+        if idx < len(self.words) and self.words[idx] == word:
+            return self.pronunciations[idx]
+        return ()
+
+
+_english_lexicon = None
+_english_lexicon_lock = threading.Lock()
+
+
+def get_english_lexicon() -> EnglishLexicon:
+    global _english_lexicon
+    with _english_lexicon_lock:
+        if _english_lexicon is None:
+            _english_lexicon = EnglishLexicon()
+        return _english_lexicon
+
 
 class EngPhonemConverter(ModelInterfaces.ITextToPhonemModel):
+    """
+    English to IPA with the same output as eng_to_ipa.convert (minus the '*'
+    marking unknown words), resolved against the in-memory EnglishLexicon.
+    """
 
-    def __init__(self,) -> None:
+    def __init__(self, lexicon: EnglishLexicon = None) -> None:
         super().__init__()
+        self.lexicon = lexicon or get_english_lexicon()
 
     def convertToPhonem(self, sentence: str) -> str:
-        phonem_representation = eng_to_ipa.convert(sentence)
-        phonem_representation = phonem_representation.replace('*','')
-        return phonem_representation
\ No newline at end of file
+        return ' '.join(self.convertToPhonemBatch(sentence.split()))
+
+    def convertToPhonemBatch(self, words: list) -> list:
+        # Same steps as eng_to_ipa.ipa_list + get_top, with the lexicon
+        # standing in for the per-call database query
+        punctuated_words = [(eng_to_ipa.transcribe.preserve_punc(word.lower()) or [['', '', '']])[0]
+                            for word in words]
+        cmu = [list(self.lexicon.lookup(word[1])) or ['__IGNORE__' + word[1]]
+               for word in punctuated_words]
+        ipa = eng_to_ipa.transcribe.cmu_to_ipa(cmu, stress_marking='both')
+        # Punctuation goes back around the chosen variant, as eng_to_ipa's apply_punct does
+        return [(before + variants[-1] + after).replace('*', '')
+                for (before, _, after), variants in zip(punctuated_words, ipa)]
+
+
+class CachedPhonemConverter(ModelInterfaces.ITextToPhonemModel):
+    """
+    Memoizing wrapper around any ITextToPhonemModel.
+
+    Sentences are split on whitespace and converted word by word, so every
+    conversion - single words during matching, whole transcripts and
+    reference sentences - goes through one bounded LRU keyed by
+    (language, normalized word). With cache_path set, words are also kept in
+    a SQLite file that is consulted on memory misses and survives restarts.
+    All converters here transcribe words independently, so composing the
+    sentence from its words gives the same result as converting it whole.
+    """
+
+    def __init__(self, converter: ModelInterfaces.ITextToPhonemModel, language: str,
+                 max_size: int = PHONEM_CACHE_SIZE, case_sensitive: bool = True,
+                 cache_path: str = None) -> None:
+        super().__init__()
+        self.converter = converter
+        self.language = language
+        self.max_size = max_size
+        self.case_sensitive = case_sensitive
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._database = None
+        if cache_path:
+            self._database = sqlite3.connect(cache_path, check_same_thread=False)
+            self._database.execute(
+                'CREATE TABLE IF NOT EXISTS phonems (language TEXT, word TEXT, ipa TEXT, '
+                'PRIMARY KEY (language, word))')
+            self._database.commit()
+
+    def normalizeWord(self, word: str) -> str:
+        word = unicodedata.normalize('NFC', word)
+        return word if self.case_sensitive else word.lower()
+
+    def convertToPhonem(self, sentence: str) -> str:
+        return ' '.join(self.convertToPhonemBatch(sentence.split()))
+
+    def convertWord(self, word: str) -> str:
+        return self.convertToPhonemBatch([word])[0]
+
+    def convertToPhonemBatch(self, words: list) -> list:
+        keys = [(self.language, self.normalizeWord(word)) for word in words]
+        results = [None] * len(keys)
+        with self._lock:
+            for idx, key in enumerate(keys):
+                ipa = self._cache.get(key)
+                if ipa is not None:
+                    self._cache.move_to_end(key)
+                    results[idx] = ipa
+            hits = sum(ipa is not None for ipa in results)
+            self.hits += hits
+            self.misses += len(keys) - hits
+
+        missing = [idx for idx, ipa in enumerate(results) if ipa is None]
+        for idx in missing:
+            results[idx] = self._readFromDisk(keys[idx])
+        to_convert = [idx for idx in missing if results[idx] is None]
+        if to_convert:
+            # One call for all unknown words, so converters with a real batch
+            # path (EngPhonemConverter) resolve them together
+            converted = self.converter.convertToPhonemBatch(
+                [keys[idx][1] for idx in to_convert])
+            for idx, ipa in zip(to_convert, converted):
+                results[idx] = ipa
+            self._writeToDisk([keys[idx] + (results[idx],) for idx in to_convert])
+        for idx in missing:
+            self._store(keys[idx], results[idx])
+        return results
+
+    def getStats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'language': self.language,
+                'size': len(self._cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def _store(self, key, ipa: str) -> None:
+        with self._lock:
+            self._cache[key] = ipa
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def _readFromDisk(self, key):
+        if self._database is None:
+            return None
+        with self._lock:
+            row = self._database.execute(
+                'SELECT ipa FROM phonems WHERE language = ? AND word = ?', key).fetchone()
+        return row[0] if row else None
+
+    def _writeToDisk(self, rows: list) -> None:
+        if self._database is None:
+            return
+        with self._lock:
+            self._database.executemany(
+                'INSERT OR REPLACE INTO phonems (language, word, ipa) VALUES (?, ?, ?)', rows)
+            self._database.commit()
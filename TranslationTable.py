@@ -0,0 +1,208 @@
+"""
+Translations of the corpus sentences, keyed by sentence ID.
+
+databases/translations_<language>.idx holds one translation per row of
+databases/data_<language>.csv (empty where none is known yet), in the
+CorpusIndex file layout. The English table is seeded from the German/English
+sentence pairs (databases/pairs_de_en.idx, see CorpusIndex.py --pairs).
+Sentences without a translation are queued and translated in batches by a
+background thread; the results are written back to the table file, so
+sampling never waits for the translation model.
+
+Every worker process holds its own table. Writes take a file lock and merge
+the translations already on disk, so workers adding translations at the same
+time do not overwrite each other's.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+import CorpusIndex
+
+TRANSLATION_BATCH_SIZE = 16
+TRANSLATION_BATCH_WAIT_S = 0.5
+# New translations are written back at most this often (and when the queue is idle)
+TRANSLATION_FLUSH_INTERVAL_S = 30.0
+
+# Language of the seed pairs column each corpus is translated into
+PAIR_COLUMNS = {"en": ("en_sentence", "de_sentence")}
+
+
+def get_translation_path(language: str) -> str:
+    return os.path.join(CorpusIndex.SAMPLE_FOLDER, "translations_" + language + ".idx")
+
+
+def get_seed_translations(language: str, sentences: list) -> list:
+    """Translations of sentences found in the shipped sentence pairs, '' elsewhere."""
+    if language not in PAIR_COLUMNS or not os.path.exists(CorpusIndex.SENTENCE_PAIRS_PATH):
+        return [""] * len(sentences)
+    source_column, target_column = PAIR_COLUMNS[language]
+    pairs = CorpusIndex.StringColumns(CorpusIndex.SENTENCE_PAIRS_PATH)
+    lookup = {pairs[source_column][idx].strip(): pairs[target_column][idx] for idx in range(len(pairs))}
+    return [lookup.get(sentence.strip(), "") for sentence in sentences]
+
+
+class TranslationTable:
+    """
+    Memory-mapped translations of one corpus plus the ones added since it
+    was written. flush() merges them into the file.
+    """
+
+    def __init__(self, language: str, path: str = None, csv_path: str = None) -> None:
+        self.language = language
+        self.path = path or get_translation_path(language)
+        self.csv_path = csv_path or CorpusIndex.get_csv_path(language)
+        self._added = {}
+        self._lock = threading.Lock()
+        if not self._isFresh():
+            with CorpusIndex.file_lock(self.path):
+                # Another worker may have built it while we waited
+                if not self._isFresh():
+                    self._build()
+        self._open()
+
+    def _open(self) -> None:
+        self.columns = CorpusIndex.StringColumns(self.path)
+        self.translations = self.columns["translation"]
+
+    def __len__(self):
+        return len(self.translations)
+
+    def get(self, sentence_id: int) -> str:
+        """Translation of a sentence, or '' if it is not known yet."""
+        translation = self._added.get(sentence_id)
+        if translation is None and 0 <= sentence_id < len(self.translations):
+            translation = self.translations[sentence_id]
+        return translation or ""
+
+    def hasUnwritten(self) -> bool:
+        return bool(self._added)
+
+    def update(self, translations: dict) -> None:
+        with self._lock:
+            self._added.update(translations)
+
+    def flush(self) -> None:
+        """Write the added translations, merged with what other processes wrote meanwhile."""
+        with self._lock:
+            if not self._added:
+                return
+            with CorpusIndex.file_lock(self.path):
+                on_disk = CorpusIndex.StringColumns(self.path)["translation"] if self._isFresh() \
+                    else self.translations
+                translations = [self._added.get(idx) or on_disk[idx] for idx in range(len(on_disk))]
+                self._write(translations)
+                self._open()
+            self._added = {}
+
+    def _isFresh(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        try:
+            header = CorpusIndex.MappedArrays(self.path).header
+        except ValueError:
+            return False
+        return CorpusIndex.is_built_from(header, self.csv_path)
+
+    def _build(self) -> None:
+        print(f"[TranslationTable] Building {self.path}")
+        self._write(get_seed_translations(self.language, CorpusIndex.read_sentences(self.csv_path)))
+
+    def _write(self, translations: list) -> None:
+        CorpusIndex.write_string_columns(self.path, {"translation": translations},
+                                         dict(CorpusIndex.get_source_header(self.csv_path), language=self.language))
+
+
+class TranslationQueue:
+    """
+    Background thread translating queued sentences in batches of up to
+    TRANSLATION_BATCH_SIZE and adding them to a TranslationTable. The table
+    is written back flush_interval seconds after the previous write if it
+    has new translations (whether or not more are queued), and at exit. The
+    translator is created by translator_factory on the first batch; if that
+    fails the queue disables itself.
+    """
+
+    def __init__(self, table: TranslationTable, translator_factory,
+                 batch_size: int = TRANSLATION_BATCH_SIZE,
+                 batch_wait: float = TRANSLATION_BATCH_WAIT_S,
+                 flush_interval: float = TRANSLATION_FLUSH_INTERVAL_S) -> None:
+        self.table = table
+        self.translator_factory = translator_factory
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.translator = None
+        self.enabled = True
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_flush = time.monotonic()
+
+    def request(self, sentence_id: int, sentence: str) -> None:
+        with self._lock:
+            if not self.enabled or sentence_id in self._pending:
+                return
+            self._pending.add(sentence_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True,
+                                                name=f"translations-{self.table.language}")
+                self._thread.start()
+                atexit.register(self.table.flush)
+        self._queue.put((sentence_id, sentence))
+
+    def join(self) -> None:
+        """Wait until every queued sentence has been handled and written back."""
+        self._queue.join()
+        self.table.flush()
+
+    def _nextBatch(self) -> list:
+        """Next batch of queued sentences; empty if the table should be flushed first."""
+        timeout = None
+        if self.table.hasUnwritten():
+            timeout = max(self._last_flush + self.flush_interval - time.monotonic(), 0.0)
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=self.batch_wait))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self) -> None:
+        try:
+            self.table.flush()
+        except OSError as exc:
+            print(f"[TranslationTable] Writing {self.table.path} failed: {exc!r}")
+        self._last_flush = time.monotonic()
+
+    def _run(self) -> None:
+        while True:
+            batch = self._nextBatch()
+            if not batch:
+                self._flush()
+                continue
+            try:
+                if self.translator is None:
+                    self.translator = self.translator_factory()
+                translations = self.translator.translateSentences([sentence for _, sentence in batch])
+                self.table.update({sentence_id: translation
+                                   for (sentence_id, _), translation in zip(batch, translations)})
+                if time.monotonic() - self._last_flush >= self.flush_interval:
+                    self._flush()
+            except Exception as exc:
+                print(f"[TranslationTable] Translating '{self.table.language}' failed, "
+                      f"disabling the queue: {exc!r}")
+                with self._lock:
+                    self.enabled = False
+            finally:
+                with self._lock:
+                    self._pending.difference_update(sentence_id for sentence_id, _ in batch)
+                for _ in batch:
+                    self._queue.task_done()
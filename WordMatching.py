@@ -1,13 +1,29 @@
 import WordMetrics
 import numpy as np
 from string import punctuation
-from dtwalign import dtw_from_distance_matrix
-import time
+from collections import Counter, defaultdict
 from typing import List, Tuple
-#from ortools.sat.python import cp_model
 
 offset_blank = 1
-TIME_THRESHOLD_MAPPING = 5.0
+WORD_NOT_FOUND_TOKEN = '-'
+# A word pair needing more edits than this fraction of the real word's length
+# is treated as "no match", whatever the exact distance
+MAX_WORD_EDIT_RATIO = 0.5
+
+
+def get_word_distance_threshold(words_real: list) -> np.ndarray:
+    return np.array([max(1, int(np.ceil(MAX_WORD_EDIT_RATIO*len(word))))
+                     for word in words_real], dtype=np.int32)
+
+
+def get_saturated_distances(words_estimated: list, words_real: list) -> np.ndarray:
+    """Edit distances, with pairs beyond the threshold set to max(len) ("no match")."""
+    max_k = get_word_distance_threshold(words_real)
+    distances = WordMetrics.edit_distance_matrix(
+        words_estimated, words_real, max_k=max_k[None, :])
+    upper_bound = np.maximum.outer([len(word) for word in words_estimated],
+                                   [len(word) for word in words_real])
+    return np.where(distances > max_k[None, :], upper_bound, distances).astype(float)
 
 
 def get_word_distance_matrix(words_estimated: list, words_real: list) -> np.ndarray:
@@ -16,158 +32,227 @@ def get_word_distance_matrix(words_estimated: list, words_real: list) -> np.ndar
 
     word_distance_matrix = np.zeros(
         (number_of_estimated_words+offset_blank, number_of_real_words))
-    for idx_estimated in range(number_of_estimated_words):
-        for idx_real in range(number_of_real_words):
-            word_distance_matrix[idx_estimated, idx_real] = WordMetrics.edit_distance_python(
-                words_estimated[idx_estimated], words_real[idx_real])
+    word_distance_matrix[:number_of_estimated_words, :] = get_saturated_distances(
+        words_estimated, words_real)
 
     if offset_blank == 1:
-        for idx_real in range(number_of_real_words):
-            word_distance_matrix[number_of_estimated_words,
-                                 idx_real] = len(words_real[idx_real])
+        word_distance_matrix[number_of_estimated_words, :] = [
+            len(word_real) for word_real in words_real]
     return word_distance_matrix
 
 
-def get_best_path_from_distance_matrix(word_distance_matrix):
-    modelCpp = cp_model.CpModel()
-
-    number_of_real_words = word_distance_matrix.shape[1]
-    number_of_estimated_words = word_distance_matrix.shape[0]-1
-
-    number_words = np.maximum(number_of_real_words, number_of_estimated_words)
-
-    estimated_words_order = [modelCpp.NewIntVar(0, int(
-        number_words - 1 + offset_blank), 'w%i' % i) for i in range(number_words+offset_blank)]
-
-    # They are in ascending order
-    for word_idx in range(number_words-1):
-        modelCpp.Add(
-            estimated_words_order[word_idx+1] >= estimated_words_order[word_idx])
+# Monotone word alignment
+# -----------------------
+# Needleman-Wunsch over estimated words (rows) and real words (columns).
+# Moves, with their costs:
+#   substitute   est[i]          -> real[j]            edit distance
+#   merge 2:1    est[i] + est[i+1] -> real[j]          edit distance
+#   merge 1:2    est[i]          -> real[j] + real[j+1]  edit distance
+#   delete       nothing         -> real[j]            len(real[j])
+#   insert       est[i]          -> nothing            0
+# Extra estimated words are free, as in the original CP-SAT objective: only
+# real words left without a match are penalised. Each row is filled with
+# numpy; deletions inside a row are resolved with a running minimum over the
+# prefix sums of the deletion costs. All costs are integers, so the backtrace
+# can recover the moves by exact comparison, preferring them in the order
+# above on ties.
+
+def _concatenate_neighbours(words: list) -> list:
+    return [words[idx] + words[idx+1] for idx in range(len(words) - 1)]
+
+
+def _get_alignment_cost_matrix(substitution, deletion, merge_estimated, merge_real):
+    number_of_estimated_words, number_of_real_words = substitution.shape
+    deletion_prefix = np.concatenate(([0.0], np.cumsum(deletion)))
+    cost = np.empty((number_of_estimated_words + 1, number_of_real_words + 1))
+    cost[0] = deletion_prefix
+    for i in range(1, number_of_estimated_words + 1):
+        row = cost[i-1].copy()
+        row[1:] = np.minimum(row[1:], cost[i-1, :-1] + substitution[i-1])
+        if merge_estimated is not None and i >= 2:
+            row[1:] = np.minimum(row[1:], cost[i-2, :-1] + merge_estimated[i-2])
+        if merge_real is not None and number_of_real_words >= 2:
+            row[2:] = np.minimum(row[2:], cost[i-1, :-2] + merge_real[i-1])
+        cost[i] = np.minimum.accumulate(row - deletion_prefix) + deletion_prefix
+    return cost
+
+
+def _split_estimated_word(word_estimated, first_real, second_real) -> Tuple:
+    """Split one estimated word into the two parts closest to two real words."""
+    splits = range(len(word_estimated) + 1)
+    distances = WordMetrics.edit_distance_paired(
+        [word_estimated[:k] for k in splits] + [word_estimated[k:] for k in splits],
+        [first_real] * len(splits) + [second_real] * len(splits))
+    k = int(np.argmin(distances[:len(splits)] + distances[len(splits):]))
+    return word_estimated[:k], word_estimated[k:]
+
+
+def get_best_mapped_words(words_estimated: list, words_real: list,
+                          allow_merges: bool = True) -> Tuple[List, List]:
+    """Optimal monotone mapping of the estimated words onto the real words.
+
+    Returns, for every real word, the estimated word mapped to it (or '-')
+    and that word's index in words_estimated (or -1). With allow_merges, two
+    estimated words can map to one real word (joined with a space, and the
+    index is the pair (first, second)) and one estimated word can be split
+    across two real words (both parts get the same index), e.g. for ASR
+    splits like "can't" -> "can not".
+    """
+    number_of_estimated_words = len(words_estimated)
+    number_of_real_words = len(words_real)
 
-    total_phoneme_distance = 0
-    real_word_at_time = {}
-    for idx_estimated in range(number_of_estimated_words):
-        for idx_real in range(number_of_real_words):
-            real_word_at_time[idx_estimated, idx_real] = modelCpp.NewBoolVar(
-                'real_word_at_time'+str(idx_real)+'-'+str(idx_estimated))
-            modelCpp.Add(estimated_words_order[idx_estimated] == idx_real).OnlyEnforceIf(
-                real_word_at_time[idx_estimated, idx_real])
-            total_phoneme_distance += word_distance_matrix[idx_estimated,
-                                                           idx_real]*real_word_at_time[idx_estimated, idx_real]
+    substitution = get_saturated_distances(words_estimated, words_real)
+    deletion = np.array([len(word) for word in words_real], dtype=float)
+    merge_estimated = merge_real = None
+    if allow_merges:
+        merge_estimated = get_saturated_distances(
+            _concatenate_neighbours(words_estimated), words_real)
+        merge_real = get_saturated_distances(
+            words_estimated, _concatenate_neighbours(words_real))
+
+    cost = _get_alignment_cost_matrix(
+        substitution, deletion, merge_estimated, merge_real)
+
+    mapped_words = [WORD_NOT_FOUND_TOKEN] * number_of_real_words
+    mapped_words_indices = [-1] * number_of_real_words
+    i, j = number_of_estimated_words, number_of_real_words
+    while i > 0 or j > 0:
+        current = cost[i, j]
+        if i >= 1 and j >= 1 and current == cost[i-1, j-1] + substitution[i-1, j-1]:
+            mapped_words[j-1] = words_estimated[i-1]
+            mapped_words_indices[j-1] = i-1
+            i, j = i-1, j-1
+        elif allow_merges and i >= 2 and j >= 1 and \
+                current == cost[i-2, j-1] + merge_estimated[i-2, j-1]:
+            mapped_words[j-1] = words_estimated[i-2] + ' ' + words_estimated[i-1]
+            mapped_words_indices[j-1] = (i-2, i-1)
+            i, j = i-2, j-1
+        elif allow_merges and i >= 1 and j >= 2 and \
+                current == cost[i-1, j-2] + merge_real[i-1, j-2]:
+            parts = _split_estimated_word(
+                words_estimated[i-1], words_real[j-2], words_real[j-1])
+            for offset, part in zip((2, 1), parts):
+                if len(part) > 0:
+                    mapped_words[j-offset] = part
+                    mapped_words_indices[j-offset] = i-1
+            i, j = i-1, j-2
+        elif j >= 1 and current == cost[i, j-1] + deletion[j-1]:
+            j = j-1
+        else:
+            i = i-1
 
-    # If no word in time, difference is calculated from empty string
-    for idx_real in range(number_of_real_words):
-        word_has_a_match = modelCpp.NewBoolVar(
-            'word_has_a_match'+str(idx_real))
-        modelCpp.Add(sum([real_word_at_time[idx_estimated, idx_real] for idx_estimated in range(
-            number_of_estimated_words)]) == 1).OnlyEnforceIf(word_has_a_match)
-        total_phoneme_distance += word_distance_matrix[number_of_estimated_words,
-                                                       idx_real]*word_has_a_match.Not()
+    return mapped_words, mapped_words_indices
 
-    # Loss should be minimized
-    modelCpp.Minimize(total_phoneme_distance)
 
-    solver = cp_model.CpSolver()
-    solver.parameters.max_time_in_seconds = TIME_THRESHOLD_MAPPING
-    status = solver.Solve(modelCpp)
+def get_character_ngrams(word: str, n: int = 2) -> Counter:
+    """Multiset of the character n-grams of a word, padded with spaces at both ends."""
+    padded = ' ' + word + ' '
+    return Counter(padded[idx:idx+n] for idx in range(len(padded) - n + 1))
 
-    mapped_indices = []
-    try:
-        for word_idx in range(number_words):
-            mapped_indices.append(
-                (solver.Value(estimated_words_order[word_idx])))
 
-        return np.array(mapped_indices, dtype=int)
-    except:
-        return []
+def get_fuzzy_mapped_words(words_estimated: list, words_real: list,
+                           cutoff: float = 0.35) -> Tuple[List, List]:
+    """Map each real word to its most similar estimated word, in any order.
 
+    The bigrams of the estimated words are indexed once, and every real word
+    is scored only against the estimated words it shares a bigram with, using
+    the Dice coefficient 2*|A & B| / (|A| + |B|) of the bigram multisets.
+    Words scoring below cutoff are left unmapped ('-', index -1); on ties the
+    earliest estimated word wins.
+    """
+    ngram_index = defaultdict(list)
+    ngram_totals = []
+    for idx_estimated, word in enumerate(words_estimated):
+        ngrams = get_character_ngrams(word.lower())
+        ngram_totals.append(sum(ngrams.values()))
+        for ngram, count in ngrams.items():
+            ngram_index[ngram].append((idx_estimated, count))
 
-def get_resulting_string(mapped_indices: np.ndarray, words_estimated: list, words_real: list) -> Tuple[List,List]:
     mapped_words = []
     mapped_words_indices = []
-    WORD_NOT_FOUND_TOKEN = '-'
-    number_of_real_words = len(words_real)
-    for word_idx in range(number_of_real_words):
-        position_of_real_word_indices = np.where(
-            mapped_indices == word_idx)[0].astype(int)
-
-        if len(position_of_real_word_indices) == 0:
+    for word in words_real:
+        ngrams = get_character_ngrams(word.lower())
+        total = sum(ngrams.values())
+        shared = defaultdict(int)
+        for ngram, count in ngrams.items():
+            for idx_estimated, count_estimated in ngram_index.get(ngram, ()):
+                shared[idx_estimated] += min(count, count_estimated)
+
+        best_idx, best_score = -1, 0.0
+        for idx_estimated in sorted(shared):
+            score = 2.0 * shared[idx_estimated] / (total + ngram_totals[idx_estimated])
+            if score > best_score:
+                best_idx, best_score = idx_estimated, score
+
+        if best_idx >= 0 and best_score >= cutoff:
+            mapped_words.append(words_estimated[best_idx])
+            mapped_words_indices.append(best_idx)
+        else:
             mapped_words.append(WORD_NOT_FOUND_TOKEN)
             mapped_words_indices.append(-1)
-            continue
-
-        if len(position_of_real_word_indices) == 1:
-            mapped_words.append(
-                words_estimated[position_of_real_word_indices[0]])
-            mapped_words_indices.append(position_of_real_word_indices[0])
-            continue
-        # Check which index gives the lowest error
-        if len(position_of_real_word_indices) > 1:
-            error = 99999
-            best_possible_combination = ''
-            best_possible_idx = -1
-            for single_word_idx in position_of_real_word_indices:
-                idx_above_word = single_word_idx >= len(words_estimated)
-                if idx_above_word:
-                    continue
-                error_word = WordMetrics.edit_distance_python(
-                    words_estimated[single_word_idx], words_real[word_idx])
-                if error_word < error:
-                    error = error_word*1
-                    best_possible_combination = words_estimated[single_word_idx]
-                    best_possible_idx = single_word_idx
-
-            mapped_words.append(best_possible_combination)
-            mapped_words_indices.append(best_possible_idx)
-            continue
-
-    return mapped_words, mapped_words_indices
-
-
-def get_best_mapped_words(words_estimated: list, words_real: list,use_dtw:bool = True) -> list:
-
-    word_distance_matrix = get_word_distance_matrix(
-        words_estimated, words_real)
-
-    start = time.time()
-    
-    if use_dtw:
-        alignment = (dtw_from_distance_matrix(
-                word_distance_matrix.T))
-            
-        mapped_indices = alignment.get_warping_path()[:len(words_estimated)]
-        duration_of_mapping = time.time()-start
-    else:
-        mapped_indices = get_best_path_from_distance_matrix(word_distance_matrix)
-
-        duration_of_mapping = time.time()-start
-        # In case or-tools doesn't converge, go to a faster, low-quality solution
-        if len(mapped_indices) == 0 or duration_of_mapping > TIME_THRESHOLD_MAPPING+0.5:
-            #mapped_indices = (dtw_from_distance_matrix(
-            #    word_distance_matrix)).path[:len(words_estimated), 1]
-            alignment = (dtw_from_distance_matrix(
-                word_distance_matrix.T))
-            
-            mapped_indices = alignment.get_warping_path()
-
-    mapped_words, mapped_words_indices = get_resulting_string(
-        mapped_indices, words_estimated, words_real)
-
     return mapped_words, mapped_words_indices
 
 
-# Faster, but not optimal
-def get_best_mapped_words_dtw(words_estimated: list, words_real: list) -> list:
-
-    from dtwalign import dtw_from_distance_matrix
-    word_distance_matrix = get_word_distance_matrix(
-        words_estimated, words_real)
-    mapped_indices = dtw_from_distance_matrix(
-        word_distance_matrix).path[:-1, 0]
-
-    mapped_words, mapped_words_indices = get_resulting_string(
-        mapped_indices, words_estimated, words_real)
-    return mapped_words, mapped_words_indices
+def get_phoneme_word_indices(real_words_codes: list, recognized_codes: np.ndarray,
+                             substitution_costs: np.ndarray) -> np.ndarray:
+    """Reference word of every recognized phoneme.
+
+    The recognized phonemes are aligned to the phonemes of the whole
+    reference sentence with a weighted Levenshtein backtrace; each one goes
+    to the word of the reference phoneme it is aligned to, and an inserted
+    phoneme to the word of the reference phoneme before it (the first word
+    at the start).
+    """
+    real_codes = np.concatenate([np.asarray(codes, dtype=np.int32) for codes in real_words_codes] or
+                                [np.zeros(0, dtype=np.int32)])
+    word_of_real = np.repeat(np.arange(len(real_words_codes)), [len(codes) for codes in real_words_codes])
+    word_indices = np.zeros(len(recognized_codes), dtype=np.int64)
+    if len(real_codes) == 0:
+        return word_indices
+    table = WordMetrics.weighted_edit_distance_tables([real_codes], [recognized_codes], substitution_costs)[0]
+
+    i, j = len(real_codes), len(recognized_codes)
+    while j > 0:
+        if i > 0 and np.isclose(table[i, j], table[i-1, j-1] + substitution_costs[real_codes[i-1],
+                                                                                recognized_codes[j-1]]):
+            word_indices[j-1] = word_of_real[i-1]
+            i, j = i-1, j-1
+        elif i > 0 and np.isclose(table[i, j], table[i-1, j] + 1):
+            i = i-1
+        else:
+            word_indices[j-1] = word_of_real[max(i-1, 0)]
+            j = j-1
+    return word_indices
+
+
+def get_letter_correctness(words_real: list, words_mapped: list) -> List[List[int]]:
+    """Per-letter 0/1 flags telling which letters of each real word were transcribed.
+
+    Letters are aligned with a Levenshtein backtrace of the real word against
+    its mapped word; the DP tables of the whole sentence are filled in one
+    batched call. A letter is correct if it is aligned to the same letter
+    (case-insensitive) or is punctuation. Unmapped words ('-') count as empty.
+    """
+    words_real = [word.lower() for word in words_real]
+    words_mapped = ['' if word == WORD_NOT_FOUND_TOKEN else word.lower()
+                    for word in words_mapped]
+    tables = WordMetrics.edit_distance_tables(words_real, words_mapped)
+
+    letter_correctness = []
+    for table, word_real, word_mapped in zip(tables, words_real, words_mapped):
+        is_letter_correct = [int(letter in punctuation) for letter in word_real]
+        i, j = len(word_real), len(word_mapped)
+        while i > 0 and j > 0:
+            is_same = word_real[i-1] == word_mapped[j-1]
+            if table[i, j] == table[i-1, j-1] + (not is_same):
+                is_letter_correct[i-1] |= int(is_same)
+                i, j = i-1, j-1
+            elif table[i, j] == table[i-1, j] + 1:
+                i = i-1
+            else:
+                j = j-1
+        letter_correctness.append(is_letter_correct)
+    return letter_correctness
 
 
 def getWhichLettersWereTranscribedCorrectly(real_word, transcribed_word):
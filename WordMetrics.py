@@ -52,4 +52,172 @@ def edit_distance_python(seq1, seq2):
                     matrix[x,y-1] + 1
                 )
     #print (matrix)
-    return (matrix[size_x - 1, size_y - 1])
\ No newline at end of file
+    return (matrix[size_x - 1, size_y - 1])
+
+# Batched edit distances
+# ----------------------
+# Every sequence is mapped onto shared integer codes and padded into one
+# array, then all pairs are processed together one row of the DP table at a
+# time. Insertions inside a row are resolved with a running minimum
+# (row[j] = min_k row[k] + j - k), so the only Python loop is over the
+# characters of the longest sequence of the first list.
+#
+# With max_k the distance is only exact up to max_k; anything further away
+# is reported as max_k+1. Cell (i, j) is at least |i-j|, so only a diagonal
+# band of each row is computed, and the loop stops as soon as every pair has
+# either finished or left the band.
+
+def _encode_sequences(sequences_a, sequences_b):
+    codes = {}
+    encoded = []
+    for sequences, padding in ((sequences_a, -1), (sequences_b, -2)):
+        lengths = np.array([len(sequence) for sequence in sequences], dtype=np.int32)
+        array = np.full((len(sequences), max(lengths.max(initial=0), 1)),
+                        padding, dtype=np.int32)
+        for idx, sequence in enumerate(sequences):
+            array[idx, :len(sequence)] = [
+                codes.setdefault(token, len(codes)) for token in sequence]
+        encoded.append((array, lengths))
+    return encoded
+
+
+def _pad_codes(sequences):
+    lengths = np.array([len(sequence) for sequence in sequences], dtype=np.int32)
+    array = np.zeros((len(sequences), max(lengths.max(initial=0), 1)), dtype=np.int32)
+    for idx, sequence in enumerate(sequences):
+        array[idx, :len(sequence)] = sequence
+    return array, lengths
+
+
+def _edit_distance_kernel(codes_a, lengths_a, codes_b, lengths_b, max_k=None, tables=None,
+                          substitution_costs=None):
+    shape = np.broadcast_shapes(lengths_a.shape, lengths_b.shape)
+    max_length_a, max_length_b = codes_a.shape[-1], codes_b.shape[-1]
+    steps = np.arange(max_length_b + 1, dtype=np.int32)
+    lengths_a = np.broadcast_to(lengths_a, shape)
+    lengths_b = np.broadcast_to(lengths_b, shape)
+
+    if max_k is None:
+        band = max_length_a + max_length_b + 1
+    else:
+        cutoff = np.broadcast_to(np.asarray(max_k, dtype=np.int32), shape) + 1
+        band = int(cutoff.max())
+        exceeded = np.abs(lengths_a - lengths_b) >= cutoff
+
+    dtype = np.int32 if substitution_costs is None else substitution_costs.dtype
+    previous_row = np.broadcast_to(np.minimum(steps, band).astype(dtype),
+                                   shape + steps.shape).copy()
+    distances = lengths_b.copy()
+    if tables is not None:
+        tables.append(previous_row)
+    for i in range(max_length_a):
+        low, high = max(1, i + 2 - band), min(max_length_b, i + band)
+        row = np.full_like(previous_row, band)
+        if i + 1 < band:
+            row[..., 0] = i + 1
+        if low <= high:
+            if substitution_costs is None:
+                substitution = (codes_a[..., i, None] != codes_b[..., low - 1:high]).astype(np.int32)
+            else:
+                substitution = substitution_costs[codes_a[..., i, None], codes_b[..., low - 1:high]]
+            np.minimum(previous_row[..., low:high + 1] + 1,
+                       previous_row[..., low - 1:high] + substitution,
+                       out=row[..., low:high + 1])
+            start = low - 1 if i + 1 < band else low
+            window = steps[start:high + 1]
+            row[..., start:high + 1] = np.minimum(
+                np.minimum.accumulate(row[..., start:high + 1] - window, axis=-1) + window,
+                band)
+
+        finished = lengths_a == i + 1
+        if finished.any():
+            distances = np.where(finished, np.take_along_axis(
+                row, lengths_b[..., None], axis=-1)[..., 0], distances)
+        previous_row = row
+        if tables is not None:
+            tables.append(row)
+
+        if max_k is not None:
+            exceeded |= (row.min(axis=-1) >= cutoff) & (lengths_a > i + 1)
+            if (exceeded | (lengths_a <= i + 1)).all():
+                break
+
+    if max_k is not None:
+        distances = np.where(exceeded, cutoff, np.minimum(distances, cutoff))
+    return distances
+
+
+def edit_distance_matrix(sequences_a: list, sequences_b: list, max_k=None) -> np.ndarray:
+    """Levenshtein distance of every pair, shape (len(sequences_a), len(sequences_b)).
+
+    Sequences can be strings or lists of any hashable tokens. If max_k is
+    given (a number or an array broadcastable to the output), distances above
+    it are returned as max_k+1.
+    """
+    if len(sequences_a) == 0 or len(sequences_b) == 0:
+        return np.zeros((len(sequences_a), len(sequences_b)), dtype=np.int32)
+    (codes_a, lengths_a), (codes_b, lengths_b) = _encode_sequences(
+        sequences_a, sequences_b)
+    return _edit_distance_kernel(codes_a[:, None, :], lengths_a[:, None],
+                                 codes_b[None, :, :], lengths_b[None, :], max_k)
+
+
+def edit_distance_paired(sequences_a: list, sequences_b: list, max_k=None) -> np.ndarray:
+    """Levenshtein distance between sequences_a[i] and sequences_b[i] for every i.
+
+    max_k works as in edit_distance_matrix.
+    """
+    assert len(sequences_a) == len(sequences_b), 'Both lists need the same length'
+    if len(sequences_a) == 0:
+        return np.zeros(0, dtype=np.int32)
+    (codes_a, lengths_a), (codes_b, lengths_b) = _encode_sequences(
+        sequences_a, sequences_b)
+    return _edit_distance_kernel(codes_a, lengths_a, codes_b, lengths_b, max_k)
+
+
+def weighted_edit_distance_paired(codes_a: list, codes_b: list,
+                                  substitution_costs: np.ndarray, max_k=None) -> np.ndarray:
+    """Edit distance between codes_a[i] and codes_b[i] with weighted substitutions.
+
+    Codes are integer arrays indexing substitution_costs, e.g. phoneme IDs from
+    PhonemeInventory; insertions and deletions cost 1. max_k works as in
+    edit_distance_matrix.
+    """
+    assert len(codes_a) == len(codes_b), 'Both lists need the same length'
+    if len(codes_a) == 0:
+        return np.zeros(0, dtype=substitution_costs.dtype)
+    padded_a, lengths_a = _pad_codes(codes_a)
+    padded_b, lengths_b = _pad_codes(codes_b)
+    return _edit_distance_kernel(padded_a, lengths_a, padded_b, lengths_b, max_k,
+                                 substitution_costs=substitution_costs)
+
+
+def edit_distance_tables(sequences_a: list, sequences_b: list) -> np.ndarray:
+    """Full DP tables for the pairs (sequences_a[i], sequences_b[i]).
+
+    Returns an array of shape (n, max_len_a+1, max_len_b+1); the table of pair
+    i is valid up to [len(sequences_a[i]), len(sequences_b[i])], which is the
+    starting point for a backtrace.
+    """
+    assert len(sequences_a) == len(sequences_b), 'Both lists need the same length'
+    if len(sequences_a) == 0:
+        return np.zeros((0, 1, 1), dtype=np.int32)
+    (codes_a, lengths_a), (codes_b, lengths_b) = _encode_sequences(
+        sequences_a, sequences_b)
+    tables = []
+    _edit_distance_kernel(codes_a, lengths_a, codes_b, lengths_b, tables=tables)
+    return np.stack(tables, axis=1)
+
+
+def weighted_edit_distance_tables(codes_a: list, codes_b: list,
+                                  substitution_costs: np.ndarray) -> np.ndarray:
+    """Full DP tables of weighted_edit_distance_paired, as in edit_distance_tables."""
+    assert len(codes_a) == len(codes_b), 'Both lists need the same length'
+    if len(codes_a) == 0:
+        return np.zeros((0, 1, 1), dtype=substitution_costs.dtype)
+    padded_a, lengths_a = _pad_codes(codes_a)
+    padded_b, lengths_b = _pad_codes(codes_b)
+    tables = []
+    _edit_distance_kernel(padded_a, lengths_a, padded_b, lengths_b, tables=tables,
+                          substitution_costs=substitution_costs)
+    return np.stack(tables, axis=1)
@@ -0,0 +1,100 @@
+"""
+Compare Whisper precision modes and backends on the bundled static/ASR_*.wav clips.
+
+For every mode the clips are transcribed REPEATS times after one warm-up
+run; the script reports the median latency per clip and the word error
+rate of each transcript against the fp32 one.
+
+Usage:
+    python benchmarkASR.py                 # fp32, int8, bf16
+    python benchmarkASR.py fp32 int8       # selected modes
+    python benchmarkASR.py onnx            # the ONNX Runtime backend (whisper_onnx.py)
+    python benchmarkASR.py fast            # fp32 with the short-clip fast path
+    python benchmarkASR.py chunked         # fp32 through the chunked pipeline
+                                           # (the fp32 baseline follows
+                                           # WHISPER_SHORT_CLIP_FAST_PATH)
+    python benchmarkASR.py reference       # fp32, reference-guided decoding with the
+                                           # fp32 transcript as the expected sentence
+"""
+
+import glob
+import sys
+import time
+import wave
+import numpy as np
+import torch
+import torchaudio
+import models
+import WordMetrics
+from whisper_wrapper import PRECISION_MODES, WhisperASRModel
+
+CLIPS = sorted(glob.glob("./static/ASR_*.wav"))
+LANGUAGE = "en"
+REPEATS = 3
+SAMPLING_RATE = 16000
+
+
+def load_clip(path: str) -> torch.Tensor:
+    """Mono 16 kHz float tensor of shape (1, samples) from a 16-bit PCM wav."""
+    with wave.open(path) as handle:
+        frames = handle.readframes(handle.getnframes())
+        channels, sampling_rate = handle.getnchannels(), handle.getframerate()
+    audio = np.frombuffer(frames, dtype=np.int16).reshape(-1, channels).mean(axis=1) / 32768.0
+    audio = torch.tensor(audio, dtype=torch.float32).unsqueeze(0)
+    return torchaudio.functional.resample(audio, sampling_rate, SAMPLING_RATE)
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    reference_words, hypothesis_words = reference.lower().split(), hypothesis.lower().split()
+    distance = WordMetrics.edit_distance_paired([reference_words], [hypothesis_words])[0]
+    return float(distance) / max(len(reference_words), 1)
+
+
+def benchmark(precision: str, clips: dict, references: dict = None) -> dict:
+    if precision == "onnx":
+        asr_model = models.getASRModel(LANGUAGE, backend="onnx")
+        asr_model.precision = "onnx"
+    else:
+        asr_model = WhisperASRModel(models.WHISPER_MODEL_NAME, force_language=LANGUAGE,
+                                    precision="fp32" if precision in ("fast", "chunked", "reference") else precision)
+        if precision in ("fast", "chunked"):
+            asr_model.short_clip_fast_path = asr_model.has_alignment_heads and precision == "fast"
+    results = {}
+    for name, audio in clips.items():
+        if precision == "reference":
+            def transcribe(audio):
+                return asr_model.transcribeWithReference(audio, references[name])
+        else:
+            transcribe = asr_model.transcribe
+        transcribe(audio)
+        latencies = []
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            result = transcribe(audio)
+            latencies.append(time.perf_counter() - start)
+        results[name] = (result.transcript, float(np.median(latencies)))
+    ran_as = asr_model.precision + (", fast path" if getattr(asr_model, "short_clip_fast_path", False) else "") \
+        + (", reference-guided" if precision == "reference" else "")
+    return {"precision": ran_as, "clips": results}
+
+
+if __name__ == "__main__":
+    modes = sys.argv[1:] or list(PRECISION_MODES)
+    clips = {path.split("/")[-1]: load_clip(path) for path in CLIPS}
+    print(f"[benchmarkASR] {models.WHISPER_MODEL_NAME}, {len(clips)} clips, "
+          f"{REPEATS} repeats, {torch.get_num_threads()} threads")
+
+    reports = {"fp32": benchmark("fp32", clips)}
+    reference = reports["fp32"]["clips"]
+    for mode in modes:
+        if mode not in reports:
+            reports[mode] = benchmark(mode, clips, {name: transcript for name, (transcript, _) in reference.items()})
+    for mode in modes:
+        report = reports[mode]
+        total = sum(latency for _, latency in report["clips"].values())
+        reference_total = sum(latency for _, latency in reference.values())
+        print(f"\n{mode} (ran as {report['precision']}): "
+              f"{total:.2f}s total, {reference_total / total:.2f}x vs fp32")
+        for name, (transcript, latency) in report["clips"].items():
+            wer = word_error_rate(reference[name][0], transcript)
+            print(f"  {name:<14} {latency * 1000:7.0f} ms  WER vs fp32 {wer:5.1%}  {transcript!r}")
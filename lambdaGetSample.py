@@ -1,16 +1,37 @@
-import pandas as pd
 import json
+import os
 import RuleBasedModels
+import CorpusIndex
+import TranslationTable
 import random
+import threading
+from collections import OrderedDict
+import numpy as np
 
 
 class TextDataset:
-    def __init__(self, table: pd.DataFrame):
-        self.table = table
-        self.number_of_samples = len(table)
+    """
+    Sentences of one corpus, backed by a StringTable (UTF-8 blob + offsets).
+
+    Loaded from the memory-mapped corpus index when it exists, so workers
+    share the pages; otherwise parsed from the CSV with the csv module.
+    Either way no pandas import and O(1) indexing.
+    """
+
+    def __init__(self, sentences: CorpusIndex.StringTable):
+        self.sentences = sentences
+        self.number_of_samples = len(sentences)
+
+    @classmethod
+    def fromCsv(cls, csv_path: str) -> "TextDataset":
+        return cls(CorpusIndex.StringTable.fromStrings(CorpusIndex.read_sentences(csv_path)))
+
+    @classmethod
+    def fromCorpusIndex(cls, corpus_index: CorpusIndex.CorpusIndex) -> "TextDataset":
+        return cls(corpus_index.sentences)
 
     def __getitem__(self, idx: int):
-        return [self.table["sentence"].iloc[idx]]
+        return [self.sentences[idx]]
 
     def __len__(self):
         return self.number_of_samples
@@ -19,25 +40,104 @@ class TextDataset:
 # ─── Load all datasets at module import time ────────────────────────────────
 SAMPLE_FOLDER = "./databases/"
 AVAILABLE_LANGUAGES = ["hi", "mr", "en"]
+NUMBER_OF_CATEGORIES = 4  # 0 = random, 1 = easy, 2 = medium, 3 = hard
+MAX_SESSIONS = 10_000
+# Set TRANSLATE_MISSING=0 to serve only the precomputed translations
+TRANSLATE_MISSING = os.environ.get("TRANSLATE_MISSING", "1") != "0"
 
 lambda_database: dict[str, TextDataset] = {}
-lambda_ipa_converter: dict[str, "RuleBasedModels.ITextToPhonemModel"] = {}
+# Precomputed IPA per sentence (None when the index was not built, see CorpusIndex.py)
+lambda_corpus_index: dict[str, "CorpusIndex.CorpusIndex"] = {}
+# Sentence ids per category; entry 0 holds every sentence
+lambda_category_indices: dict[str, list] = {}
+lambda_translations: dict[str, TranslationTable.TranslationTable] = {}
+lambda_translation_queues: dict[str, TranslationTable.TranslationQueue] = {}
+
+
+def _load_translator(language: str):
+    import AIModels
+    import models
+    return AIModels.NeuralTranslator(*models.getTranslationModel(language))
+
+
+def build_category_indices(categories: np.ndarray) -> list:
+    categories = np.asarray(categories)
+    indices = [np.arange(len(categories), dtype=np.int32)]
+    for category in range(1, NUMBER_OF_CATEGORIES):
+        indices.append(np.flatnonzero(categories == category).astype(np.int32))
+    return indices
+
 
 for _lang in AVAILABLE_LANGUAGES:
-    _df = pd.read_csv(SAMPLE_FOLDER + "data_" + _lang + ".csv", delimiter=";")
-    lambda_database[_lang] = TextDataset(_df)
-    lambda_ipa_converter[_lang] = RuleBasedModels.get_phonem_converter(_lang)
+    lambda_corpus_index[_lang] = CorpusIndex.load_corpus_index(_lang)
+    if lambda_corpus_index[_lang] is not None:
+        lambda_database[_lang] = TextDataset.fromCorpusIndex(lambda_corpus_index[_lang])
+        _categories = lambda_corpus_index[_lang].category
+    else:
+        lambda_database[_lang] = TextDataset.fromCsv(SAMPLE_FOLDER + "data_" + _lang + ".csv")
+        _categories = [CorpusIndex.get_sentence_category(lambda_database[_lang][idx][0])
+                       for idx in range(len(lambda_database[_lang]))]
+    lambda_category_indices[_lang] = build_category_indices(_categories)
+    lambda_translations[_lang] = TranslationTable.TranslationTable(_lang)
+    lambda_translation_queues[_lang] = TranslationTable.TranslationQueue(
+        lambda_translations[_lang], lambda language=_lang: _load_translator(language))
 
 
 # ─── Helpers ─────────────────────────────────────────────────────────────────
 def getSentenceCategory(sentence: str) -> int:
     """Return 1 (easy), 2 (medium), or 3 (hard) based on word count."""
-    word_count = len(sentence.split())
-    limits = [0, 8, 20, 100_000]
-    for cat in range(len(limits) - 1):
-        if limits[cat] < word_count <= limits[cat + 1]:
-            return cat + 1
-    return 3  # fallback
+    return CorpusIndex.get_sentence_category(sentence)
+
+
+def getCategoryIndices(language: str, category: int) -> np.ndarray:
+    """Sentence ids of a category, falling back to the nearest non-empty one."""
+    indices = lambda_category_indices[language]
+    if len(indices[category]) == 0:
+        fallback = min((other for other in range(1, NUMBER_OF_CATEGORIES) if len(indices[other])),
+                       key=lambda other: abs(other - category), default=0)
+        print(f"[lambdaGetSample] No '{language}' sentences in category {category}, "
+              f"using category {fallback}")
+        category = fallback
+    return indices[category]
+
+
+def getTranslation(language: str, sentence_id: int, sentence: str) -> str:
+    """Precomputed translation; unknown ones are queued and come back as ''."""
+    translation = lambda_translations[language].get(sentence_id)
+    if not translation and TRANSLATE_MISSING:
+        lambda_translation_queues[language].request(sentence_id, sentence)
+    return translation
+
+
+class SessionSampler:
+    """
+    Per-session shuffled permutations, so a user walks through a whole
+    category before seeing a sentence again. Only the MAX_SESSIONS most
+    recently used sessions are kept.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS) -> None:
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def sample(self, session_id: str, language: str, pool, indices: np.ndarray) -> int:
+        """Next sentence id from indices; pool names the candidate set (e.g. a category)."""
+        key = (session_id, language, pool)
+        with self.lock:
+            state = self.sessions.get(key)
+            if state is None or state[1] >= len(state[0]):
+                state = [np.random.permutation(indices), 0]
+                self.sessions[key] = state
+            self.sessions.move_to_end(key)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+            idx = int(state[0][state[1]])
+            state[1] += 1
+        return idx
+
+
+session_sampler = SessionSampler()
 
 
 # ─── Lambda handler ──────────────────────────────────────────────────────────
@@ -45,40 +145,48 @@ def lambda_handler(event, context):
     body = json.loads(event["body"])
     category = int(body["category"])  # 0 = random, 1 = easy, 2 = medium, 3 = hard
     language = body.get("language", "en")
+    session_id = body.get("session_id")
+    # "Practice these sounds": phonemes (IPA) and/or words the learner struggles with
+    practice_phonemes = body.get("practice_phonemes") or []
+    practice_words = body.get("practice_words") or []
 
     if language not in lambda_database:
         return json.dumps({"error": f"Language '{language}' not supported."})
+    if not 0 <= category < NUMBER_OF_CATEGORIES:
+        return json.dumps({"error": f"Category '{category}' not supported."})
 
     dataset = lambda_database[language]
-    ipa_converter = lambda_ipa_converter[language]
-
-    # Sample with category filter.
-    # Use a hard retry limit so we never spin forever (fixes the silent bare-except loop).
-    MAX_RETRIES = 200
-    current_transcript = None
-
-    for attempt in range(MAX_RETRIES):
-        try:
-            idx = random.randint(0, len(dataset) - 1)
-            candidate = dataset[idx]
-            sentence = candidate[0]
-
-            sentence_category = getSentenceCategory(sentence)
-            if category == 0 or sentence_category == category:
-                current_transcript = candidate
-                break
-        except Exception as exc:
-            # Log the individual failure, keep trying
-            print(f"[lambdaGetSample] Attempt {attempt} failed: {exc!r}")
-
-    if current_transcript is None:
-        return json.dumps({"error": "Could not find a matching sentence after many retries."})
-
-    current_ipa = ipa_converter.convertToPhonem(current_transcript[0])
+    corpus_index = lambda_corpus_index.get(language)
+
+    indices, pool = getCategoryIndices(language, category), category
+    if practice_phonemes or practice_words:
+        if corpus_index is None:
+            print(f"[lambdaGetSample] Practice sampling needs the '{language}' corpus index, "
+                  f"sampling by category")
+        else:
+            practice_indices = corpus_index.findPracticeSentences(
+                practice_phonemes, practice_words, category)
+            if len(practice_indices):
+                indices = practice_indices
+                pool = (category, tuple(practice_phonemes), tuple(practice_words))
+
+    if len(indices) == 0:
+        return json.dumps({"error": "Could not find a matching sentence."})
+    if session_id:
+        idx = session_sampler.sample(str(session_id), language, pool, indices)
+    else:
+        idx = int(indices[random.randrange(len(indices))])
+    current_transcript = dataset[idx]
+
+    if corpus_index is not None:
+        current_ipa = corpus_index.getSentenceIpa(idx)
+    else:
+        # Shared converter, only loaded when there is no precomputed IPA
+        current_ipa = RuleBasedModels.get_phonem_converter(language).convertToPhonem(current_transcript[0])
 
     result = {
         "real_transcript": current_transcript,
         "ipa_transcript":  current_ipa,
-        "transcript_translation": "",   # translation removed (no longer supported)
+        "transcript_translation": getTranslation(language, idx, current_transcript[0]),
     }
-    return json.dumps(result)
\ No newline at end of file
+    return json.dumps(result)
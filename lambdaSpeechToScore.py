@@ -14,11 +14,9 @@ import tempfile
 import tempfile
 import traceback
 
-trainer_SST_lambda = {}
-# trainer_SST_lambda['de'] = pronunciationTrainer.getTrainer("de")
-trainer_SST_lambda['en'] = pronunciationTrainer.getTrainer("en")
-trainer_SST_lambda['hi'] = pronunciationTrainer.getTrainer("hi")
-trainer_SST_lambda['mr'] = pronunciationTrainer.getTrainer("mr")
+# Trainers are built on the first request for their language (see
+# pronunciationTrainer.getTrainer), not for every language at import time
+AVAILABLE_LANGUAGES = ['en', 'hi', 'mr']
 
 
 transform = Resample(orig_freq=48000, new_freq=16000)
@@ -28,8 +26,15 @@ def lambda_handler(event, context):
     """
     Expects: event['body'] to be a JSON string with keys:
       - title: string (the transcript / reference text)
+      - open_reading: optional bool; when true, title may be empty and the
+        corpus sentence that was read is identified from the transcript
       - base64Audio: either a full data URI "data:audio/ogg;base64,AAAA..." or the base64 payload only
       - language: 'en' 
+      - forced_alignment: optional bool; when true the recording is scored by
+        CTC forced alignment of title (needs a model in models.CTC_MODEL_FOLDER)
+      - word_timestamps: optional bool, default true; when false, start_time and
+        end_time are empty and the response has a word_alignment to send back,
+        with the same base64Audio, to word_times_handler
 
     Returns:
       - On success: JSON string (json.dumps) of the same structure your pipeline expects.
@@ -46,6 +51,9 @@ def lambda_handler(event, context):
         real_text = body.get('title', '') or ''
         b64_input = body.get('base64Audio', '') or ''
         language = body.get('language', 'en') or 'en'
+        open_reading = bool(body.get('open_reading', False))
+        word_timestamps = bool(body.get('word_timestamps', True))
+        forced_alignment = bool(body.get('forced_alignment', False))
 
         # print("Pratham: ",real_text, b64_input, language)
 
@@ -53,115 +61,34 @@ def lambda_handler(event, context):
               " language:", language, " base64 len:", len(b64_input))
 
         # If no reference text, return empty
-        if len(real_text) == 0:
+        if len(real_text) == 0 and not open_reading:
             print("[lambda_handler] Empty title provided: returning empty body.")
             return json.dumps('')
 
-        # Robust Base64 handling
-        if not isinstance(b64_input, str) or len(b64_input.strip()) == 0:
-            err_msg = "No base64Audio provided"
-            print("[lambda_handler] ERROR:", err_msg)
-            return json.dumps({'error': err_msg})
-
-        # If it's a data URI, strip the prefix and detect format
-        file_extension = ".ogg"  # DEFAULT TO OGG since frontend uses OGG
-        if b64_input.startswith('data:'):
-            comma_idx = b64_input.find(',')
-            if comma_idx == -1:
-                err_msg = "Malformed data URI for audio"
-                print("[lambda_handler] ERROR:", err_msg)
-                return json.dumps({'error': err_msg})
-            
-            # Extract MIME type to determine file extension
-            mime_type = b64_input[5:comma_idx]
-            if 'ogg' in mime_type:
-                file_extension = ".ogg"
-            elif 'webm' in mime_type:
-                file_extension = ".webm"
-            elif 'mp3' in mime_type:
-                file_extension = ".mp3"
-            elif 'wav' in mime_type:
-                file_extension = ".wav"
-                
-            b64_payload = b64_input[comma_idx + 1:]
-        else:
-            b64_payload = b64_input
-
-        print(f"[lambda_handler] Using audio format: {file_extension}")
-
-        # sanity check
-        if len(b64_payload) < 20:
-            err_msg = "Base64 audio payload too short"
-            print("[lambda_handler] ERROR:", err_msg)
-            return json.dumps({'error': err_msg})
-
-        # decode base64
-        try:
-            file_bytes = base64.b64decode(b64_payload.encode('utf-8'))
-            # print("Pratham:",file_bytes)
-            print(f"[lambda_handler] Decoded {len(file_bytes)} bytes of audio data")
-        except Exception as ex:
-            print("[lambda_handler] ERROR decoding base64:", repr(ex))
-            return json.dumps({'error': 'Failed to decode base64 audio: ' + str(ex)})
-
-        # write to temporary file with correct extension
-        tmp = tempfile.NamedTemporaryFile(suffix=file_extension, delete=False)
-        tmp_name = tmp.name
-        try:
-            tmp.write(file_bytes)
-            tmp.flush()
-            tmp.close()
-
-            # Load the audio with robust loader
-            try:
-                signal, fs = audioread_load_with_fallback(tmp_name)
-                print(f"[lambda_handler] Audio loaded - shape: {signal.shape if hasattr(signal, 'shape') else len(signal)}, sample rate: {fs}")
-            except Exception as ex:
-                print("[lambda_handler] ERROR loading audio:", repr(ex))
-                traceback.print_exc()
-                return json.dumps({'error': 'Failed to load audio file. Please ensure the audio recording is valid and try again.'})
-                
-        finally:
-            try:
-                os.remove(tmp_name)
-            except Exception as ex_rm:
-                print("[lambda_handler] Warning: failed to remove temp file:", tmp_name, repr(ex_rm))
-
-        # Convert to tensor and ensure proper shape
-        try:
-            if isinstance(signal, np.ndarray):
-                # If multi-channel, convert to mono by averaging
-                if signal.ndim > 1:
-                    signal = np.mean(signal, axis=1)
-                
-                # Apply resampling transform if needed
-                signal_tensor = transform(torch.FloatTensor(signal)).unsqueeze(0)  # shape (1, samples)
-            else:
-                signal_tensor = transform(torch.FloatTensor(signal)).unsqueeze(0)
-                
-            print(f"[lambda_handler] Audio tensor shape: {signal_tensor.shape}")
-            
-        except Exception as ex:
-            print("[lambda_handler] ERROR converting to tensor:", repr(ex))
-            traceback.print_exc()
-            return json.dumps({'error': 'Failed to process audio tensor: ' + str(ex)})
-
-        # Validate audio
         try:
-            validate_audio(signal_tensor, fs)
-        except Exception as ex:
-            print("[lambda_handler] ERROR audio validation failed:", repr(ex))
-            return json.dumps({'error': f'Audio validation failed: {str(ex)}'})
+            signal_tensor = decode_audio(b64_input)
+        except ValueError as ex:
+            return json.dumps({'error': str(ex)})
 
         # Run pronunciation pipeline
         try:
-            if language not in trainer_SST_lambda:
+            if language not in AVAILABLE_LANGUAGES:
                 err_msg = f"Language '{language}' not supported by trainer."
                 print("[lambda_handler] ERROR:", err_msg)
                 return json.dumps({'error': err_msg})
 
             start_proc = time.time()
-            result = trainer_SST_lambda[language].processAudioForGivenText(signal_tensor, real_text)
+            if open_reading:
+                result = pronunciationTrainer.getTrainer(language).processAudioForOpenReading(
+                    signal_tensor, word_timestamps)
+                if result is None:
+                    return json.dumps({'error': 'Could not identify which sentence was read.'})
+            elif forced_alignment:
+                result = pronunciationTrainer.getTrainer(language).processAudioWithForcedAlignment(
+                    signal_tensor, real_text)
+            else:
+                result = pronunciationTrainer.getTrainer(language).processAudioForGivenText(
+                    signal_tensor, real_text, word_timestamps)
             print("Pratham: ",result)
             print("[lambda_handler] Processing time (sec):", time.time() - start_proc)
         except Exception as ex:
@@ -177,21 +104,17 @@ def lambda_handler(event, context):
             real_transcripts = ' '.join([word[0] for word in result['real_and_transcribed_words']])
             matched_transcripts = ' '.join([word[1] for word in result['real_and_transcribed_words']])
 
-            words_real = real_transcripts.lower().split()
-            mapped_words = matched_transcripts.split()
-
-            is_letter_correct_all_words = ''
-            for idx, word_real in enumerate(words_real):
-                try:
-                    if idx < len(mapped_words):
-                        mapped_letters, mapped_letters_indices = wm.get_best_mapped_words(mapped_words[idx], word_real)
-                        is_letter_correct = wm.getWhichLettersWereTranscribedCorrectly(word_real, mapped_letters)
-                        is_letter_correct_all_words += ''.join([str(int(is_correct)) for is_correct in is_letter_correct]) + ' '
-                    else:
-                        is_letter_correct_all_words += '0' * len(word_real) + ' '
-                except Exception as ex_wm:
-                    print(f"[lambda_handler] Warning mapping letters for word index {idx}: {repr(ex_wm)}")
-                    is_letter_correct_all_words += '0' * len(word_real) + ' '
+            words_real = [word[0] for word in result['real_and_transcribed_words']]
+            mapped_words = [word[1] for word in result['real_and_transcribed_words']]
+
+            try:
+                letter_correctness = wm.get_letter_correctness(words_real, mapped_words)
+            except Exception as ex_wm:
+                print(f"[lambda_handler] Warning mapping letters: {repr(ex_wm)}")
+                letter_correctness = [[0] * len(word_real) for word_real in words_real]
+            is_letter_correct_all_words = ' '.join(
+                ''.join(str(is_correct) for is_correct in is_letter_correct)
+                for is_letter_correct in letter_correctness)
 
             pair_accuracy_category = ' '.join([str(category) for category in result.get('pronunciation_categories', [])])
 
@@ -208,6 +131,10 @@ def lambda_handler(event, context):
                 'end_time': result.get('end_time', ''),
                 'is_letter_correct_all_words': is_letter_correct_all_words.strip()
             }
+            if open_reading:
+                res['identified_sentence'] = result.get('real_text', '')
+            if 'word_alignment' in result:
+                res['word_alignment'] = result['word_alignment']
 
             print(res)
 
@@ -223,7 +150,148 @@ def lambda_handler(event, context):
         print("[lambda_handler] Unhandled exception:", repr(e))
         traceback.print_exc()
         return json.dumps({'error': 'Unhandled error: ' + str(e)})
-    
+
+
+def decode_audio(b64_input) -> torch.Tensor:
+    """
+    Validated 16 kHz audio, shaped (1, samples), of a base64Audio field (a
+    data URI or the base64 payload only). Raises ValueError with a message
+    for the client.
+    """
+    # Robust Base64 handling
+    if not isinstance(b64_input, str) or len(b64_input.strip()) == 0:
+        err_msg = "No base64Audio provided"
+        print("[lambda_handler] ERROR:", err_msg)
+        raise ValueError(err_msg)
+
+    # If it's a data URI, strip the prefix and detect format
+    file_extension = ".ogg"  # DEFAULT TO OGG since frontend uses OGG
+    if b64_input.startswith('data:'):
+        comma_idx = b64_input.find(',')
+        if comma_idx == -1:
+            err_msg = "Malformed data URI for audio"
+            print("[lambda_handler] ERROR:", err_msg)
+            raise ValueError(err_msg)
+        
+        # Extract MIME type to determine file extension
+        mime_type = b64_input[5:comma_idx]
+        if 'ogg' in mime_type:
+            file_extension = ".ogg"
+        elif 'webm' in mime_type:
+            file_extension = ".webm"
+        elif 'mp3' in mime_type:
+            file_extension = ".mp3"
+        elif 'wav' in mime_type:
+            file_extension = ".wav"
+            
+        b64_payload = b64_input[comma_idx + 1:]
+    else:
+        b64_payload = b64_input
+
+    print(f"[lambda_handler] Using audio format: {file_extension}")
+
+    # sanity check
+    if len(b64_payload) < 20:
+        err_msg = "Base64 audio payload too short"
+        print("[lambda_handler] ERROR:", err_msg)
+        raise ValueError(err_msg)
+
+    # decode base64
+    try:
+        file_bytes = base64.b64decode(b64_payload.encode('utf-8'))
+        # print("Pratham:",file_bytes)
+        print(f"[lambda_handler] Decoded {len(file_bytes)} bytes of audio data")
+    except Exception as ex:
+        print("[lambda_handler] ERROR decoding base64:", repr(ex))
+        raise ValueError('Failed to decode base64 audio: ' + str(ex))
+
+    # write to temporary file with correct extension
+    tmp = tempfile.NamedTemporaryFile(suffix=file_extension, delete=False)
+    tmp_name = tmp.name
+    try:
+        tmp.write(file_bytes)
+        tmp.flush()
+        tmp.close()
+
+        # Load the audio with robust loader
+        try:
+            signal, fs = audioread_load_with_fallback(tmp_name)
+            print(f"[lambda_handler] Audio loaded - shape: {signal.shape if hasattr(signal, 'shape') else len(signal)}, sample rate: {fs}")
+        except Exception as ex:
+            print("[lambda_handler] ERROR loading audio:", repr(ex))
+            traceback.print_exc()
+            raise ValueError('Failed to load audio file. Please ensure the audio recording is valid and try again.')
+            
+    finally:
+        try:
+            os.remove(tmp_name)
+        except Exception as ex_rm:
+            print("[lambda_handler] Warning: failed to remove temp file:", tmp_name, repr(ex_rm))
+
+    # Convert to tensor and ensure proper shape
+    try:
+        if isinstance(signal, np.ndarray):
+            # If multi-channel, convert to mono by averaging
+            if signal.ndim > 1:
+                signal = np.mean(signal, axis=1)
+            
+            # Apply resampling transform if needed
+            signal_tensor = transform(torch.FloatTensor(signal)).unsqueeze(0)  # shape (1, samples)
+        else:
+            signal_tensor = transform(torch.FloatTensor(signal)).unsqueeze(0)
+            
+        print(f"[lambda_handler] Audio tensor shape: {signal_tensor.shape}")
+        
+    except Exception as ex:
+        print("[lambda_handler] ERROR converting to tensor:", repr(ex))
+        traceback.print_exc()
+        raise ValueError('Failed to process audio tensor: ' + str(ex))
+
+    # Validate audio
+    try:
+        validate_audio(signal_tensor, fs)
+    except Exception as ex:
+        print("[lambda_handler] ERROR audio validation failed:", repr(ex))
+        raise ValueError(f'Audio validation failed: {str(ex)}')
+
+    return signal_tensor
+
+
+def word_times_handler(event, context):
+    """
+    Expects: event['body'] to be a JSON string with keys:
+      - base64Audio: the audio of a lambda_handler request with word_timestamps false
+      - word_alignment: from the response to that request
+      - language: the language of that request
+
+    Any worker can answer: everything needed comes with the request.
+
+    Returns:
+      - On success: JSON string of {"start_time": "...", "end_time": "..."}
+      - On error: {"error": "<message>"}
+    """
+    try:
+        body = json.loads(event['body']) if isinstance(event.get('body'), str) else (event.get('body') or {})
+        language = body.get('language', 'en') or 'en'
+        word_alignment = body.get('word_alignment')
+
+        if language not in AVAILABLE_LANGUAGES:
+            return json.dumps({'error': f"Language '{language}' not supported by trainer."})
+        if not isinstance(word_alignment, dict) or 'mapped_words_indices' not in word_alignment:
+            return json.dumps({'error': 'No word_alignment provided'})
+
+        try:
+            signal_tensor = decode_audio(body.get('base64Audio', '') or '')
+        except ValueError as ex:
+            return json.dumps({'error': str(ex)})
+
+        word_times = pronunciationTrainer.getTrainer(language).getWordTimes(signal_tensor, word_alignment)
+        return json.dumps(word_times)
+
+    except Exception as e:
+        print("[word_times_handler] Unhandled exception:", repr(e))
+        traceback.print_exc()
+        return json.dumps({'error': 'Unhandled error: ' + str(e)})
 
 
 def audioread_load(path, offset=0.0, duration=None, dtype=np.float32):
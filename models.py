@@ -1,6 +1,7 @@
+import json
+import os
 import torch
 import torch.nn as nn
-import pickle
 from ModelInterfaces import IASRModel
 from AIModels import NeuralASR 
 
@@ -37,17 +38,40 @@ from AIModels import NeuralASR
 #         raise ValueError('Language not implemented')
 
 
-def getASRModel(language: str, use_whisper: bool = True) -> IASRModel:
+# choose a model that balances quality and speed
+WHISPER_MODEL_NAME = "openai/whisper-small"   # try "openai/whisper-medium" if you need better accuracy
+# Multilingual wav2vec2 phoneme recognizer (IPA output), for ASR_BACKEND=phoneme
+PHONEME_MODEL_NAME = "facebook/wav2vec2-lv-60-espeak-cv-ft"
+# 'transformers' (pipeline), 'onnx' (ONNX Runtime, export with: python whisper_onnx.py)
+# or 'phoneme' (phoneme CTC model, fetch with: python phoneme_ctc.py)
+ASR_BACKEND = os.environ.get("ASR_BACKEND", "transformers").lower()
+
+
+def getASRModel(language: str, use_whisper: bool = True, precision: str = None,
+                backend: str = None) -> IASRModel:
     """
     Return an IASRModel. If use_whisper is True this will return the local
-    Whisper wrapper configured to a robust model and forced language.
+    Whisper wrapper configured to a robust model and forced language. All
+    languages share one loaded Whisper model; each wrapper only fixes the
+    language it asks for. precision is 'fp32', 'int8' or 'bf16' and defaults
+    to the WHISPER_PRECISION environment variable; backend defaults to
+    ASR_BACKEND. The 'phoneme' backend recognizes IPA directly, for every
+    language, with PHONEME_MODEL_NAME.
     """
+    backend = backend or ASR_BACKEND
+    if backend == "phoneme":
+        from phoneme_ctc import PhonemeCTCASRModel, get_phoneme_model_dir
+        return PhonemeCTCASRModel(get_phoneme_model_dir(PHONEME_MODEL_NAME))
+    if use_whisper and backend == "onnx":
+        from whisper_onnx import WhisperOnnxASRModel, get_onnx_model_dir
+        return WhisperOnnxASRModel(get_onnx_model_dir(WHISPER_MODEL_NAME), force_language=language)
     if use_whisper:
-        # choose a model that balances quality and speed
-        model_name = "openai/whisper-small"   # try "openai/whisper-medium" if you need better accuracy
+        if backend != "transformers":
+            raise ValueError(f"Unknown ASR backend {backend!r}, expected 'transformers', 'onnx' or 'phoneme'")
         from whisper_wrapper import WhisperASRModel
         # pass device=-1 for CPU or device=0 for first GPU if available
-        return WhisperASRModel(model_name=model_name, force_language=language, device=-1)
+        return WhisperASRModel(model_name=WHISPER_MODEL_NAME, force_language=language, device=-1,
+                               precision=precision)
 
     if language == 'de':
         model, decoder, utils = torch.hub.load(repo_or_dir='snakers4/silero-models',
@@ -75,6 +99,25 @@ def getASRModel(language: str, use_whisper: bool = True) -> IASRModel:
         raise ValueError('Language not implemented')
 
 
+# CTC acoustic models for forced alignment, one folder per language with
+#   model.jit   - TorchScript module mapping (1, samples) 16 kHz audio to
+#                 (1, frames, labels) probabilities or logits
+#   labels.json - {"labels": [label of each output], "blank": <blank index>}
+CTC_MODEL_FOLDER = "./ctc_models/"
+
+
+def get_ctc_model_dir(language: str) -> str:
+    return os.path.join(CTC_MODEL_FOLDER, language)
+
+
+def getCTCAlignmentModel(model_dir: str) -> NeuralASR:
+    """NeuralASR for forced alignment (NeuralASR.alignReference) loaded from a local folder."""
+    model = torch.jit.load(os.path.join(model_dir, "model.jit"), map_location="cpu")
+    model.eval()
+    with open(os.path.join(model_dir, "labels.json"), encoding="utf-8") as handle:
+        config = json.load(handle)
+    return NeuralASR(model, None, labels=config["labels"], blank=config.get("blank", 0))
+
 
 def getTTSModel(language: str) -> nn.Module:
 
@@ -99,20 +142,26 @@ def getTTSModel(language: str) -> nn.Module:
     return model
 
 
+# Translation model per corpus language; English is translated into German
+# to match the shipped German/English sentence pairs (see TranslationTable.py)
+TRANSLATION_MODEL_NAMES = {
+    'de': "Helsinki-NLP/opus-mt-de-en",
+    'en': "Helsinki-NLP/opus-mt-en-de",
+    'hi': "Helsinki-NLP/opus-mt-hi-en",
+    'mr': "Helsinki-NLP/opus-mt-mr-en",
+}
+
+
 def getTranslationModel(language: str) -> nn.Module:
+    # The Hugging Face cache already keeps the downloaded weights, so the
+    # model is not pickled again on every load
     from transformers import AutoTokenizer
     from transformers import AutoModelForSeq2SeqLM
-    if language == 'de':
-        model = AutoModelForSeq2SeqLM.from_pretrained(
-            "Helsinki-NLP/opus-mt-de-en")
-        tokenizer = AutoTokenizer.from_pretrained(
-            "Helsinki-NLP/opus-mt-de-en")
-        # Cache models to avoid Hugging face processing
-        with open('translation_model_de.pickle', 'wb') as handle:
-            pickle.dump(model, handle)
-        with open('translation_tokenizer_de.pickle', 'wb') as handle:
-            pickle.dump(tokenizer, handle)
-    else:
+    if language not in TRANSLATION_MODEL_NAMES:
         raise ValueError('Language not implemented')
 
+    model = AutoModelForSeq2SeqLM.from_pretrained(TRANSLATION_MODEL_NAMES[language])
+    tokenizer = AutoTokenizer.from_pretrained(TRANSLATION_MODEL_NAMES[language])
+    model.eval()
+
     return model, tokenizer
@@ -0,0 +1,171 @@
+"""
+Phoneme recognition with a wav2vec2-style CTC model, as an IASRModel that
+outputs IPA directly instead of text.
+
+The model is read from a local folder in the Hugging Face format (config,
+weights, preprocessor_config.json and vocab.json). To fetch one once:
+    python phoneme_ctc.py                        # models.PHONEME_MODEL_NAME
+    python phoneme_ctc.py facebook/wav2vec2-lv-60-espeak-cv-ft
+
+which saves it to ./phoneme_models/<model>/. A single forward pass gives
+label logits per frame; greedy CTC decoding (best label per frame, repeats
+merged, blanks dropped) gives the phonemes and their frame spans. If the
+vocabulary has a word delimiter the phonemes are grouped into words,
+otherwise the whole recording is one word.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import numpy as np
+import torch
+from typing import Union
+from ModelInterfaces import ASRResult, IASRModel, PhonemeLocation, WordLocation
+
+PHONEME_MODEL_FOLDER = "./phoneme_models/"
+VOCABULARY_FILE = "vocab.json"
+WORD_DELIMITERS = ("|", " ")
+SAMPLE_RATE = 16000
+
+
+def get_phoneme_model_dir(model_name: str) -> str:
+    return os.path.join(PHONEME_MODEL_FOLDER, model_name.replace("/", "--"))
+
+
+def download_phoneme_model(model_name: str, output_dir: str = None) -> str:
+    """One-time copy of a Hugging Face CTC checkpoint to a local folder."""
+    from transformers import AutoFeatureExtractor, AutoModelForCTC
+    from huggingface_hub import hf_hub_download
+    import shutil
+
+    output_dir = output_dir or get_phoneme_model_dir(model_name)
+    AutoModelForCTC.from_pretrained(model_name).save_pretrained(output_dir)
+    AutoFeatureExtractor.from_pretrained(model_name).save_pretrained(output_dir)
+    shutil.copy(hf_hub_download(model_name, VOCABULARY_FILE), os.path.join(output_dir, VOCABULARY_FILE))
+    return output_dir
+
+
+def greedy_ctc_decode(logits: np.ndarray, blank: int = 0):
+    """(label IDs, first frames, end frames) of the best path with repeats merged and blanks dropped."""
+    best = logits.argmax(axis=-1)
+    starts = np.flatnonzero(np.diff(best, prepend=-1) != 0)
+    ends = np.append(starts[1:], len(best))
+    keep = best[starts] != blank
+    return best[starts][keep], starts[keep], ends[keep]
+
+
+# ─── Shared models ──────────────────────────────────────────────────────────
+class PhonemeCTC:
+    """Model, feature extractor and labels of one local phoneme CTC model."""
+
+    def __init__(self, model_dir: str) -> None:
+        if not os.path.exists(os.path.join(model_dir, VOCABULARY_FILE)):
+            raise FileNotFoundError(
+                f"No phoneme model in {model_dir} - run: python phoneme_ctc.py <model name>")
+        from transformers import AutoFeatureExtractor, AutoModelForCTC
+
+        self.model = AutoModelForCTC.from_pretrained(model_dir)
+        self.model.eval()
+        self.feature_extractor = AutoFeatureExtractor.from_pretrained(model_dir)
+        with open(os.path.join(model_dir, VOCABULARY_FILE), encoding="utf-8") as handle:
+            vocabulary = json.load(handle)
+        self.labels = [""] * (max(vocabulary.values()) + 1)
+        for label, label_id in vocabulary.items():
+            self.labels[label_id] = label
+        self.blank = self.model.config.pad_token_id
+        self.delimiters = {label_id for label, label_id in vocabulary.items() if label in WORD_DELIMITERS}
+        # <pad>, <s>, </s>, <unk> and the like are not phonemes
+        self.skipped = {label_id for label, label_id in vocabulary.items()
+                        if label.startswith("<") and label.endswith(">")}
+
+
+_models: dict = {}
+_models_lock = threading.Lock()
+
+
+def get_phoneme_ctc(model_dir: str) -> PhonemeCTC:
+    """Process-wide phoneme model for a folder, loaded on first use."""
+    with _models_lock:
+        if model_dir not in _models:
+            start = time.time()
+            _models[model_dir] = PhonemeCTC(model_dir)
+            print(f"[PhonemeCTCASRModel] Loaded {model_dir} in {time.time() - start:.1f}s")
+        return _models[model_dir]
+
+
+# ─── Model ──────────────────────────────────────────────────────────────────
+class PhonemeCTCASRModel(IASRModel):
+    """
+    IPA recognition in one non-autoregressive forward pass. transcribe()
+    sets ASRResult.ipa and phoneme_locations; the transcript is the IPA too,
+    so there is no text to convert to phonemes.
+
+    Args:
+        model_dir: local folder of the model (see get_phoneme_model_dir)
+    """
+
+    def __init__(self, model_dir: str) -> None:
+        self.sample_rate = SAMPLE_RATE
+        self.ctc = get_phoneme_ctc(model_dir)
+        self._results = threading.local()
+
+    # ------------------------------------------------------------------
+    def transcribe(self, audio: Union[np.ndarray, torch.Tensor], word_timestamps: bool = True) -> ASRResult:
+        """
+        Recognize the phonemes of 16 kHz audio shaped (1, samples) or
+        (samples,). Timings come with the same pass, so word_timestamps
+        changes nothing.
+        """
+        start = time.perf_counter()
+        if hasattr(audio, "detach"):
+            audio = audio.detach().cpu().numpy()
+        audio = np.asarray(audio, dtype=np.float32)
+        if audio.ndim == 2:
+            audio = audio[0]
+        elif audio.ndim != 1:
+            raise ValueError(f"Unexpected audio shape: {audio.shape}")
+
+        inputs = self.ctc.feature_extractor(audio, sampling_rate=self.sample_rate, return_tensors="pt")
+        with torch.inference_mode():
+            logits = self.ctc.model(inputs.input_values).logits[0].float().numpy()
+        label_ids, first_frames, end_frames = greedy_ctc_decode(logits, self.ctc.blank)
+        samples_per_frame = len(audio) / max(logits.shape[0], 1)
+
+        phonemes, words = [], [[]]
+        for label_id, first_frame, end_frame in zip(label_ids, first_frames, end_frames):
+            if label_id in self.ctc.delimiters:
+                words.append([])
+            elif label_id not in self.ctc.skipped:
+                phonemes.append(PhonemeLocation(self.ctc.labels[label_id], float(first_frame * samples_per_frame),
+                                                float(end_frame * samples_per_frame)))
+                words[-1].append(phonemes[-1])
+        word_locations = tuple(WordLocation("".join(phoneme.phoneme for phoneme in word),
+                                            word[0].start_ts, word[-1].end_ts) for word in words if word)
+        ipa = " ".join(word.word for word in word_locations)
+        return ASRResult(ipa, word_locations, time.perf_counter() - start,
+                         ipa=ipa, phoneme_locations=tuple(phonemes))
+
+    def processAudio(self, audio: Union[np.ndarray, torch.Tensor]):
+        """Recognize audio and keep the result for getTranscript/getWordLocations of this thread."""
+        self._results.last = self.transcribe(audio)
+
+    def getTranscript(self) -> str:
+        result = getattr(self._results, "last", None)
+        return result.transcript if result else ""
+
+    def getWordLocations(self) -> list:
+        result = getattr(self._results, "last", None)
+        return [location._asdict() for location in result.word_locations] if result else []
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        _model_name = sys.argv[1]
+    else:
+        import models
+        _model_name = models.PHONEME_MODEL_NAME
+    _start = time.time()
+    print(f"[phoneme_ctc] Saved {_model_name} to {download_phoneme_model(_model_name)} "
+          f"in {time.time() - _start:.0f}s")
@@ -6,15 +6,19 @@ import WordMatching as wm
 import ModelInterfaces as mi
 import AIModels
 import RuleBasedModels
+import PhonemeInventory
+import CorpusIndex
+import os
 from string import punctuation
+import threading
 import time
-import difflib
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Module-level trainer cache — one trainer per language, loaded lazily.
 # This prevents reloading the heavy Whisper model on every HTTP request.
 # ─────────────────────────────────────────────────────────────────────────────
 _trainer_cache: dict = {}
+_trainer_cache_lock = threading.Lock()
 
 
 def getTrainer(language: str) -> "PronunciationTrainer":
@@ -23,24 +27,33 @@ def getTrainer(language: str) -> "PronunciationTrainer":
     Constructs and caches on first call per language; subsequent calls are O(1).
     """
     if language not in _trainer_cache:
-        _trainer_cache[language] = _buildTrainer(language)
+        with _trainer_cache_lock:
+            if language not in _trainer_cache:
+                _trainer_cache[language] = _buildTrainer(language)
     return _trainer_cache[language]
 
 
 def _buildTrainer(language: str) -> "PronunciationTrainer":
     """Internal factory — only called once per language."""
+    if language not in ("en", "hi", "mr"):
+        raise ValueError(f"Language not supported: {language!r}")
+
     asr_model = mo.getASRModel(language, use_whisper=True)
+    # Cached converter: reference words and transcripts repeat a lot
+    phonem_converter = RuleBasedModels.get_phonem_converter(language)
+
+    # Optional CTC model for forced-alignment scoring
+    ctc_model_dir = mo.get_ctc_model_dir(language)
+    aligner = mo.getCTCAlignmentModel(ctc_model_dir) if os.path.isdir(ctc_model_dir) else None
+
+    return PronunciationTrainer(asr_model, phonem_converter,
+                                PhonemeInventory.get_phoneme_inventory(language),
+                                CorpusIndex.load_corpus_index(language), aligner)
 
-    if language == "en":
-        phonem_converter = RuleBasedModels.EngPhonemConverter()
-    elif language == "hi":
-        phonem_converter = RuleBasedModels.HindiIPA()
-    elif language == "mr":
-        phonem_converter = RuleBasedModels.MarathiIPA()
-    else:
-        raise ValueError(f"Language not supported: {language!r}")
 
-    return PronunciationTrainer(asr_model, phonem_converter)
+# With REFERENCE_GUIDED_ASR=1 the expected sentence is used as a decoding
+# draft for recordings of a given text (see IASRModel.transcribeWithReference)
+REFERENCE_GUIDED_ASR = os.environ.get("REFERENCE_GUIDED_ASR", "0") == "1"
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -51,18 +64,13 @@ class PronunciationTrainer:
     Changes vs. original:
     - categories_thresholds corrected to [80, 60, 40] (was [80, 60, 59] — a
       near-identical pair that made the 'medium' and 'poor' categories overlap).
-    - getPronunciationAccuracy and fuzzy_map_words are proper instance methods.
+    - getPronunciationAccuracy is a proper instance method.
     - preprocessAudio guards against near-silence to avoid divide-by-zero.
+    - No per-request state is kept on the trainer or the ASR model (the
+      ASRResult of IASRModel.transcribe is passed along), so one cached
+      trainer can serve concurrent requests.
     """
 
-    current_transcript: str
-    current_ipa: str
-    current_recorded_audio: torch.Tensor
-    current_recorded_transcript: str
-    current_recorded_word_locations: list
-    current_recorded_intonations: torch.Tensor
-    current_words_pronunciation_accuracy: list
-
     # Thresholds: if accuracy ≥ threshold → category 0 (good),
     #             if accuracy ≥ next → category 1 (ok), else → category 2 (bad)
     #   Fixed: was [80, 60, 59] which made ok/bad nearly identical.
@@ -74,28 +82,217 @@ class PronunciationTrainer:
         self,
         asr_model: mi.IASRModel,
         word_to_ipa_converter: mi.ITextToPhonemModel,
+        phoneme_inventory: PhonemeInventory.PhonemeInventory = None,
+        corpus_index: CorpusIndex.CorpusIndex = None,
+        aligner: AIModels.NeuralASR = None,
     ) -> None:
         self.asr_model = asr_model
         self.ipa_converter = word_to_ipa_converter
+        self.phoneme_inventory = phoneme_inventory or PhonemeInventory.PhonemeInventory("")
+        self.corpus_index = corpus_index
+        self.aligner = aligner
+        self.reference_guided = REFERENCE_GUIDED_ASR
 
     # ── Main entry point ────────────────────────────────────────────────────
     def processAudioForGivenText(
         self,
         recordedAudio: torch.Tensor = None,
         real_text: str = None,
+        word_timestamps: bool = True,
     ) -> dict:
+        """
+        Score a recording of real_text. With word_timestamps=False the word
+        start/end times are left empty and the result has a 'word_alignment'
+        to pass to getWordTimes, with the same audio, instead.
+        """
+        t0 = time.time()
+        audio = self.preprocessAudio(recordedAudio)
+        asr_result = self.transcribeAudio(audio, word_timestamps, real_text)
+        print(f"[PT] ASR time: {time.time()-t0:.2f}s")
+
+        # Phoneme backends are scored on what was heard, not on a transcript
+        if asr_result.ipa is not None:
+            return self.scoreRecognizedPhonemes(real_text, asr_result, audio.shape[1])
+
+        recording_transcript, recording_ipa, word_locations = self.getAudioTranscript(
+            audio, word_timestamps, asr_result=asr_result)
+        result = self.scoreTranscript(real_text, recording_transcript, recording_ipa, word_locations)
+        return self.keepForWordTimes(asr_result, result, word_timestamps)
+
+    def processAudioForOpenReading(self, recordedAudio: torch.Tensor, word_timestamps: bool = True) -> dict:
+        """
+        Score a recording of any corpus sentence: the sentence is identified
+        from the transcript (see CorpusIndex.identifySentence). Returns None
+        when no corpus sentence matches. Phoneme backends give no transcript
+        to identify the sentence from, so they are not supported.
+        """
+        if self.corpus_index is None:
+            raise RuntimeError("Open reading needs the corpus index (python CorpusIndex.py)")
+
         t0 = time.time()
-        recording_transcript, recording_ipa, word_locations = self.getAudioTranscript(recordedAudio)
+        audio = self.preprocessAudio(recordedAudio)
+        asr_result = self.transcribeAudio(audio, word_timestamps)
+        if asr_result.ipa is not None:
+            raise RuntimeError("Open reading needs a text ASR backend; the phoneme backend only outputs IPA")
+        recording_transcript, recording_ipa, word_locations = self.getAudioTranscript(
+            audio, word_timestamps, asr_result=asr_result)
         print(f"[PT] ASR time: {time.time()-t0:.2f}s")
 
+        sentence_id, word_error_rate = self.corpus_index.identifySentence(recording_transcript)
+        if sentence_id < 0:
+            print(f"[PT WARN] No corpus sentence matches transcript {recording_transcript!r}")
+            return None
+        real_text = self.corpus_index.getSentence(sentence_id)
+        print(f"[PT] Open reading: sentence {sentence_id} (WER {word_error_rate:.2f})")
+
+        result = self.scoreTranscript(real_text, recording_transcript, recording_ipa, word_locations)
+        result["real_text"] = real_text
+        result["sentence_id"] = sentence_id
+        return self.keepForWordTimes(asr_result, result, word_timestamps)
+
+    def processAudioWithForcedAlignment(self, recordedAudio: torch.Tensor, real_text: str) -> dict:
+        """
+        Score a recording of real_text by CTC forced alignment: no transcript
+        is decoded, every reference word gets its span and the aligner's
+        posterior confidence, which is used as its accuracy. Words in the
+        'bad' category count as not heard.
+        """
+        if self.aligner is None:
+            raise RuntimeError("Forced alignment needs a CTC model (see models.getCTCAlignmentModel)")
+
+        t0 = time.time()
+        audio = self.preprocessAudio(recordedAudio)
+        words_real, words_real_ipa = self.getReferenceWords(real_text)
+        alignment = self.aligner.alignReference(audio, " ".join(words_real))
+        print(f"[PT] Forced alignment time: {time.time()-t0:.2f}s")
+
+        accuracies = [100.0 * word["confidence"] for word in alignment]
+        categories = self.getWordsPronunciationCategory(accuracies)
+        mapped_words = self.getHeardWords(words_real, categories)
+        phoneme_counts = [max(len(self.phoneme_inventory.encode((ipa or "").lower())), 1) for ipa in words_real_ipa]
+        start_time, end_time = self.getWordLocationsFromRecordInSeconds(
+            [(word["start_ts"], word["end_ts"]) for word in alignment], range(len(alignment)))
+
+        return {
+            "recording_transcript":         " ".join(word for word in mapped_words if word != "-"),
+            "real_and_transcribed_words":   list(zip(words_real, mapped_words)),
+            "recording_ipa":                " ".join(ipa for ipa, word in zip(words_real_ipa, mapped_words)
+                                                     if word != "-"),
+            "start_time":                   start_time,
+            "end_time":                     end_time,
+            "real_and_transcribed_words_ipa": [(ipa, ipa if word != "-" else "-")
+                                               for ipa, word in zip(words_real_ipa, mapped_words)],
+            "pronunciation_accuracy":       float(np.round(np.average(accuracies, weights=phoneme_counts)))
+                                            if accuracies else 0.0,
+            "pronunciation_categories":     categories,
+            "mapped_words_indices":         list(range(len(words_real))),
+            "word_confidences":             [word["confidence"] for word in alignment],
+        }
+
+    def scoreRecognizedPhonemes(self, real_text: str, asr_result: mi.ASRResult, audio_length_in_samples: int) -> dict:
+        """
+        Score the phonemes of a backend that recognizes IPA directly (see
+        ASRResult.ipa): every recognized phoneme is assigned to a reference
+        word by a phoneme-level alignment to the whole sentence, so no
+        transcript is converted to IPA. The recognizer's IPA is respelled in
+        the converter's conventions first (see
+        PhonemeInventory.respellRecognized). Words in the 'bad' category
+        count as not heard; word times span the word's recognized phonemes.
+        """
+        t0 = time.time()
+        words_real, words_real_ipa = self.getReferenceWords(real_text)
+        phonemes, phoneme_spans = [], []
+        for location in asr_result.phoneme_locations:
+            respelled = self.phoneme_inventory.respellRecognized(location.phoneme.lower())
+            for phoneme in self.phoneme_inventory.tokenize(respelled):
+                phonemes.append(phoneme)
+                phoneme_spans.append((location.start_ts, location.end_ts))
+        real_codes = [self.phoneme_inventory.encode((ipa or "").lower()) for ipa in words_real_ipa]
+        word_indices = wm.get_phoneme_word_indices(
+            real_codes, np.concatenate([self.phoneme_inventory.encode(phoneme) for phoneme in phonemes] or
+                                       [np.zeros(0, dtype=np.int32)]),
+            self.phoneme_inventory.substitutionCosts())
+        print(f"[PT] Phoneme matching time: {time.time()-t0:.2f}s")
+
+        heard_ipa = [[] for _ in words_real]
+        spans = [[] for _ in words_real]
+        for phoneme, span, word_idx in zip(phonemes, phoneme_spans, word_indices):
+            heard_ipa[word_idx].append(phoneme)
+            spans[word_idx].append(span)
+        real_and_transcribed_words_ipa = [(ipa, "".join(heard) or "-")
+                                          for ipa, heard in zip(words_real_ipa, heard_ipa)]
+
+        pronunciation_accuracy, accuracies = self.getPronunciationAccuracy(real_and_transcribed_words_ipa)
+        categories = self.getWordsPronunciationCategory(accuracies)
+        mapped_words = self.getHeardWords(words_real, categories)
+
+        fade = int(0.05 * self.sampling_rate)
+        word_locations = [(max(0, int(min(start for start, _ in word_spans)) - fade),
+                           min(audio_length_in_samples - 1, int(max(end for _, end in word_spans)) + fade))
+                          for word_spans in spans if word_spans]
+        mapped_words_indices, located = [], 0
+        for word_spans in spans:
+            mapped_words_indices.append(located if word_spans else -1)
+            located += bool(word_spans)
+        start_time, end_time = self.getWordLocationsFromRecordInSeconds(word_locations, mapped_words_indices)
+
+        return {
+            "recording_transcript":         asr_result.ipa,
+            "real_and_transcribed_words":   list(zip(words_real, mapped_words)),
+            "recording_ipa":                asr_result.ipa,
+            "start_time":                   start_time,
+            "end_time":                     end_time,
+            "real_and_transcribed_words_ipa": real_and_transcribed_words_ipa,
+            "pronunciation_accuracy":       pronunciation_accuracy,
+            "pronunciation_categories":     categories,
+            "mapped_words_indices":         mapped_words_indices,
+        }
+
+    def getHeardWords(self, words_real: list, categories: list) -> list:
+        """Reference words as heard, '-' for those in the 'bad' category."""
+        return [word if category != 2 else "-" for word, category in zip(words_real, categories)]
+
+    def keepForWordTimes(self, asr_result: mi.ASRResult, result: dict, word_timestamps: bool) -> dict:
+        """
+        Everything getWordTimes needs besides the audio goes into the result,
+        so any worker can answer the request (nothing is kept here).
+        """
+        if not word_timestamps:
+            result["word_alignment"] = {"tokens": list(asr_result.tokens),
+                                        "mapped_words_indices": result["mapped_words_indices"]}
+        return result
+
+    def getWordTimes(self, recordedAudio: torch.Tensor, word_alignment: dict) -> dict:
+        """
+        Start and end times (seconds, space separated) of the reference words
+        of a recording scored with word_timestamps=False, from the
+        'word_alignment' of its result. The decoded tokens are timed without
+        decoding the audio again if the ASR model supports it (see
+        IASRModel.alignWords).
+        """
+        audio = self.preprocessAudio(recordedAudio)
+        # JSON turns the (first, last) pairs of merged words into lists
+        mapped_words_indices = [tuple(idx) if isinstance(idx, list) else idx
+                                for idx in word_alignment["mapped_words_indices"]]
+
+        t0 = time.time()
+        asr_result = mi.ASRResult("", self.asr_model.alignWords(audio, tuple(word_alignment.get("tokens") or ())))
+        _, word_locations = self.getTranscriptAndWordsLocations(audio.shape[1], asr_result)
+        print(f"[PT] Word timestamps time: {time.time()-t0:.2f}s")
+
+        start_time, end_time = self.getWordLocationsFromRecordInSeconds(word_locations, mapped_words_indices)
+        return {"start_time": start_time, "end_time": end_time}
+
+    def scoreTranscript(self, real_text: str, recording_transcript: str, recording_ipa: str,
+                        word_locations: list = None) -> dict:
+        """Scores of a transcript; start/end times are left empty without word_locations."""
         t0 = time.time()
         real_and_transcribed_words, real_and_transcribed_words_ipa, mapped_words_indices = \
             self.matchSampleAndRecordedWords(real_text, recording_transcript)
         print(f"[PT] Matching time: {time.time()-t0:.2f}s")
 
-        start_time, end_time = self.getWordLocationsFromRecordInSeconds(
-            word_locations, mapped_words_indices
-        )
+        start_time, end_time = ("", "") if word_locations is None else \
+            self.getWordLocationsFromRecordInSeconds(word_locations, mapped_words_indices)
 
         pronunciation_accuracy, current_words_pronunciation_accuracy = \
             self.getPronunciationAccuracy(real_and_transcribed_words_ipa)
@@ -113,126 +310,130 @@ class PronunciationTrainer:
             "real_and_transcribed_words_ipa": real_and_transcribed_words_ipa,
             "pronunciation_accuracy":       pronunciation_accuracy,
             "pronunciation_categories":     pronunciation_categories,
+            "mapped_words_indices":         mapped_words_indices,
         }
 
     # ── ASR ─────────────────────────────────────────────────────────────────
-    def getAudioTranscript(self, recordedAudio: torch.Tensor):
-        audio = self.preprocessAudio(recordedAudio)
-        self.asr_model.processAudio(audio)
-        transcript, word_locations = self.getTranscriptAndWordsLocations(audio.shape[1])
-        ipa = self.ipa_converter.convertToPhonem(transcript)
-        return transcript, ipa, word_locations
-
-    def getTranscriptAndWordsLocations(self, audio_length_in_samples: int):
-        transcript = self.asr_model.getTranscript()
-        raw_locations = self.asr_model.getWordLocations()
+    def transcribeAudio(self, audio: torch.Tensor, word_timestamps: bool = True,
+                        reference_text: str = None) -> mi.ASRResult:
+        """ASR result of preprocessed audio, reference-guided if enabled and the text is known."""
+        if self.reference_guided and reference_text:
+            return self.asr_model.transcribeWithReference(audio, reference_text, word_timestamps=word_timestamps)
+        return self.asr_model.transcribe(audio, word_timestamps=word_timestamps)
+
+    def getAudioTranscript(self, audio: torch.Tensor, word_timestamps: bool = True, reference_text: str = None,
+                           asr_result: mi.ASRResult = None):
+        """
+        Transcript, IPA and word locations of preprocessed audio (locations
+        None if not requested). The IPA is the backend's own when it
+        recognizes phonemes, otherwise the transcript's.
+        """
+        if asr_result is None:
+            asr_result = self.transcribeAudio(audio, word_timestamps, reference_text)
+        transcript, word_locations = self.getTranscriptAndWordsLocations(audio.shape[1], asr_result)
+        ipa = asr_result.ipa if asr_result.ipa is not None else self.ipa_converter.convertToPhonem(transcript)
+        return transcript, ipa, word_locations if word_timestamps else None
 
+    def getTranscriptAndWordsLocations(self, audio_length_in_samples: int, asr_result: mi.ASRResult):
         fade = int(0.05 * self.sampling_rate)
         word_locations = [
             (
-                max(0, int(w["start_ts"]) - fade),
-                min(audio_length_in_samples - 1, int(w["end_ts"]) + fade),
+                max(0, int(w.start_ts) - fade),
+                min(audio_length_in_samples - 1, int(w.end_ts) + fade),
             )
-            for w in raw_locations
+            for w in asr_result.word_locations
         ]
-        return transcript, word_locations
+        return asr_result.transcript, word_locations
 
     # ── Matching ─────────────────────────────────────────────────────────────
+    def getReferenceWords(self, real_text: str):
+        """Words of the reference text and their IPA, precomputed if it is a corpus sentence."""
+        if self.corpus_index is not None and real_text:
+            sentence_id = self.corpus_index.findSentence(real_text)
+            if sentence_id >= 0:
+                return (self.corpus_index.getWords(sentence_id),
+                        self.corpus_index.getWordsIpa(sentence_id))
+        words_real = real_text.split() if real_text else []
+        return words_real, self.ipa_converter.convertToPhonemBatch(words_real)
+
     def matchSampleAndRecordedWords(self, real_text: str, recorded_transcript: str):
         words_estimated = recorded_transcript.split()
-        words_real = real_text.split() if real_text else getattr(self, "current_transcript", [""])[0].split()
+        words_real, words_real_ipa = self.getReferenceWords(real_text)
 
-        # Primary: DTW word alignment
+        # Primary: monotone word alignment
         try:
             mapped_words, mapped_words_indices = wm.get_best_mapped_words(
                 words_estimated, words_real
             )
         except Exception as ex:
-            print(f"[PT WARN] DTW mapping failed: {ex!r}")
+            print(f"[PT WARN] word alignment failed: {ex!r}")
             mapped_words = ["-"] * len(words_real)
             mapped_words_indices = [0] * len(words_real)
 
-        # Fallback: fuzzy mapping when DTW leaves too many gaps
+        # Fallback: fuzzy mapping when the alignment leaves too many gaps
         gap_fraction = sum(1 for w in mapped_words if w == "-") / max(1, len(mapped_words))
         if gap_fraction > 0.4 or len(mapped_words) < len(words_real):
             print("[PT WARN] Many gaps — using fuzzy fallback")
-            mapped_words = self._fuzzy_map_words(words_estimated, words_real)
-            mapped_words_indices = self._build_index_list(mapped_words, words_estimated)
+            mapped_words, mapped_words_indices = wm.get_fuzzy_mapped_words(
+                words_estimated, words_real)
 
         # Build output pairs
         real_and_transcribed_words = []
         real_and_transcribed_words_ipa = []
 
-        for i, real_word in enumerate(words_real):
-            mapped = mapped_words[i] if i < len(mapped_words) else "-"
-            real_ipa   = self.ipa_converter.convertToPhonem(real_word)
-            mapped_ipa = self.ipa_converter.convertToPhonem(mapped) if mapped != "-" else "-"
+        mapped_words = [mapped_words[i] if i < len(mapped_words) else "-"
+                        for i in range(len(words_real))]
+        # Merged words ("can not") are converted word by word and joined again
+        found_words = [mapped.split() for mapped in mapped_words if mapped != "-"]
+        found_parts_ipa = iter(self.ipa_converter.convertToPhonemBatch(
+            [part for parts in found_words for part in parts]))
+        found_words_ipa = iter([" ".join(next(found_parts_ipa) for _ in parts) for parts in found_words])
+
+        for real_word, real_ipa, mapped in zip(words_real, words_real_ipa, mapped_words):
+            mapped_ipa = next(found_words_ipa) if mapped != "-" else "-"
             real_and_transcribed_words.append((real_word, mapped))
             real_and_transcribed_words_ipa.append((real_ipa, mapped_ipa))
 
         return real_and_transcribed_words, real_and_transcribed_words_ipa, mapped_words_indices
 
-    def _fuzzy_map_words(self, estimated_words: list, real_words: list, cutoff: float = 0.35) -> list:
-        """Map each real word to the best-matching estimated word by string similarity."""
-        mapped = []
-        for real in real_words:
-            best, best_score = "-", 0.0
-            for est in estimated_words:
-                score = difflib.SequenceMatcher(None, real.lower(), est.lower()).ratio()
-                if score > best_score:
-                    best, best_score = est, score
-            mapped.append(best if best_score >= cutoff else "-")
-        return mapped
-
-    def _build_index_list(self, mapped_words: list, estimated_words: list) -> list:
-        """For each mapped word, find its index in estimated_words (monotone search)."""
-        indices = []
-        last = 0
-        for mw in mapped_words:
-            if mw == "-" or not estimated_words:
-                indices.append(0)
-                continue
-            idx = next(
-                (i for i in range(last, len(estimated_words)) if estimated_words[i].lower() == mw.lower()),
-                next(
-                    (i for i in range(0, last) if estimated_words[i].lower() == mw.lower()),
-                    0,
-                ),
-            )
-            indices.append(idx)
-            last = max(0, idx)
-        return indices
-
     # ── Accuracy ─────────────────────────────────────────────────────────────
     def getPronunciationAccuracy(self, real_and_transcribed_words_ipa: list):
         """
         Compute overall and per-word pronunciation accuracy (phoneme edit distance).
         Returns (overall_pct_float, [per_word_pct, ...]).
+
+        IPA is split into phonemes by the language's PhonemeInventory, so a
+        phoneme written with several code points (diacritics, length marks,
+        affricates) counts once, and substituting a similar phoneme costs less
+        than a full mismatch.
         """
         total_mismatches = 0.0
         total_phonemes = 0
         per_word = []
 
+        real_codes, trans_codes = [], []
         for real_ipa_raw, trans_ipa_raw in real_and_transcribed_words_ipa:
-            real_ipa  = self.removePunctuation(real_ipa_raw or "").lower()
-            trans_ipa = self.removePunctuation(trans_ipa_raw or "").lower()
+            real_codes.append(self.phoneme_inventory.encode((real_ipa_raw or "").lower()))
+            trans_codes.append(self.phoneme_inventory.encode((trans_ipa_raw or "").lower()))
 
-            if not real_ipa:
+        # One batched call for the whole sentence instead of one DP per word.
+        # Inserted phonemes count in the sentence score, so the distances are
+        # exact (no max_k); only the per-word accuracy is clipped at 0.
+        all_mismatches = WordMetrics.weighted_edit_distance_paired(
+            real_codes, trans_codes, self.phoneme_inventory.substitutionCosts())
+
+        for codes, mismatches in zip(real_codes, all_mismatches):
+            if len(codes) == 0:
                 per_word.append(0.0)
                 continue
 
-            try:
-                mismatches = WordMetrics.edit_distance_python(real_ipa, trans_ipa)
-            except Exception as ex:
-                print(f"[PT WARN] edit_distance failed for '{real_ipa}'/'{trans_ipa}': {ex!r}")
-                mismatches = max(len(real_ipa), len(trans_ipa))
-
-            n = len(real_ipa)
+            n = len(codes)
+            mismatches = float(mismatches)
             total_phonemes   += n
             total_mismatches += mismatches
 
             word_acc = max(0.0, min(100.0, (n - mismatches) / n * 100.0))
-            per_word.append(word_acc)
+            per_word.append(float(word_acc))
 
         if total_phonemes == 0:
             overall = 0.0
@@ -263,9 +464,14 @@ class PronunciationTrainer:
 
     # ── Timing ──────────────────────────────────────────────────────────────
     def getWordLocationsFromRecordInSeconds(self, word_locations: list, mapped_indices: list):
+        """Start/end times of the mapped words; a (first, last) index pair spans both words."""
         start_list, end_list = [], []
         for idx in mapped_indices:
-            loc = word_locations[idx] if 0 <= idx < len(word_locations) else (0, 0)
+            first, last = idx if isinstance(idx, tuple) else (idx, idx)
+            if 0 <= first <= last < len(word_locations):
+                loc = (word_locations[first][0], word_locations[last][1])
+            else:
+                loc = (0, 0)
             start_list.append(loc[0] / self.sampling_rate)
             end_list.append(loc[1]   / self.sampling_rate)
         return (
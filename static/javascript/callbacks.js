@@ -35,7 +35,16 @@ let matched_transcripts_ipa = [];
 let wordCategories = [];
 let startTime = '';
 let endTime   = '';
+// With lazyWordTimes the recording is scored without word times, which are
+// fetched on the first word replay instead (see fetchWordTimes)
+const lazyWordTimes = false;
+let wordAlignment = null;
+let recordedAudioBase64 = null;
 let AILanguage = 'en';
+// Lets /getSample walk a shuffled permutation instead of repeating sentences
+const sampleSessionId = (window.crypto && crypto.randomUUID)
+  ? crypto.randomUUID()
+  : Date.now().toString(36) + Math.random().toString(36).slice(2);
 
 const STScoreAPIKey  = 'rll5QsTiv83nti99BW6uCmvs9BDVxSB39SVFceYb';
 const apiMainPathSample = '';
@@ -285,6 +294,17 @@ function trackWordMistakes(words, realIpas, spokenIpas, categories, language) {
   saveWordMistakes(records);
 }
 
+/** Words most often mispronounced in this language, for practice sampling */
+function getPracticeWords(language, limit = 5) {
+  const counts = {};
+  for (const record of loadWordMistakes()) {
+    if (record.language !== language || record.category !== 2 || !record.word) continue;
+    const word = record.word.toLowerCase();
+    counts[word] = (counts[word] || 0) + 1;
+  }
+  return Object.keys(counts).sort((a, b) => counts[b] - counts[a]).slice(0, limit);
+}
+
 // ─── Mic Visualizer ──────────────────────────────────────────────
 function initMicVisualizer(micStream) {
   vizCanvas = document.getElementById('micVisualizer');
@@ -471,13 +491,19 @@ const getNextSample = async () => {
   else if (document.getElementById('lengthCat3')?.checked) { sample_difficult = 2; scoreMultiplier = 1.3; }
   else if (document.getElementById('lengthCat4')?.checked) { sample_difficult = 3; scoreMultiplier = 1.6; }
 
+  const practiceWords = document.getElementById('lengthCat5')?.checked ? getPracticeWords(AILanguage) : [];
+  if (practiceWords.length) { sample_difficult = 0; scoreMultiplier = 1.3; }
+
   try {
     setStatus('Fetching sample…', 'processing');
 
     const res = await fetch((apiMainPathSample || '') + '/getSample', {
       method:  'POST',
       headers: { 'Content-Type': 'application/json', 'X-Api-Key': STScoreAPIKey },
-      body:    JSON.stringify({ category: sample_difficult.toString(), language: AILanguage }),
+      body:    JSON.stringify({
+        category: sample_difficult.toString(), language: AILanguage,
+        session_id: sampleSessionId, practice_words: practiceWords,
+      }),
     });
 
     const text = await res.text();
@@ -695,7 +721,9 @@ const startMediaDevice = async () => {
         const res = await fetch(apiMainPathSTS + '/GetAccuracyFromRecordedAudio', {
           method:  'POST',
           headers: { 'Content-Type': 'application/json', 'X-Api-Key': STScoreAPIKey },
-          body:    JSON.stringify({ title: titleToSend, base64Audio: audioBase64, language: AILanguage }),
+          body:    JSON.stringify({
+            title: titleToSend, base64Audio: audioBase64, language: AILanguage, word_timestamps: !lazyWordTimes,
+          }),
         });
 
         const data = await res.json();
@@ -725,6 +753,8 @@ const startMediaDevice = async () => {
         lettersOfWordAreCorrect = (data.is_letter_correct_all_words || '').split(' ');
         startTime = data.start_time || '';
         endTime   = data.end_time   || '';
+        wordAlignment = data.word_alignment || null;
+        recordedAudioBase64 = wordAlignment ? audioBase64 : null;
         real_transcripts_ipa    = (data.real_transcripts_ipa    || '').split(' ');
         matched_transcripts_ipa = (data.matched_transcripts_ipa || '').split(' ');
         wordCategories          = (data.pair_accuracy_category  || '').split(' ');
@@ -825,7 +855,25 @@ const playCurrentWord  = (word_idx) => {
   if (word_idx < words.length) playWithMozillaApi(words[word_idx]);
 };
 
-const playRecordedWord = (word_idx) => {
+const fetchWordTimes = async () => {
+  if (startTime || !wordAlignment) return;
+  try {
+    const res = await fetch(apiMainPathSTS + '/getWordTimes', {
+      method:  'POST',
+      headers: { 'Content-Type': 'application/json', 'X-Api-Key': STScoreAPIKey },
+      body:    JSON.stringify({
+        base64Audio: recordedAudioBase64, word_alignment: wordAlignment, language: AILanguage,
+      }),
+    });
+    const data = await res.json();
+    if (data.error) throw new Error(data.error);
+    startTime = data.start_time || '';
+    endTime   = data.end_time   || '';
+  } catch (err) { console.error('[fetchWordTimes]', err); }
+};
+
+const playRecordedWord = async (word_idx) => {
+  await fetchWordTimes();
   const s = parseFloat((startTime || '').split(' ')[word_idx] || 0);
   const e = parseFloat((endTime   || '').split(' ')[word_idx] || 0);
   playRecording(s, e);
@@ -5,11 +5,38 @@ import lambdaGetSample
 import RuleBasedModels
 import epitran
 import json
-import pronunciationTrainer
-
-
-def test_category(category: int, threshold_min: int, threshold_max: int):
-    event = {'body': json.dumps({'category': category, 'language': 'de'})}
+import WordMetrics
+import WordMatching
+import PhonemeInventory
+import CorpusIndex
+import ForcedAlignment
+import TranslationTable
+import numpy as np
+import threading
+import time
+import os
+import tempfile
+import types
+import unittest.mock
+
+# Scoring and ASR tests need the ML stack; the others run without it
+try:
+    import torch
+    import pronunciationTrainer
+    import models
+except ImportError:
+    torch = None
+try:
+    import whisper_wrapper
+except ImportError:
+    whisper_wrapper = None
+
+requires_torch = unittest.skipUnless(torch, 'needs torch')
+requires_whisper = unittest.skipUnless(whisper_wrapper, 'needs torch and transformers')
+
+
+def category_of(category: int, threshold_min: int, threshold_max: int):
+    event = {'body': json.dumps({'category': category, 'language': 'en'})}
     for _ in range(1000):
         response = lambdaGetSample.lambda_handler(event, [])
         response_dict = json.loads(response)
@@ -27,17 +54,36 @@ class TestDataset(unittest.TestCase):
 
     def test_random_sentences(self):
 
-        self.assertFalse(test_category(0, 0, 8))
+        self.assertFalse(category_of(0, 0, 8))
 
     def test_easy_sentences(self):
 
-        self.assertTrue(test_category(1, 0, 8))
+        self.assertTrue(category_of(1, 0, 8))
 
     def test_normal_sentences(self):
-        self.assertTrue(test_category(2, 8, 20))
+        self.assertTrue(category_of(2, 8, 20))
 
     def test_hard_sentences(self):
-        self.assertTrue(test_category(3, 20, 10000))
+        self.assertTrue(category_of(3, 20, 10000))
+
+    def test_empty_corpus_gives_an_error_body(self):
+        empty = [np.zeros(0, dtype=np.int64)] * lambdaGetSample.NUMBER_OF_CATEGORIES
+        with unittest.mock.patch.dict(lambdaGetSample.lambda_category_indices, {'en': empty}):
+            response = json.loads(lambdaGetSample.lambda_handler(
+                {'body': json.dumps({'category': 2, 'language': 'en'})}, []))
+
+        self.assertEqual(response, {'error': 'Could not find a matching sentence.'})
+
+    def test_session_sampler_has_no_repeats(self):
+        sampler = lambdaGetSample.SessionSampler(max_sessions=2)
+        indices = lambdaGetSample.np.array([3, 5, 7, 11])
+
+        first_round = [sampler.sample('a', 'en', 1, indices) for _ in range(4)]
+        self.assertEqual(sorted(first_round), [3, 5, 7, 11])
+
+        sampler.sample('b', 'en', 1, indices)
+        sampler.sample('c', 'en', 1, indices)
+        self.assertEqual(len(sampler.sessions), 2)
 
 
 def check_phonem_converter(converter: ModelInterfaces.ITextToPhonemModel, input: str, expected_output: str):
@@ -62,22 +108,737 @@ class TestPhonemConverter(unittest.TestCase):
             epitran.Epitran('deu-Latn'))
 
         self.assertTrue(check_phonem_converter(
-            phonem_converter, 'Hallo, das ist ein Test', 'haloː, dɑːs ɪst ain tɛst'))
+            phonem_converter, 'Hallo, das ist ein Test', 'haloː, daːs ɪst aɪ̯n tɛst'))
+
+    def test_english_batch(self):
+        phonem_converter = RuleBasedModels.EngPhonemConverter()
+        self.assertEqual(phonem_converter.convertToPhonemBatch(['Hello,', 'this', 'xyzzy']),
+                         ['hɛˈloʊ,', 'ðɪs', 'xyzzy'])
+
+    def test_cached_converter(self):
+        phonem_converter = RuleBasedModels.CachedPhonemConverter(
+            RuleBasedModels.EngPhonemConverter(), 'en', case_sensitive=False)
+
+        self.assertTrue(check_phonem_converter(
+            phonem_converter, 'Hello, this is a test', 'hɛˈloʊ, ðɪs ɪz ə tɛst'))
+        self.assertTrue(check_phonem_converter(
+            phonem_converter, 'This is', 'ðɪs ɪz'))
+
+        stats = phonem_converter.getStats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 5))
+
+    def test_converter_registry_is_shared(self):
+        phonem_converter = RuleBasedModels.get_phonem_converter('en')
+        self.assertIs(RuleBasedModels.get_phonem_converter('en'), phonem_converter)
+        self.assertIs(RuleBasedModels.get_epitran('hin-Deva'), RuleBasedModels.get_epitran('hin-Deva'))
+        self.assertIn('load_time_s', RuleBasedModels.get_phonem_converter_stats()['en'])
+
+
+
+class TestWordMetrics(unittest.TestCase):
+
+    def test_distance_matrix_matches_reference(self):
+        words_a = ['ich', 'habe', 'sehr', '', 'glück,', 'gesund']
+        words_b = ['ic', 'hab', 'zeh', 'viel', 'guck', '']
+        distances = WordMetrics.edit_distance_matrix(words_a, words_b)
+
+        for idx_a, word_a in enumerate(words_a):
+            for idx_b, word_b in enumerate(words_b):
+                self.assertEqual(distances[idx_a, idx_b],
+                                 WordMetrics.edit_distance_python(word_a, word_b))
+
+    def test_paired_distances(self):
+        distances = WordMetrics.edit_distance_paired(
+            ['kitten', 'flaw', ''], ['sitting', 'lawn', 'abc'])
+        self.assertEqual(list(distances), [3, 2, 3])
+
+    def test_bounded_distances_saturate(self):
+        words_a = ['pronunciation', 'test', 'a']
+        words_b = ['pronounce', 'tests', 'xyz']
+        exact = WordMetrics.edit_distance_matrix(words_a, words_b)
+        for max_k in range(5):
+            bounded = WordMetrics.edit_distance_matrix(words_a, words_b, max_k=max_k)
+            self.assertTrue((bounded == exact.clip(max=max_k + 1)).all())
+
+
+
+class TestWordMatching(unittest.TestCase):
+
+    def test_alignment_skips_missing_words(self):
+        words_real = 'Ich habe sehr viel glück, am leben und gesund zu sein'.split()
+        words_estimated = 'Ic hab zeh viel guck am und gesund tu sein'.split()
+
+        mapped_words, mapped_words_indices = WordMatching.get_best_mapped_words(
+            words_estimated, words_real)
+
+        self.assertEqual(mapped_words, ['Ic', 'hab', 'zeh', 'viel', 'guck', 'am', '-',
+                                        'und', 'gesund', 'tu', 'sein'])
+        self.assertEqual(mapped_words_indices, [0, 1, 2, 3, 4, 5, -1, 6, 7, 8, 9])
+
+    def test_alignment_merges_split_words(self):
+        mapped_words, mapped_words_indices = WordMatching.get_best_mapped_words(
+            'I can not do it'.split(), "I can't do it".split())
+
+        self.assertEqual(mapped_words, ['I', 'can not', 'do', 'it'])
+        self.assertEqual(mapped_words_indices, [0, (1, 2), 3, 4])
+
+        mapped_words, _ = WordMatching.get_best_mapped_words(
+            'I can not do it'.split(), "I can't do it".split(), allow_merges=False)
+        self.assertEqual(mapped_words, ['I', 'can', 'do', 'it'])
+
+    def test_fuzzy_mapping_returns_indices(self):
+        mapped_words, mapped_words_indices = WordMatching.get_fuzzy_mapped_words(
+            'world hello xyz'.split(), 'Hello big World'.split())
+
+        self.assertEqual(mapped_words, ['hello', '-', 'world'])
+        self.assertEqual(mapped_words_indices, [1, -1, 0])
+
+    def test_letter_correctness(self):
+        letter_correctness = WordMatching.get_letter_correctness(
+            ['Hello,', 'world', 'test'], ['helo', 'wold', '-'])
+
+        self.assertEqual(letter_correctness, [[1, 1, 0, 1, 1, 1],
+                                              [1, 1, 0, 1, 1],
+                                              [0, 0, 0, 0]])
+
+
+
+class TestPhonemeInventory(unittest.TestCase):
+
+    def test_multi_codepoint_phonemes_are_single_tokens(self):
+        inventory = PhonemeInventory.PhonemeInventory('hi')
+        self.assertEqual(inventory.tokenize('mud͡ʒ̤e ɦæː।'), ['m', 'u', 'd͡ʒ̤', 'e', 'ɦ', 'æː'])
+
+        inventory = PhonemeInventory.PhonemeInventory(
+            'en', multi_letter_units=PhonemeInventory.LANGUAGE_MULTI_LETTER_UNITS['en'])
+        self.assertEqual(inventory.tokenize('hɛˈloʊ, ðɪs'), ['h', 'ɛ', 'l', 'oʊ', 'ð', 'ɪ', 's'])
+
+    def test_near_phonemes_cost_less(self):
+        inventory = PhonemeInventory.PhonemeInventory('en')
+        codes = inventory.encode('pbə')
+        codes_a, codes_b = inventory.encode('pət'), inventory.encode('bət')
+        costs = inventory.substitutionCosts()
+
+        self.assertEqual(costs[codes[0], codes[0]], 0.0)
+        self.assertLess(costs[codes[0], codes[1]], costs[codes[0], codes[2]])
+
+        distances = WordMetrics.weighted_edit_distance_paired([codes_a], [codes_b], costs)
+        self.assertAlmostEqual(float(distances[0]), float(costs[codes[0], codes[1]]))
+
+
+
+class UpperCaseConverter(ModelInterfaces.ITextToPhonemModel):
+    def convertToPhonem(self, sentence: str) -> str:
+        return sentence.upper()
+
+
+class TestCorpusIndex(unittest.TestCase):
+
+    def test_build_and_load(self):
+        with tempfile.TemporaryDirectory() as folder:
+            csv_path = os.path.join(folder, 'data_xx.csv')
+            index_path = os.path.join(folder, 'corpus_xx.idx')
+            with open(csv_path, 'w', encoding='utf-8') as handle:
+                handle.write('sentence\nHallo Welt.\nEin etwas längerer Satz mit neun Wörtern für die Kategorie.\n')
+
+            CorpusIndex.build_corpus_index('xx', csv_path, index_path, UpperCaseConverter())
+            index = CorpusIndex.load_corpus_index('xx', index_path, csv_path)
+
+            self.assertEqual(len(index), 2)
+            self.assertEqual(index.getWords(0), ['Hallo', 'Welt.'])
+            self.assertEqual(index.getWordsIpa(0), ['HALLO', 'WELT.'])
+            self.assertEqual(index.getSentenceIpa(1),
+                             'EIN ETWAS LÄNGERER SATZ MIT NEUN WÖRTERN FÜR DIE KATEGORIE.')
+            self.assertEqual(list(index.category), [1, 2])
+            self.assertEqual(index.findSentence(' Hallo Welt. '), 0)
+            self.assertEqual(index.findSentence('Hallo'), -1)
+            self.assertEqual(list(index.findPracticeSentences(words=['WELT'])), [0])
+            self.assertEqual(list(index.findPracticeSentences(phonemes=['W'])), [0, 1])
+            self.assertEqual(list(index.findPracticeSentences(phonemes=['W'], category=2)), [1])
+
+            sentence_id, word_error_rate = index.identifySentence(
+                'ein etwas längerer satz mit wörtern für die kategorie')
+            self.assertEqual(sentence_id, 1)
+            self.assertAlmostEqual(word_error_rate, 1 / 10)
+            self.assertEqual(index.identifySentence('guten morgen'), (-1, 1.0))
+            del index
 
+    def test_same_size_edit_with_kept_mtime_is_stale(self):
+        with tempfile.TemporaryDirectory() as folder:
+            csv_path = os.path.join(folder, 'data_xx.csv')
+            index_path = os.path.join(folder, 'corpus_xx.idx')
+            with open(csv_path, 'w', encoding='utf-8') as handle:
+                handle.write('sentence\nHallo Welt.\n')
+            CorpusIndex.build_corpus_index('xx', csv_path, index_path, UpperCaseConverter())
 
-trainer_SST_lambda = {}
-trainer_SST_lambda['de'] = pronunciationTrainer.getTrainer("de")
+            source = os.stat(csv_path)
+            with open(csv_path, 'w', encoding='utf-8') as handle:
+                handle.write('sentence\nHallo Wald.\n')
+            os.utime(csv_path, ns=(source.st_atime_ns, source.st_mtime_ns))
 
+            self.assertIsNone(CorpusIndex.load_corpus_index('xx', index_path, csv_path))
 
+    def test_string_columns(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = CorpusIndex.write_string_columns(os.path.join(folder, 'pairs.idx'), {
+                'de_sentence': ['Guten Morgen.', 'Tschüss!'],
+                'en_sentence': ['Good morning.', 'Bye!'],
+            })
+            columns = CorpusIndex.StringColumns(path)
+
+            self.assertEqual(len(columns), 2)
+            self.assertEqual(columns['de_sentence'][1], 'Tschüss!')
+            self.assertEqual(columns['en_sentence'].slice(0, 2), ['Good morning.', 'Bye!'])
+            del columns
+
+
+class UpperCaseTranslator(ModelInterfaces.ITranslationModel):
+    def translateSentence(self, sentence: str) -> str:
+        return sentence.upper()
+
+
+class TestTranslationTable(unittest.TestCase):
+
+    def test_missing_translations_are_written_back(self):
+        with tempfile.TemporaryDirectory() as folder:
+            csv_path = os.path.join(folder, 'data_xx.csv')
+            table_path = os.path.join(folder, 'translations_xx.idx')
+            with open(csv_path, 'w', encoding='utf-8') as handle:
+                handle.write('sentence\nHallo Welt.\nGuten Morgen.\n')
+
+            table = TranslationTable.TranslationTable('xx', table_path, csv_path)
+            self.assertEqual(table.get(1), '')
+
+            translation_queue = TranslationTable.TranslationQueue(table, UpperCaseTranslator, batch_wait=0.01)
+            translation_queue.request(1, 'Guten Morgen.')
+            translation_queue.join()
+
+            self.assertEqual(table.get(1), 'GUTEN MORGEN.')
+            reopened = TranslationTable.TranslationTable('xx', table_path, csv_path)
+            self.assertEqual([reopened.get(0), reopened.get(1)], ['', 'GUTEN MORGEN.'])
+            del table, reopened
+
+
+    def test_concurrent_tables_merge_their_translations(self):
+        with tempfile.TemporaryDirectory() as folder:
+            csv_path = os.path.join(folder, 'data_xx.csv')
+            table_path = os.path.join(folder, 'translations_xx.idx')
+            with open(csv_path, 'w', encoding='utf-8') as handle:
+                handle.write('sentence\nHallo Welt.\nGuten Morgen.\n')
+            first = TranslationTable.TranslationTable('xx', table_path, csv_path)
+            second = TranslationTable.TranslationTable('xx', table_path, csv_path)
+
+            first.update({0: 'Hello world.'})
+            second.update({1: 'Good morning.'})
+            first.flush()
+            second.flush()
+
+            reopened = TranslationTable.TranslationTable('xx', table_path, csv_path)
+            self.assertEqual([reopened.get(0), reopened.get(1)], ['Hello world.', 'Good morning.'])
+            self.assertEqual([name for name in os.listdir(folder) if 'idx.' in name], ['translations_xx.idx.lock'])
+            del first, second, reopened
+
+
+def fake_batched_pipeline(audios, batch_size=1, generate_kwargs=None):
+    time.sleep(0.01)
+    return [{'text': f"{generate_kwargs['language']} {len(audio)}", 'chunks': []} for audio in audios]
+
+
+@requires_whisper
+class TestASRBatchScheduler(unittest.TestCase):
+
+    def test_results_are_routed_to_their_callers(self):
+        scheduler = whisper_wrapper.ASRBatchScheduler(
+            fake_batched_pipeline, max_batch_size=4, max_wait_ms=50, duration_bucket_s=2)
+        requests = [('en' if idx % 2 else 'hi', 16000 * (1 if idx < 4 else 5) + idx) for idx in range(8)]
+        results = {}
+
+        def transcribe(idx):
+            language, length = requests[idx]
+            results[idx] = scheduler.submit(np.zeros(length, dtype=np.float32), language).result()['text']
+
+        threads = [threading.Thread(target=transcribe, args=(idx,)) for idx in range(len(requests))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, {idx: f'{language} {length}' for idx, (language, length) in enumerate(requests)})
+        self.assertLess(len(scheduler.batch_sizes), len(requests))
+
+
+class TestASRInterface(unittest.TestCase):
+
+    def test_backends_take_word_timestamps_second(self):
+        import inspect
+        import whisper_onnx
+        backends = [whisper_onnx.WhisperOnnxASRModel] + ([whisper_wrapper.WhisperASRModel] if whisper_wrapper else [])
+        for backend in backends:
+            parameters = inspect.signature(backend.transcribe).parameters
+            self.assertEqual(list(parameters)[:3], ['self', 'audio', 'word_timestamps'])
+            self.assertEqual(parameters['language'].kind, inspect.Parameter.KEYWORD_ONLY)
+
+
+class FakeOnnxSession:
+    """Records its feeds and, like onnxruntime, fails when a declared input is missing"""
+
+    def __init__(self, inputs: list, outputs: list, run) -> None:
+        self.inputs, self.outputs, self.run_step, self.feeds = inputs, outputs, run, []
+
+    def get_inputs(self):
+        return [types.SimpleNamespace(name=name) for name in self.inputs]
+
+    def get_outputs(self):
+        return [types.SimpleNamespace(name=name) for name in self.outputs]
+
+    def run(self, output_names, feeds):
+        missing = set(self.inputs) - set(feeds)
+        if missing:
+            raise ValueError(f'Missing inputs {missing}')
+        self.feeds.append(feeds)
+        return self.run_step(feeds)
+
+
+class TestOnnxWhisperDecoding(unittest.TestCase):
+    # Text pieces 0-2, then <|endoftext|>, <|startoftranscript|>, <|en|>,
+    # <|transcribe|> and 150 timestamps of 0.02 s from token 7 on
+    pieces = ['ĠHello', 'Ġworld', 'Ġagain']
+    end, timestamp_begin = 3, 7
+
+    def scripted_logits(self, step: int) -> np.ndarray:
+        """What the fake decoder prefers at each step, breaking the timestamp rules where it can"""
+        ts = self.timestamp_begin
+        preferences = [
+            {0: 10, ts + 60: 9, ts + 10: 8},     # text first, then a 1.2 s start -> must start at 0.20
+            {0: 10}, {1: 10},
+            {ts + 5: 10, ts + 50: 9},            # timestamp going back -> must take 1.00
+            {2: 10, ts + 50: 5, self.end: 1},    # text after a closing timestamp -> must open at 1.00
+            {ts + 70: 10, 2: 5},                 # two timestamps in a row -> must take text
+            {self.end: 10},
+        ][step]
+        logits = np.full(self.timestamp_begin + 150, -10.0, dtype=np.float32)
+        for token, logit in preferences.items():
+            logits[token] = logit
+        return logits[None, None]
+
+    def test_greedy_decoding_with_kv_cache(self):
+        past_names = [f'past_key_values.0.{kind}.{part}' for kind in ('decoder', 'encoder') for part in ('key', 'value')]
+        present_names = [name.replace('past_key_values', 'present') for name in past_names]
+
+        def first_step(feeds):
+            return [self.scripted_logits(0)] + [np.full((1, 1, 1, 1), -1.0)] * 4
+
+        def next_step(feeds):
+            step = len(decoder_with_past.feeds)
+            return [self.scripted_logits(step)] + [np.full((1, 1, 1, 1), float(step))] * 2
+
+        decoder = FakeOnnxSession(['input_ids', 'encoder_hidden_states'], ['logits'] + present_names, first_step)
+        decoder_with_past = FakeOnnxSession(['input_ids', 'cache_position'] + past_names,
+                                            ['logits'] + present_names[:2], next_step)
+        encoder = FakeOnnxSession(['input_features'], ['last_hidden_state'],
+                                  lambda feeds: [np.zeros((1, 1500, 4), dtype=np.float32)])
+        sessions = types.SimpleNamespace(
+            encoder=encoder, decoder=decoder, decoder_with_past=decoder_with_past,
+            feature_extractor=lambda audio, sampling_rate, return_tensors: types.SimpleNamespace(
+                input_features=np.zeros((1, 80, 3000), dtype=np.float32)),
+            tokenizer=types.SimpleNamespace(decode=lambda tokens: ''.join(
+                self.pieces[token] for token in tokens).replace('Ġ', ' ')),
+            suppress_tokens=np.array([], dtype=np.int64), begin_suppress_tokens=np.array([self.end]),
+            start_token=4, transcribe_token=6, end_token=self.end, timestamp_begin=self.timestamp_begin,
+            languageToken=lambda language: 5)
+        import whisper_onnx
+        asr_model = whisper_onnx.WhisperOnnxASRModel(force_language='en', sessions=sessions)
+
+        result = asr_model.transcribe(np.zeros(32000, dtype=np.float32))
+
+        ts = self.timestamp_begin
+        self.assertEqual(list(decoder.feeds[0]['input_ids'][0]), [4, 5, 6])
+        self.assertEqual([int(feeds['input_ids'][0, 0]) for feeds in decoder_with_past.feeds],
+                         [ts + 10, 0, 1, ts + 50, ts + 50, 2])
+        self.assertEqual([int(feeds['cache_position'][0]) for feeds in decoder_with_past.feeds], [3, 4, 5, 6, 7, 8])
+        # Self-attention cache from the previous step, cross-attention cache from the first one
+        for step, feeds in enumerate(decoder_with_past.feeds):
+            self.assertEqual(float(feeds['past_key_values.0.decoder.key'].flat[0]), step if step else -1.0)
+            self.assertEqual(float(feeds['past_key_values.0.encoder.value'].flat[0]), -1.0)
+        self.assertEqual(result.transcript, 'Hello world again')
+        self.assertEqual([(w.word, round(w.start_ts), round(w.end_ts)) for w in result.word_locations],
+                         [('Hello', 3200, 9600), ('world', 9600, 16000), ('again', 16000, 32000)])
+
+
+class PieceTokenizer:
+    """Byte-level-BPE-like tokenizer over a fixed piece list ('Ġ' marks a leading space)"""
+    pieces = ['<|endoftext|>', '<|startoftranscript|>', 'ĠHel', 'lo', ',', 'Ġworld', '.', '<|0.00|>']
+    all_special_ids = [0, 1]
+
+    def convert_tokens_to_ids(self, piece):
+        return self.pieces.index(piece)
+
+    def convert_ids_to_tokens(self, token):
+        return self.pieces[token]
+
+    def decode(self, tokens):
+        return ''.join(self.pieces[token] for token in tokens).replace('Ġ', ' ')
+
+    def encode(self, text, add_special_tokens=True):
+        text, tokens = text.replace(' ', 'Ġ'), []
+        while text:
+            piece = max((piece for piece in self.pieces if text.startswith(piece)), key=len)
+            tokens.append(self.pieces.index(piece))
+            text = text[len(piece):]
+        return tokens
+
+
+class ChunkedPipeline:
+    """Stands in for the transformers ASR pipeline, which returns text but no decoder tokens"""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.tokenizer = PieceTokenizer()
+        generation_config = types.SimpleNamespace(
+            decoder_start_token_id=1, eos_token_id=0, lang_to_id={'<|en|>': 8}, task_to_id={'transcribe': 9},
+            no_timestamps_token_id=10, alignment_heads=[[0, 0]])
+        self.model = types.SimpleNamespace(generation_config=generation_config,
+                                           config=types.SimpleNamespace(max_target_positions=448, vocab_size=11))
+
+    def __call__(self, audio, generate_kwargs=None, return_timestamps=False):
+        self.calls += 1
+        return {'text': ' Hello, world.'}
+
+
+@requires_whisper
+class TestShortClipPath(unittest.TestCase):
+
+    def test_tokens_are_collated_into_words(self):
+        chunks = whisper_wrapper.collate_word_timestamps(
+            PieceTokenizer(), [1, 2, 3, 4, 5, 6, 0], [0.0, 0.1, 0.3, 0.4, 0.5, 0.9, 1.0])
+
+        self.assertEqual(chunks, [{'text': 'Hello,', 'timestamp': (0.1, 0.5)},
+                                  {'text': 'world.', 'timestamp': (0.5, 1.0)}])
+        self.assertEqual(whisper_wrapper.parse_pipeline_result({'text': ' Hello, world.', 'chunks': chunks})[1][1],
+                         {'word': 'world.', 'start_ts': 8000.0, 'end_ts': 16000.0})
+
+    def test_word_times_of_the_chunked_pipeline_need_no_second_decode(self):
+        asr_model = whisper_wrapper.WhisperASRModel.__new__(whisper_wrapper.WhisperASRModel)
+        asr_model.asr, asr_model.scheduler, asr_model.precision = ChunkedPipeline(), None, 'fp32'
+        asr_model.force_language, asr_model.sample_rate = 'en', 16000
+        asr_model.has_alignment_heads, asr_model.short_clip_fast_path = True, False
+        audio = np.zeros(16000, dtype=np.float32)
+
+        result = asr_model.transcribe(audio, word_timestamps=False)
+        self.assertEqual(result.tokens, (1, 8, 9, 10, 2, 3, 4, 5, 6, 0))
+
+        chunks = [{'text': 'Hello,', 'timestamp': (0.1, 0.5)}, {'text': 'world.', 'timestamp': (0.5, 1.0)}]
+        with unittest.mock.patch.object(whisper_wrapper, 'encode_window'), \
+                unittest.mock.patch.object(whisper_wrapper, 'time_tokens', return_value=chunks) as time_tokens:
+            word_locations = asr_model.alignWords(audio, result.tokens)
+
+        self.assertEqual(time_tokens.call_args.args[2], list(result.tokens))
+        self.assertEqual(asr_model.asr.calls, 1)
+        self.assertEqual([(location.word, location.start_ts) for location in word_locations],
+                         [('Hello,', 1600.0), ('world.', 8000.0)])
+
+    class CachedGreedyDecoder:
+        """Fake next_logits whose greedy token depends only on the position; keeps the token cache"""
+
+        def __init__(self, prompt: list, greedy: list, vocabulary_size: int = 50) -> None:
+            self.prompt, self.greedy, self.vocabulary_size = prompt, greedy, vocabulary_size
+            self.cache, self.fed_tokens = [], 0
+
+        def __call__(self, tokens: list, cached: int) -> np.ndarray:
+            assert cached <= len(self.cache)
+            self.cache[cached:] = tokens
+            self.fed_tokens += len(tokens)
+            return np.eye(self.vocabulary_size)[[
+                self.greedy[min(position - len(self.prompt) + 1, len(self.greedy) - 1)]
+                for position in range(cached, cached + len(tokens))]]
+
+    def decode(self, reference: list, greedy: list, max_tokens: int = 20):
+        prompt = [1, 2]
+        decoder = self.CachedGreedyDecoder(prompt, greedy)
+        tokens, log_probs, disagreements, passes = whisper_wrapper.decode_with_reference(
+            decoder, prompt, reference, end_token=0, max_tokens=max_tokens)
+        self.assertEqual(len(log_probs), len(tokens))
+        self.assertEqual(decoder.cache[:len(prompt) + len(tokens)], prompt + tokens)
+        return tokens, disagreements, passes, decoder.fed_tokens
+
+    def test_reference_draft_gives_the_greedy_transcript(self):
+        greedy = [5, 6, 7, 8, 9, 10, 0]
+        for reference, expected_disagreements, expected_passes in [
+                ([5, 6, 7, 8, 9, 10], [], 1), ([5, 6, 4, 8, 9, 10], [2], 2),
+                ([5, 6, 8, 9, 10], [2, 3], 3), ([5, 6, 7, 3, 8, 9, 10], [3], 2)]:
+            tokens, disagreements, passes, _ = self.decode(reference, greedy)
+            self.assertEqual(tokens, greedy[:-1])
+            self.assertEqual(disagreements, expected_disagreements)
+            self.assertEqual(passes, expected_passes)
+
+    def test_unrelated_reference_costs_about_greedy(self):
+        greedy = [5 + idx % 40 for idx in range(100)] + [0]
+        tokens, disagreements, passes, fed_tokens = self.decode([3, 4] * 60, greedy, max_tokens=200)
+
+        self.assertEqual(tokens, greedy[:-1])
+        self.assertEqual(disagreements, list(range(100)))
+        self.assertEqual(passes, 101)
+        # The whole reference once, then at most a short draft per token
+        self.assertLessEqual(fed_tokens, 2 + 120 + 100 * (1 + whisper_wrapper.REFERENCE_MIN_DRAFT))
+
+    def test_reference_longer_than_max_tokens(self):
+        greedy = [5 + idx % 40 for idx in range(30)] + [0]
+        for reference in (greedy[:-1], greedy[:3] + [4] + greedy[4:-1]):
+            tokens, _, _, _ = self.decode(reference, greedy, max_tokens=10)
+            self.assertEqual(tokens, greedy[:10])
+
+    def test_dynamic_time_warping_is_monotonic(self):
+        costs = np.ones((3, 6))
+        costs[0, :2] = costs[1, 2:4] = costs[2, 4:] = 0
+        text_indices, time_indices = whisper_wrapper.dynamic_time_warping(costs)
+
+        self.assertEqual(list(text_indices), [0, 0, 1, 1, 2, 2])
+        self.assertEqual(list(time_indices), [0, 1, 2, 3, 4, 5])
+
+
+class SentenceByLengthASR(ModelInterfaces.IASRModel):
+    """Transcribes audio as the sentence selected by its length, taking a while"""
+
+    def __init__(self, sentences: list) -> None:
+        self.sentences = sentences
+
+    def transcribe(self, audio, word_timestamps: bool = True) -> ModelInterfaces.ASRResult:
+        idx = audio.shape[1] - 16000
+        time.sleep(0.001 * (idx % 7))
+        words = self.sentences[idx % len(self.sentences)].split()
+        return ModelInterfaces.ASRResult.fromWordDicts(' '.join(words), [
+            {'word': word, 'start_ts': 1000.0 * position, 'end_ts': 1000.0 * (position + 1)}
+            for position, word in enumerate(words) if word_timestamps])
+
+    def processAudio(self, audio):
+        raise NotImplementedError
+
+    def getTranscript(self) -> str:
+        raise NotImplementedError
+
+    def getWordLocations(self) -> list:
+        raise NotImplementedError
+
+
+class TokenAligningASR(SentenceByLengthASR):
+    """Gives each word a token and times them again on request (alignWords)"""
+
+    def __init__(self, sentences: list) -> None:
+        super().__init__(sentences)
+        self.transcribe_calls = 0
+        self.aligned_tokens = []
+
+    def transcribe(self, audio, word_timestamps: bool = True) -> ModelInterfaces.ASRResult:
+        self.transcribe_calls += 1
+        result = super().transcribe(audio, word_timestamps)
+        return result._replace(tokens=tuple(10 + idx for idx in range(len(result.transcript.split()))))
+
+    def alignWords(self, audio, tokens: tuple = ()) -> tuple:
+        self.aligned_tokens.append(tokens)
+        return tuple(ModelInterfaces.WordLocation(str(token), 1000.0 * (token - 10), 1000.0 * (token - 9))
+                     for token in tokens)
+
+
+@requires_torch
+class TestConcurrentScoring(unittest.TestCase):
+
+    def test_concurrent_requests_do_not_mix_results(self):
+        sentences = ['the cat sat on the mat', 'a quick brown fox', 'good morning to you',
+                     'she sells sea shells by the sea shore', 'hello world']
+        trainer = pronunciationTrainer.PronunciationTrainer(
+            SentenceByLengthASR(sentences), UpperCaseConverter())
+        results = {}
+
+        def score(idx):
+            results[idx] = trainer.processAudioForGivenText(
+                torch.zeros(1, 16000 + idx), sentences[idx % len(sentences)])
+
+        threads = [threading.Thread(target=score, args=(idx,)) for idx in range(40)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 40)
+        for idx, result in results.items():
+            sentence = sentences[idx % len(sentences)]
+            self.assertEqual(result['recording_transcript'], sentence)
+            self.assertEqual(result['pronunciation_accuracy'], 100)
+            self.assertEqual(result['end_time'].split()[-1],
+                             str((1000 * len(sentence.split()) + 800) / 16000))
+
+    def test_word_times_on_demand(self):
+        asr_model = TokenAligningASR(['hello world'])
+        trainer = pronunciationTrainer.PronunciationTrainer(asr_model, UpperCaseConverter())
+        eager = trainer.processAudioForGivenText(torch.zeros(1, 16000), 'hello world')
+        lazy = trainer.processAudioForGivenText(torch.zeros(1, 16000), 'hello world', word_timestamps=False)
+        self.assertEqual((lazy['start_time'], lazy['end_time']), ('', ''))
+        self.assertEqual(lazy['pronunciation_accuracy'], eager['pronunciation_accuracy'])
+
+        # Another worker, given the audio and the alignment data as JSON, only aligns the tokens
+        other_worker = pronunciationTrainer.PronunciationTrainer(TokenAligningASR(['hello world']),
+                                                                 UpperCaseConverter())
+        word_alignment = json.loads(json.dumps(lazy['word_alignment']))
+        self.assertEqual(other_worker.getWordTimes(torch.zeros(1, 16000), word_alignment),
+                         {'start_time': eager['start_time'], 'end_time': eager['end_time']})
+        self.assertEqual(other_worker.asr_model.transcribe_calls, 0)
+        self.assertEqual(other_worker.asr_model.aligned_tokens, [(10, 11)])
+
+
+def synthetic_emissions(frame_labels: list, frame_peaks: list, num_labels: int) -> np.ndarray:
+    """Probabilities with frame_peaks[t] on frame_labels[t], the rest spread evenly"""
+    peaks = np.array(frame_peaks)[:, None]
+    probabilities = np.repeat((1 - peaks) / (num_labels - 1), num_labels, axis=1)
+    probabilities[np.arange(len(frame_labels)), frame_labels] = peaks[:, 0]
+    return probabilities
+
+
+class TestForcedAlignment(unittest.TestCase):
+    labels = ['_', ' ', 'a', 'b', 'c']
+    # a a _ b ' ' ' ' c c _, with 'c' barely recognised
+    probabilities = synthetic_emissions([2, 2, 0, 3, 1, 1, 4, 4, 0],
+                                        [0.9, 0.9, 0.9, 0.9, 0.9, 0.9, 0.3, 0.3, 0.9], 5)
+
+    def test_words_are_aligned(self):
+        alignment = ForcedAlignment.align_words(np.log(self.probabilities), 'Ab, c!', self.labels,
+                                                samples_per_frame=320)
+
+        self.assertEqual([(word['word'], word['start_ts'], word['end_ts']) for word in alignment],
+                         [('Ab,', 0.0, 1280.0), ('c!', 1920.0, 2560.0)])
+        self.assertAlmostEqual(alignment[0]['confidence'], 0.9)
+        self.assertAlmostEqual(alignment[1]['confidence'], 0.3)
+        with self.assertRaises(ValueError):
+            ForcedAlignment.ctc_viterbi(np.log(self.probabilities[:2]), [2, 3, 1, 4])
+
+    @requires_torch
+    def test_scoring_with_a_local_ctc_model(self):
+        class FixedEmissions(torch.nn.Module):
+            """Stand-in CTC model returning the same emissions for any audio"""
+
+            def __init__(self, probabilities: torch.Tensor) -> None:
+                super().__init__()
+                self.register_buffer('probabilities', probabilities)
+
+            def forward(self, audio: torch.Tensor) -> torch.Tensor:
+                return self.probabilities.unsqueeze(0)
+
+        with tempfile.TemporaryDirectory() as folder:
+            torch.jit.save(torch.jit.script(FixedEmissions(torch.tensor(self.probabilities, dtype=torch.float32))),
+                           os.path.join(folder, 'model.jit'))
+            with open(os.path.join(folder, 'labels.json'), 'w') as handle:
+                json.dump({'labels': self.labels, 'blank': 0}, handle)
+            trainer = pronunciationTrainer.PronunciationTrainer(
+                None, UpperCaseConverter(), aligner=models.getCTCAlignmentModel(folder))
+
+            result = trainer.processAudioWithForcedAlignment(torch.rand(1, 9 * 320), 'ab c')
+
+        self.assertEqual(result['real_and_transcribed_words'], [('ab', 'ab'), ('c', '-')])
+        self.assertEqual(result['pronunciation_categories'], [0, 2])
+        self.assertEqual(result['start_time'], '0.0 0.12')
+        self.assertEqual(result['end_time'], '0.08 0.16')
+
+
+class FixedPhonemesASR(ModelInterfaces.IASRModel):
+    """Hears 'a b x', one phoneme per 320 samples with a pause before 'x'"""
+
+    def transcribe(self, audio, word_timestamps: bool = True) -> ModelInterfaces.ASRResult:
+        phonemes = tuple(ModelInterfaces.PhonemeLocation(phoneme, 320.0 * frame, 320.0 * (frame + 1))
+                         for phoneme, frame in [('a', 0), ('b', 1), ('x', 3)])
+        return ModelInterfaces.ASRResult('ab x', (), ipa='ab x', phoneme_locations=phonemes)
+
+    def processAudio(self, audio):
+        raise NotImplementedError
+
+    def getTranscript(self) -> str:
+        raise NotImplementedError
+
+    def getWordLocations(self) -> list:
+        raise NotImplementedError
+
+
+class EspeakPhonesASR(ModelInterfaces.IASRModel):
+    """Hears 'the water is better' as facebook/wav2vec2-lv-60-espeak-cv-ft spells it, one label per 320 samples"""
+
+    phones = ['ð', 'ə', 'w', 'ɔː', 'ɾ', 'ɚ', 'ɪ', 'z', 'b', 'ɛ', 'ɾ', 'ɚ']
+
+    def transcribe(self, audio, word_timestamps: bool = True) -> ModelInterfaces.ASRResult:
+        phonemes = tuple(ModelInterfaces.PhonemeLocation(phone, 320.0 * frame, 320.0 * (frame + 1))
+                         for frame, phone in enumerate(self.phones))
+        ipa = ' '.join(''.join(self.phones[start:end]) for start, end in [(0, 2), (2, 6), (6, 8), (8, 12)])
+        return ModelInterfaces.ASRResult(ipa, (), ipa=ipa, phoneme_locations=phonemes)
+
+    def processAudio(self, audio):
+        raise NotImplementedError
+
+    def getTranscript(self) -> str:
+        raise NotImplementedError
+
+    def getWordLocations(self) -> list:
+        raise NotImplementedError
+
+
+@requires_torch
+class TestPhonemeRecognition(unittest.TestCase):
+
+    def test_greedy_ctc_decode(self):
+        import phoneme_ctc
+        logits = np.eye(4)[[0, 2, 2, 0, 2, 3, 3, 1]]
+
+        label_ids, first_frames, end_frames = phoneme_ctc.greedy_ctc_decode(logits, blank=0)
+
+        self.assertEqual(list(label_ids), [2, 2, 3, 1])
+        self.assertEqual(list(first_frames), [1, 4, 5, 7])
+        self.assertEqual(list(end_frames), [3, 5, 7, 8])
+
+    def test_recognized_phonemes_are_scored_without_transcript(self):
+        trainer = pronunciationTrainer.PronunciationTrainer(FixedPhonemesASR(), UpperCaseConverter())
+
+        result = trainer.processAudioForGivenText(torch.zeros(1, 16000), 'ab c')
+
+        self.assertEqual(result['recording_ipa'], 'ab x')
+        self.assertEqual(result['real_and_transcribed_words_ipa'], [('AB', 'ab'), ('C', 'x')])
+        self.assertEqual(result['pronunciation_categories'], [0, 2])
+        self.assertEqual(result['real_and_transcribed_words'], [('ab', 'ab'), ('c', '-')])
+        self.assertEqual(result['start_time'], '0.0 0.01')
+        self.assertEqual(result['end_time'], '0.09 0.13')
+
+    def test_open_reading_is_refused(self):
+        trainer = pronunciationTrainer.PronunciationTrainer(
+            FixedPhonemesASR(), UpperCaseConverter(), corpus_index=types.SimpleNamespace())
+
+        with self.assertRaises(RuntimeError):
+            trainer.processAudioForOpenReading(torch.zeros(1, 16000))
+
+    def test_espeak_spelling_of_a_correct_reading_scores_100(self):
+        trainer = pronunciationTrainer.PronunciationTrainer(
+            EspeakPhonesASR(), RuleBasedModels.EngPhonemConverter(), PhonemeInventory.get_phoneme_inventory('en'))
+
+        result = trainer.processAudioForGivenText(torch.zeros(1, 16000), 'The water is better')
+
+        self.assertEqual(result['recording_ipa'], 'ðə wɔːɾɚ ɪz bɛɾɚ')
+        self.assertEqual([heard for _, heard in result['real_and_transcribed_words_ipa']],
+                         ['ðə', 'wɔtər', 'ɪz', 'bɛtər'])
+        self.assertEqual(result['pronunciation_accuracy'], 100)
+        self.assertEqual(result['pronunciation_categories'], [0, 0, 0, 0])
+
+
+@requires_torch
 class TestScore(unittest.TestCase):
+    """German scoring; 'de' has no ASR model or corpus, so the trainer only gets the converter"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.trainer = pronunciationTrainer.PronunciationTrainer(
+            None, RuleBasedModels.EpitranPhonemConverter(epitran.Epitran('deu-Latn')),
+            PhonemeInventory.get_phoneme_inventory('de'))
 
     def test_exact_transcription(self):
         words_real = 'Ich habe sehr viel glück, am leben und gesund zu sein'
 
-        real_and_transcribed_words, _, _ = trainer_SST_lambda['de'].matchSampleAndRecordedWords(
+        real_and_transcribed_words, _, _ = self.trainer.matchSampleAndRecordedWords(
             words_real, words_real)
 
-        pronunciation_accuracy, _ = trainer_SST_lambda['de'].getPronunciationAccuracy(
+        pronunciation_accuracy, _ = self.trainer.getPronunciationAccuracy(
             real_and_transcribed_words)
 
         self.assertTrue(int(pronunciation_accuracy) == 100)
@@ -86,13 +847,26 @@ class TestScore(unittest.TestCase):
         words_real = 'Ich habe sehr viel glück, am leben und gesund zu sein'
         words_transcribed = 'Ic hab zeh viel guck am und gesund tu sein'
 
-        real_and_transcribed_words, _, _ = trainer_SST_lambda['de'].matchSampleAndRecordedWords(
+        real_and_transcribed_words, _, _ = self.trainer.matchSampleAndRecordedWords(
             words_real, words_transcribed)
 
-        pronunciation_accuracy, _ = trainer_SST_lambda['de'].getPronunciationAccuracy(
+        pronunciation_accuracy, _ = self.trainer.getPronunciationAccuracy(
             real_and_transcribed_words)
 
-        self.assertTrue(int(pronunciation_accuracy) == 71)
+        # 67 with the original character-level scoring: weighted phoneme
+        # substitution costs make near misses (ɪç/iːk, t͡suː/tuː) cost less
+        self.assertEqual(int(pronunciation_accuracy), 75)
+
+    def test_merged_words_span_both_locations(self):
+        self.assertEqual(self.trainer.getWordLocationsFromRecordInSeconds(
+            [(0, 1600), (1600, 3200), (3200, 4800)], [0, (1, 2), -1]), ('0.0 0.1 0.0', '0.1 0.3 0.0'))
+
+    def test_inserted_phonemes_lower_the_sentence_score(self):
+        pronunciation_accuracy, per_word = self.trainer.getPronunciationAccuracy(
+            [('ja', 'jaxxxxxx'), ('ja', 'ja')])
+
+        self.assertEqual(per_word, [0.0, 100.0])
+        self.assertEqual(pronunciation_accuracy, 0.0)
 
 
 if __name__ == '__main__':
@@ -206,6 +206,7 @@ Endpoints:
     POST /getSample                     - Fetch a pronunciation sample
     POST /GetAccuracyFromRecordedAudio  - Score recorded pronunciation
     POST /debug_audio                   - Debug: inspect uploaded audio
+    GET  /debug_models                  - Debug: phoneme converter load stats
 
 Usage:
     python app.py
@@ -213,7 +214,6 @@ Usage:
 """
 
 import importlib
-import io
 import json
 import os
 import base64
@@ -221,107 +221,13 @@ import webbrowser
 from typing import Any
 
 # ---------------------------------------------------------------------------
-# Environment & encoding patch (must run before pandas import)
+# Environment
+# The corpora are read without pandas (see CorpusIndex.read_sentences, which
+# tries utf-8 → utf-8-sig → latin-1 → cp1252), so no read_csv patch is needed.
 # ---------------------------------------------------------------------------
 
 os.environ["PYTHONUTF8"] = "1"
 
-import pandas as _pd  # noqa: E402 (intentional late import after env var)
-
-# ---------------------------------------------------------------------------
-# CSV Encoding Patch
-# Monkey-patches pandas.read_csv to auto-detect encoding, falling back
-# through a priority list: utf-8 → utf-8-sig → latin-1 → cp1252
-# ---------------------------------------------------------------------------
-
-_FALLBACK_ENCODINGS = ["utf-8", "utf-8-sig", "latin-1", "cp1252"]
-_orig_read_csv = _pd.read_csv
-_charset_detector = None
-
-try:
-    from charset_normalizer import from_bytes as _cn_from_bytes
-
-    def _charset_detector(data: bytes) -> str | None:
-        """Return the best-guess encoding for raw bytes, or None."""
-        result = _cn_from_bytes(data).best()
-        return result.encoding if result else None
-
-except ImportError:
-    pass  # charset_normalizer not installed; fall back to manual list
-
-
-def _read_csv_auto_encoding(*args, **kwargs) -> _pd.DataFrame:
-    """
-    Wrapper around pandas.read_csv that auto-detects file encoding.
-
-    If the caller has already specified ``encoding=``, the original
-    function is called unchanged.  Otherwise, a list of common encodings
-    is tried in order (with optional charset-normalizer detection first).
-    """
-    # Respect explicit encoding from caller
-    if "encoding" in kwargs or not args:
-        return _orig_read_csv(*args, **kwargs)
-
-    source = args[0]
-
-    # --- File-like object ---
-    if hasattr(source, "read") and callable(source.read):
-        name = getattr(source, "name", None)
-
-        # If it's a named path on disk, re-open by path for reliability
-        if isinstance(name, str) and os.path.exists(name):
-            for enc in _FALLBACK_ENCODINGS:
-                try:
-                    return _orig_read_csv(name, encoding=enc, **kwargs)
-                except UnicodeDecodeError:
-                    continue
-            return _orig_read_csv(name, **kwargs)  # last-ditch fallback
-
-        # Generic file-like: read bytes then decode
-        try:
-            data = source.read()
-        except Exception:
-            for enc in _FALLBACK_ENCODINGS:
-                try:
-                    return _orig_read_csv(*args, encoding=enc, **kwargs)
-                except Exception:
-                    pass
-            return _orig_read_csv(*args, **kwargs)
-
-        if isinstance(data, bytes):
-            if _charset_detector:
-                detected = _charset_detector(data)
-                if detected:
-                    try:
-                        return _orig_read_csv(io.StringIO(data.decode(detected)), **kwargs)
-                    except Exception:
-                        pass
-            for enc in _FALLBACK_ENCODINGS:
-                try:
-                    return _orig_read_csv(io.StringIO(data.decode(enc)), **kwargs)
-                except Exception:
-                    continue
-            raise UnicodeDecodeError("utf-8", data, 0, 1,
-                                     "Could not decode file with any known encoding")
-        else:
-            return _orig_read_csv(io.StringIO(data), **kwargs)
-
-    # --- Path-like string/Path object ---
-    last_err: Exception | None = None
-    for enc in _FALLBACK_ENCODINGS:
-        try:
-            return _orig_read_csv(*args, encoding=enc, **kwargs)
-        except UnicodeDecodeError as exc:
-            last_err = exc
-        except Exception:
-            raise
-    if last_err:
-        raise last_err
-    return _orig_read_csv(*args, **kwargs)
-
-
-_pd.read_csv = _read_csv_auto_encoding  # apply patch
-
 # ---------------------------------------------------------------------------
 # Flask application setup
 # ---------------------------------------------------------------------------
@@ -477,6 +383,30 @@ def get_accuracy_from_recorded_audio() -> Response:
         return jsonify({"error": str(exc)}), 500
 
 
+@app.route("/getWordTimes", methods=["POST"])
+def get_word_times() -> Response:
+    """
+    Word start/end times of a recording scored with "word_timestamps": false.
+
+    Request body (JSON):
+        {
+            "base64Audio":    "<the scored recording>",
+            "word_alignment": <from the scoring response>,
+            "language":       "<language code>"
+        }
+
+    Returns:
+        JSON with space-separated "start_time" and "end_time" in seconds.
+    """
+    try:
+        event = build_lambda_event(request.get_json(force=True))
+        result = get_lambda("score").word_times_handler(event, [])
+        return lambda_response(result)
+    except Exception as exc:
+        app.logger.exception("getWordTimes failed")
+        return jsonify({"error": str(exc)}), 500
+
+
 @app.route("/debug_audio", methods=["POST"])
 def debug_audio() -> Response:
     """
@@ -515,11 +445,24 @@ def debug_audio() -> Response:
         return jsonify({"error": str(exc)}), 500
 
 
+@app.route("/debug_models", methods=["GET"])
+def debug_models() -> Response:
+    """
+    Debug endpoint: load time, memory and cache statistics of the phoneme
+    converters loaded so far (see RuleBasedModels.get_phonem_converter).
+    """
+    import RuleBasedModels
+
+    return jsonify(RuleBasedModels.get_phonem_converter_stats())
+
+
 # ---------------------------------------------------------------------------
 # Entry point
 # ---------------------------------------------------------------------------
 
 if __name__ == "__main__":
     app.logger.info("Working directory: %s", os.getcwd())
+    app.logger.info("Whisper precision: %s (set WHISPER_PRECISION to fp32, int8 or bf16)",
+                    os.environ.get("WHISPER_PRECISION", "fp32"))
     webbrowser.open_new(f"http://127.0.0.1:{PORT}/")
     app.run(host=HOST, port=PORT, debug=False)
\ No newline at end of file
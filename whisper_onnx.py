@@ -0,0 +1,296 @@
+"""
+Whisper on ONNX Runtime, as a drop-in IASRModel next to WhisperASRModel.
+
+Export (once, from the cached Hugging Face weights):
+    python whisper_onnx.py                        # models.WHISPER_MODEL_NAME
+    python whisper_onnx.py openai/whisper-small
+
+writes encoder_model.onnx, decoder_model.onnx and decoder_with_past_model.onnx
+(via optimum) plus the feature extractor, tokenizer and generation config to
+./onnx_models/<model>/. At runtime only onnxruntime and the transformers
+feature extractor/tokenizer are needed; the decoder runs a greedy loop that
+feeds the key/value cache of each step into the next.
+
+Word locations: the ONNX decoder has no cross-attention outputs, so the
+pipeline's DTW word alignment is not available. Whisper's own timestamp
+tokens give segment boundaries and words are spread over their segment in
+proportion to their length.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import numpy as np
+from typing import Union
+from ModelInterfaces import ASRResult, IASRModel
+
+try:
+    import onnxruntime
+except ImportError:  # only needed for this backend
+    onnxruntime = None
+
+ONNX_MODEL_FOLDER = "./onnx_models/"
+ENCODER_FILE = "encoder_model.onnx"
+DECODER_FILE = "decoder_model.onnx"
+DECODER_WITH_PAST_FILE = "decoder_with_past_model.onnx"
+
+SAMPLE_RATE = 16000
+WINDOW_SECONDS = 30
+TIMESTAMP_RESOLUTION_S = 0.02
+MAX_NEW_TOKENS = 224
+MAX_INITIAL_TIMESTAMP_S = 1.0
+
+
+def get_onnx_model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_MODEL_FOLDER, model_name.replace("/", "--"))
+
+
+# ─── Export ─────────────────────────────────────────────────────────────────
+def export_whisper_onnx(model_name: str, output_dir: str = None) -> str:
+    """One-time export of a Whisper checkpoint to ONNX encoder/decoder graphs."""
+    from optimum.exporters.onnx import main_export
+    from transformers import GenerationConfig, WhisperProcessor
+
+    output_dir = output_dir or get_onnx_model_dir(model_name)
+    main_export(model_name, output=output_dir, task="automatic-speech-recognition-with-past",
+                no_post_process=True)  # keep decoder and decoder-with-past as separate graphs
+    WhisperProcessor.from_pretrained(model_name).save_pretrained(output_dir)
+    GenerationConfig.from_pretrained(model_name).save_pretrained(output_dir)
+    return output_dir
+
+
+# ─── Sessions ───────────────────────────────────────────────────────────────
+class WhisperOnnxSessions:
+    """ONNX Runtime sessions, feature extractor and tokenizer of one export."""
+
+    def __init__(self, model_dir: str) -> None:
+        if onnxruntime is None:
+            raise ImportError("The ONNX backend needs onnxruntime (pip install onnxruntime)")
+        if not os.path.exists(os.path.join(model_dir, ENCODER_FILE)):
+            raise FileNotFoundError(
+                f"No ONNX export in {model_dir} - run: python whisper_onnx.py <model name>")
+        from transformers import WhisperFeatureExtractor, WhisperTokenizer
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.encoder, self.decoder, self.decoder_with_past = (
+            onnxruntime.InferenceSession(os.path.join(model_dir, file_name), options,
+                                         providers=["CPUExecutionProvider"])
+            for file_name in (ENCODER_FILE, DECODER_FILE, DECODER_WITH_PAST_FILE))
+        self.feature_extractor = WhisperFeatureExtractor.from_pretrained(model_dir)
+        self.tokenizer = WhisperTokenizer.from_pretrained(model_dir)
+
+        with open(os.path.join(model_dir, "generation_config.json")) as handle:
+            generation_config = json.load(handle)
+        self.suppress_tokens = np.array(generation_config.get("suppress_tokens") or [], dtype=np.int64)
+        self.begin_suppress_tokens = np.array(generation_config.get("begin_suppress_tokens") or [],
+                                              dtype=np.int64)
+        self.start_token = self.tokenizer.convert_tokens_to_ids("<|startoftranscript|>")
+        self.transcribe_token = self.tokenizer.convert_tokens_to_ids("<|transcribe|>")
+        self.end_token = self.tokenizer.convert_tokens_to_ids("<|endoftext|>")
+        self.timestamp_begin = self.tokenizer.convert_tokens_to_ids("<|0.00|>")
+
+    def languageToken(self, language: str) -> int:
+        return self.tokenizer.convert_tokens_to_ids(f"<|{language}|>")
+
+
+def run_session(session, feeds: dict) -> dict:
+    """Run a session with the feeds it declares; outputs by name."""
+    input_names = {node.name for node in session.get_inputs()}
+    output_names = [node.name for node in session.get_outputs()]
+    values = session.run(None, {name: value for name, value in feeds.items() if name in input_names})
+    return dict(zip(output_names, values))
+
+
+_sessions: dict = {}
+_sessions_lock = threading.Lock()
+
+
+def get_onnx_sessions(model_dir: str) -> WhisperOnnxSessions:
+    """Process-wide sessions for an export, loaded on first use."""
+    with _sessions_lock:
+        if model_dir not in _sessions:
+            start = time.time()
+            _sessions[model_dir] = WhisperOnnxSessions(model_dir)
+            print(f"[WhisperOnnxASRModel] Loaded {model_dir} in {time.time() - start:.1f}s")
+        return _sessions[model_dir]
+
+
+# ─── Model ──────────────────────────────────────────────────────────────────
+class WhisperOnnxASRModel(IASRModel):
+    """
+    Greedy Whisper decoding on ONNX Runtime with timestamp tokens, giving the
+    same transcript and word-location outputs as WhisperASRModel.
+
+    Args:
+        model_dir:      folder written by export_whisper_onnx
+        force_language: BCP-47 language code, e.g. 'en', 'hi', 'mr'
+        sessions:       already loaded sessions, instead of model_dir
+    """
+
+    def __init__(self, model_dir: str = None, force_language: str = None,
+                 sessions: WhisperOnnxSessions = None) -> None:
+        self.force_language = force_language
+        self.sample_rate = SAMPLE_RATE
+        self.sessions = sessions or get_onnx_sessions(model_dir)
+        self._results = threading.local()
+
+    # ------------------------------------------------------------------
+    def transcribe(self, audio: Union[np.ndarray, "torch.Tensor"], word_timestamps: bool = True, *,
+                   language: str = None) -> ASRResult:
+        """
+        Transcribe audio into an ASRResult; no state is kept on the model.
+
+        audio:    torch.Tensor or numpy array of shape (1, samples) or
+                  (samples,), sampled at 16 kHz.
+        word_timestamps: False leaves out the word locations. They are a
+                  coarse approximation: timestamp tokens only bound each
+                  segment (0.02 s steps) and the segment is shared out
+                  among its words by length, so words of one segment can
+                  be off by a good part of it. Use WhisperASRModel, which
+                  aligns words by cross-attention DTW, where word times
+                  matter.
+        language: (keyword only) overrides force_language for this call.
+        """
+        start = time.perf_counter()
+        if hasattr(audio, "detach"):
+            audio = audio.detach().cpu().numpy()
+        audio = np.asarray(audio, dtype=np.float32)
+        if audio.ndim == 2:
+            audio = audio[0]
+        elif audio.ndim != 1:
+            raise ValueError(f"Unexpected audio shape: {audio.shape}")
+
+        prompt = [self.sessions.start_token]
+        language = language or self.force_language
+        if language:
+            prompt.append(self.sessions.languageToken(language))
+        prompt.append(self.sessions.transcribe_token)
+
+        texts, word_locations = [], []
+        window = WINDOW_SECONDS * self.sample_rate
+        for offset in range(0, max(len(audio), 1), window):
+            chunk = audio[offset:offset + window]
+            tokens = self._generate(self._encode(chunk), prompt)
+            for start_s, end_s, text in self._segments(tokens, len(chunk) / self.sample_rate):
+                texts.append(text)
+                if word_timestamps:
+                    word_locations.extend(self._spreadWords(text, start_s, end_s, offset))
+
+        return ASRResult.fromWordDicts(" ".join(" ".join(texts).split()), word_locations,
+                                       time.perf_counter() - start)
+
+    def processAudio(self, audio: Union[np.ndarray, "torch.Tensor"], language: str = None):
+        """Transcribe audio and keep the result for getTranscript/getWordLocations of this thread."""
+        self._results.last = self.transcribe(audio, language=language)
+
+    def getTranscript(self) -> str:
+        result = getattr(self._results, "last", None)
+        return result.transcript if result else ""
+
+    def getWordLocations(self) -> list:
+        result = getattr(self._results, "last", None)
+        return [location._asdict() for location in result.word_locations] if result else []
+
+    # ------------------------------------------------------------------
+    def _encode(self, audio: np.ndarray) -> np.ndarray:
+        features = self.sessions.feature_extractor(
+            audio, sampling_rate=self.sample_rate, return_tensors="np").input_features
+        outputs = run_session(self.sessions.encoder, {"input_features": features.astype(np.float32)})
+        return next(iter(outputs.values()))
+
+    def _generate(self, encoder_hidden_states: np.ndarray, prompt: list) -> list:
+        """Greedy decoding with the key/value cache carried between steps."""
+        feeds = {
+            "input_ids": np.array([prompt], dtype=np.int64),
+            "encoder_hidden_states": encoder_hidden_states,
+        }
+        outputs = run_session(self.sessions.decoder, feeds)
+        past = {}
+        generated = []
+        for step in range(MAX_NEW_TOKENS):
+            # Cross-attention keys/values only come from the first call and
+            # are kept; self-attention ones are replaced every step
+            past.update({name.replace("present", "past_key_values"): value
+                         for name, value in outputs.items() if name.startswith("present")})
+            token = self._nextToken(outputs["logits"][0, -1], generated)
+            if token == self.sessions.end_token:
+                break
+            generated.append(token)
+            feeds = {
+                "input_ids": np.array([[token]], dtype=np.int64),
+                "encoder_hidden_states": encoder_hidden_states,
+                "cache_position": np.array([len(prompt) + step], dtype=np.int64),
+                **past,
+            }
+            outputs = run_session(self.sessions.decoder_with_past, feeds)
+        return generated
+
+    def _nextToken(self, logits: np.ndarray, generated: list) -> int:
+        """Greedy pick under Whisper's suppression and timestamp rules."""
+        logits = logits.astype(np.float32).copy()
+        timestamp_begin, end_token = self.sessions.timestamp_begin, self.sessions.end_token
+        logits[self.sessions.suppress_tokens] = -np.inf
+        if not generated:
+            logits[self.sessions.begin_suppress_tokens] = -np.inf
+            logits[:timestamp_begin] = -np.inf          # start with a timestamp
+            logits[timestamp_begin + int(MAX_INITIAL_TIMESTAMP_S / TIMESTAMP_RESOLUTION_S) + 1:] = -np.inf
+            return int(np.argmax(logits))
+
+        last_was_timestamp = generated[-1] >= timestamp_begin
+        penultimate_was_timestamp = len(generated) < 2 or generated[-2] >= timestamp_begin
+        if last_was_timestamp:
+            if penultimate_was_timestamp:
+                logits[timestamp_begin:] = -np.inf      # a segment needs text
+            else:
+                logits[:end_token] = -np.inf            # close the segment
+        timestamps = [token for token in generated if token >= timestamp_begin]
+        if timestamps:
+            # Timestamps never go back; only the one opening the next segment
+            # may repeat the one that closed the previous segment
+            last_timestamp = timestamps[-1] + (0 if last_was_timestamp and not penultimate_was_timestamp else 1)
+            logits[timestamp_begin:last_timestamp] = -np.inf
+
+        log_probs = logits - np.logaddexp.reduce(logits[np.isfinite(logits)])
+        if np.logaddexp.reduce(log_probs[timestamp_begin:]) > log_probs[:timestamp_begin].max():
+            logits[:timestamp_begin] = -np.inf
+        return int(np.argmax(logits))
+
+    def _segments(self, tokens: list, duration_s: float):
+        """(start, end, text) per timestamped segment of a window."""
+        timestamp_begin = self.sessions.timestamp_begin
+        start_s, text_tokens = 0.0, []
+        for token in tokens:
+            if token < timestamp_begin:
+                text_tokens.append(token)
+                continue
+            time_s = (token - timestamp_begin) * TIMESTAMP_RESOLUTION_S
+            if text_tokens:
+                yield start_s, time_s, self.sessions.tokenizer.decode(text_tokens)
+                text_tokens = []
+            start_s = time_s
+        if text_tokens:
+            yield start_s, max(duration_s, start_s), self.sessions.tokenizer.decode(text_tokens)
+
+    def _spreadWords(self, text: str, start_s: float, end_s: float, offset: int) -> list:
+        words = text.split()
+        weights = np.cumsum([0] + [len(word) + 1 for word in words], dtype=np.float64)
+        bounds = start_s + (end_s - start_s) * weights / max(weights[-1], 1)
+        return [{
+            "word":     word,
+            "start_ts": float(offset + bounds[idx] * self.sample_rate),
+            "end_ts":   float(offset + bounds[idx + 1] * self.sample_rate),
+        } for idx, word in enumerate(words)]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        _model_name = sys.argv[1]
+    else:
+        import models
+        _model_name = models.WHISPER_MODEL_NAME
+    _start = time.time()
+    print(f"[whisper_onnx] Exported {_model_name} to {export_whisper_onnx(_model_name)} "
+          f"in {time.time() - _start:.0f}s")
@@ -1,10 +1,512 @@
+import contextlib
+import os
+import threading
+import time
+from concurrent.futures import Future
 import torch
 from transformers import pipeline
-from ModelInterfaces import IASRModel
+from ModelInterfaces import ASRResult, IASRModel
 from typing import Union
 import numpy as np
 
 
+# ─── Precision ──────────────────────────────────────────────────────────────
+# CPU inference precision, chosen with the WHISPER_PRECISION environment
+# variable (see benchmarkASR.py for agreement and latency against fp32):
+#   fp32 - full precision (default)
+#   int8 - dynamic int8 quantization of the nn.Linear layers
+#   bf16 - bfloat16 autocast, if the CPU has native bf16 support
+# int8 and bf16 have not been benchmarked on a released checkpoint yet: keep
+# fp32 in production until benchmarkASR.py shows their latency and WER.
+PRECISION_MODES = ("fp32", "int8", "bf16")
+WHISPER_PRECISION = os.environ.get("WHISPER_PRECISION", "fp32").lower()
+
+
+def cpu_supports_bf16() -> bool:
+    """True if the CPU has native bfloat16 instructions (AVX512-BF16 or AMX)."""
+    try:
+        with open("/proc/cpuinfo") as handle:
+            flags = handle.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def resolve_precision(precision: str) -> str:
+    if precision not in PRECISION_MODES:
+        raise ValueError(f"Unknown Whisper precision {precision!r}, expected one of {PRECISION_MODES}")
+    if precision == "bf16" and not cpu_supports_bf16():
+        print("[WhisperASRModel] bf16 requested but the CPU has no native bf16 support, using fp32")
+        return "fp32"
+    return precision
+
+
+def precision_context(precision: str):
+    """Autocast for bf16. Autocast state is per thread, so enter it where the model runs."""
+    if precision == "bf16":
+        return torch.autocast("cpu", dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+# ─── Shared pipelines ───────────────────────────────────────────────────────
+# Whisper is multilingual and the language is only a generate() argument, so
+# one loaded pipeline per (model, device, precision) serves every language.
+_pipelines: dict = {}
+_pipelines_lock = threading.Lock()
+
+
+def get_whisper_pipeline(model_name: str, device: int = -1, precision: str = "fp32"):
+    """Process-wide ASR pipeline for a model, loaded on first use."""
+    with _pipelines_lock:
+        key = (model_name, device, precision)
+        if key not in _pipelines:
+            start = time.time()
+            _pipelines[key] = pipeline(
+                "automatic-speech-recognition",
+                model=model_name,
+                device=device,
+                return_timestamps="word",
+                chunk_length_s=30,          # handle long audio gracefully
+                stride_length_s=[5, 5],     # overlap at chunk boundaries
+            )
+            if precision == "int8":
+                torch.quantization.quantize_dynamic(
+                    _pipelines[key].model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+            print(f"[WhisperASRModel] Loaded {model_name} in {time.time() - start:.1f}s "
+                  f"(precision: {precision})")
+        return _pipelines[key]
+
+
+# ─── Micro-batching ─────────────────────────────────────────────────────────
+# With ASR_MAX_BATCH_SIZE > 1, concurrent requests are collected for up to
+# ASR_MAX_WAIT_MS, grouped by language and duration (ASR_DURATION_BUCKET_S
+# wide buckets, to limit padding) and transcribed with one batched pipeline
+# call. The default of 1 keeps the direct, unbatched call.
+ASR_MAX_BATCH_SIZE = int(os.environ.get("ASR_MAX_BATCH_SIZE", "1"))
+ASR_MAX_WAIT_MS = float(os.environ.get("ASR_MAX_WAIT_MS", "10"))
+ASR_DURATION_BUCKET_S = float(os.environ.get("ASR_DURATION_BUCKET_S", "2"))
+
+
+class _ASRRequest:
+    __slots__ = ("audio", "language", "key", "arrival", "future")
+
+    def __init__(self, audio: np.ndarray, language: str, key: tuple) -> None:
+        self.audio = audio
+        self.language = language
+        self.key = key
+        self.arrival = time.monotonic()
+        self.future = Future()
+
+
+class ASRBatchScheduler:
+    """
+    Batches concurrent transcription requests in front of one pipeline.
+
+    submit() returns a Future of the raw pipeline result. A single worker
+    thread takes the oldest request's (language, duration bucket) group as
+    soon as it holds max_batch_size requests or the oldest has waited
+    max_wait_ms, and runs the group as one batch.
+    """
+
+    def __init__(self, asr_pipeline, precision: str = "fp32", max_batch_size: int = ASR_MAX_BATCH_SIZE,
+                 max_wait_ms: float = ASR_MAX_WAIT_MS,
+                 duration_bucket_s: float = ASR_DURATION_BUCKET_S, sample_rate: int = 16000) -> None:
+        self.asr = asr_pipeline
+        self.precision = precision
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.duration_bucket = max(duration_bucket_s, 1e-3) * sample_rate
+        self.batch_sizes = []
+        self._pending = []
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="asr-batching")
+        self._thread.start()
+
+    def submit(self, audio: np.ndarray, language: str = None) -> Future:
+        request = _ASRRequest(audio, language, (language, int(len(audio) // self.duration_bucket)))
+        with self._condition:
+            self._pending.append(request)
+            self._condition.notify()
+        return request.future
+
+    def _groupOfOldest(self) -> list:
+        key = self._pending[0].key
+        return [request for request in self._pending if request.key == key][:self.max_batch_size]
+
+    def _nextBatch(self) -> list:
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            deadline = self._pending[0].arrival + self.max_wait
+            while len(self._groupOfOldest()) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._groupOfOldest()
+            self._pending = [request for request in self._pending if request not in batch]
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._nextBatch()
+            generate_kwargs = {"task": "transcribe"}
+            if batch[0].language:
+                generate_kwargs["language"] = batch[0].language
+            try:
+                with torch.inference_mode(), precision_context(self.precision):
+                    results = self.asr([request.audio for request in batch], batch_size=len(batch),
+                                       generate_kwargs=generate_kwargs)
+            except Exception as exc:
+                for request in batch:
+                    request.future.set_exception(exc)
+                continue
+            self.batch_sizes.append(len(batch))
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
+
+
+_schedulers: dict = {}
+
+
+def get_batch_scheduler(model_name: str, device: int = -1, precision: str = "fp32"):
+    """Process-wide scheduler for a shared pipeline, or None when batching is off."""
+    if ASR_MAX_BATCH_SIZE <= 1:
+        return None
+    asr_pipeline = get_whisper_pipeline(model_name, device, precision)
+    with _pipelines_lock:
+        key = (model_name, device, precision)
+        if key not in _schedulers:
+            _schedulers[key] = ASRBatchScheduler(asr_pipeline, precision)
+            print(f"[WhisperASRModel] Batching up to {ASR_MAX_BATCH_SIZE} requests, "
+                  f"waiting at most {ASR_MAX_WAIT_MS:g} ms")
+        return _schedulers[key]
+
+
+# ─── Short clips ────────────────────────────────────────────────────────────
+# Recordings are a few seconds long and validate_audio rejects anything over
+# 30 s, so nearly every request fits one Whisper window. Such clips skip the
+# pipeline's chunk iteration, stride bookkeeping and chunk merging: the
+# feature extractor and generate() are called directly, and word times come
+# from the same cross-attention token timestamps the pipeline uses.
+# Off unless WHISPER_SHORT_CLIP_FAST_PATH=1, until `python benchmarkASR.py
+# fast` shows its latency and transcript agreement against the pipeline.
+WINDOW_SECONDS = 30
+WHISPER_SHORT_CLIP_FAST_PATH = os.environ.get("WHISPER_SHORT_CLIP_FAST_PATH", "0") == "1"
+
+
+def supports_short_clip_path(asr_pipeline) -> bool:
+    """Token timestamps need the checkpoint's alignment heads."""
+    generation_config = getattr(asr_pipeline.model, "generation_config", None)
+    return bool(getattr(generation_config, "alignment_heads", None))
+
+
+def collate_word_timestamps(tokenizer, tokens: list, token_times: list) -> list:
+    """Pipeline-style word chunks from generated tokens and their start times."""
+    special_ids = set(tokenizer.all_special_ids)
+    timestamp_begin = tokenizer.convert_tokens_to_ids("<|0.00|>")
+    words = []  # [token ids, start, end]
+    for position, token in enumerate(tokens):
+        if token in special_ids or token >= timestamp_begin:
+            continue
+        end = token_times[min(position + 1, len(token_times) - 1)]
+        # Byte-level BPE marks a leading space with "Ġ"; other tokens continue the word
+        if not words or tokenizer.convert_ids_to_tokens(token).startswith("Ġ"):
+            words.append([[token], token_times[position], end])
+        else:
+            words[-1][0].append(token)
+            words[-1][2] = end
+    chunks = [{"text": tokenizer.decode(ids).strip(), "timestamp": (float(start), float(end))}
+              for ids, start, end in words]
+    return [chunk for chunk in chunks if chunk["text"]]
+
+
+def transcribe_window(asr_pipeline, audio: np.ndarray, language: str = None, precision: str = "fp32",
+                      sample_rate: int = 16000, word_timestamps: bool = True) -> dict:
+    """Pipeline-style result ({'text', 'chunks'}) of a clip that fits one window."""
+    model, tokenizer = asr_pipeline.model, asr_pipeline.tokenizer
+    features = asr_pipeline.feature_extractor(
+        audio, sampling_rate=sample_rate, return_tensors="pt").input_features
+    generate_kwargs = {"task": "transcribe", "return_dict_in_generate": True,
+                       "return_token_timestamps": word_timestamps}
+    if language:
+        generate_kwargs["language"] = language
+    with torch.inference_mode(), precision_context(precision):
+        output = model.generate(features.to(model.device), **generate_kwargs)
+    tokens = output["sequences"][0].tolist()
+    if not word_timestamps:
+        # Kept so the words can be timed later without decoding again (see time_tokens)
+        sequence = tokens
+        if tokens[:1] != [model.generation_config.decoder_start_token_id]:
+            sequence = decoder_prompt(model.generation_config, language) + tokens if language else []
+        return {"text": tokenizer.decode(tokens, skip_special_tokens=True), "chunks": [], "tokens": sequence}
+    token_times = output["token_timestamps"][0].tolist()
+    return {
+        "text":   tokenizer.decode(tokens, skip_special_tokens=True),
+        "chunks": collate_word_timestamps(tokenizer, tokens, token_times),
+    }
+
+
+# ─── Reference-guided decoding ──────────────────────────────────────────────
+# When scoring, the expected sentence is known, so it is used as a draft: one
+# teacher-forced decoder pass scores all of its tokens at once and the prefix
+# on which the greedy argmax agrees is accepted. Where the model disagrees its
+# own token is taken, and the rest of the reference, realigned to it (within
+# REFERENCE_RESYNC_WINDOW tokens), is verified by the next pass. The
+# transcript is the one greedy decoding gives, but a correct reading costs one
+# decoder pass instead of one per token. Passes reuse the key/value cache of
+# the accepted tokens, and after a rejection the draft shrinks to
+# REFERENCE_MIN_DRAFT tokens (doubling again while accepted), so a recording
+# that does not follow the reference costs about what greedy decoding does.
+REFERENCE_RESYNC_WINDOW = 8
+REFERENCE_MIN_DRAFT = 4
+ATTENTION_MEDIAN_FILTER_WIDTH = 7
+TIME_PRECISION_S = 0.02  # per encoder frame
+
+
+def decode_with_reference(next_logits, prompt: list, reference: list, end_token: int,
+                          max_tokens: int, resync_window: int = REFERENCE_RESYNC_WINDOW):
+    """
+    Greedy decoding with the reference tokens as a draft.
+
+    next_logits(tokens, cached) runs the decoder over tokens as the
+    continuation of the first `cached` tokens of the sequence, whose
+    keys/values it kept from earlier passes (any beyond them are dropped),
+    and returns the (suppression-masked) logits of every position of tokens.
+    Returns at most max_tokens decoded tokens, their log-probabilities, the
+    positions of the tokens the model chose over the reference and the
+    number of passes.
+    """
+    hypothesis, log_probs, disagreements, passes = [], [], [], 0
+    position = draft_start = 0  # first reference token not matched yet, start of the draft
+    cached, draft_limit = 0, max_tokens
+    while len(hypothesis) < max_tokens:
+        sequence = prompt + hypothesis
+        draft = reference[draft_start:][:min(draft_limit, max_tokens - len(hypothesis))]
+        logits = np.asarray(next_logits(sequence[cached:] + draft, cached), dtype=np.float64)
+        logits = logits[len(sequence) - 1 - cached:]
+        passes += 1
+        predicted = logits.argmax(axis=-1)
+        row_log_probs = logits[np.arange(len(predicted)), predicted] - np.logaddexp.reduce(logits, axis=-1)
+        agreed = 0
+        while agreed < len(draft) and predicted[agreed] == draft[agreed]:
+            agreed += 1
+        hypothesis += draft[:agreed]
+        log_probs += row_log_probs[:agreed].tolist()
+        cached = len(sequence) + agreed  # the rejected draft tokens' keys/values are dropped
+        if agreed:
+            position = draft_start + agreed
+        draft_limit = min(2 * draft_limit, max_tokens) if agreed == len(draft) \
+            else max(REFERENCE_MIN_DRAFT, agreed)
+        if len(hypothesis) >= max_tokens:
+            break
+
+        token = int(predicted[agreed])
+        if token == end_token:
+            break
+        disagreements.append(len(hypothesis))
+        hypothesis.append(token)
+        log_probs.append(float(row_log_probs[agreed]))
+        # Back on the reference if the model's token is one of the next few
+        # reference tokens. Otherwise draft on as if it replaced one: every
+        # pass yields at least the next greedy token, so a wrong guess costs
+        # nothing extra
+        resync = [idx for idx in range(position, min(position + resync_window, len(reference)))
+                  if reference[idx] == token]
+        if resync:
+            position = draft_start = resync[0] + 1
+        else:
+            draft_start = position + 1
+    return hypothesis, log_probs, disagreements, passes
+
+
+def crop_key_value_cache(past_key_values, length: int):
+    """Keys/values of the first length decoder tokens (cross-attention ones are kept whole)."""
+    if hasattr(past_key_values, "crop"):  # transformers Cache objects
+        # A negative crop drops that many tokens; positive lengths are deprecated in newer transformers
+        excess = past_key_values.get_seq_length() - length
+        if excess > 0:
+            past_key_values.crop(-excess)
+        return past_key_values
+    return tuple((key[:, :, :length], value[:, :, :length]) + tuple(cross)
+                 for key, value, *cross in past_key_values)
+
+
+def median_filter(values: np.ndarray, width: int) -> np.ndarray:
+    """Median over a sliding window of the last axis, reflecting at the edges."""
+    pad = width // 2
+    if values.shape[-1] <= pad:
+        return values
+    padded = np.pad(values, [(0, 0)] * (values.ndim - 1) + [(pad, pad)], mode="reflect")
+    return np.median(np.lib.stride_tricks.sliding_window_view(padded, width, axis=-1), axis=-1)
+
+
+def dynamic_time_warping(costs: np.ndarray):
+    """
+    Monotonic alignment of the rows (tokens) and columns (frames) of a cost
+    matrix: (row indices, column indices) of the cheapest path.
+    """
+    rows, columns = costs.shape
+    total = np.full((rows + 1, columns + 1), np.inf)
+    total[0, 0] = 0
+    for row in range(1, rows + 1):
+        cost = costs[row - 1]
+        # Diagonal or vertical step into each cell, then any run of horizontal
+        # steps: total[row, j] = prefix[j] + min over k <= j of (candidate[k] - prefix[k])
+        candidate = np.minimum(total[row - 1, :-1], total[row - 1, 1:]) + cost
+        prefix = np.cumsum(cost)
+        total[row, 1:] = prefix + np.minimum.accumulate(candidate - prefix)
+
+    row, column, path = rows, columns, []
+    while row > 0 and column > 0:
+        path.append((row - 1, column - 1))
+        step = int(np.argmin((total[row - 1, column - 1], total[row - 1, column], total[row, column - 1])))
+        row, column = (row - 1, column - 1) if step == 0 else (row - 1, column) if step == 1 else (row, column - 1)
+    path.reverse()
+    return np.array([p[0] for p in path]), np.array([p[1] for p in path])
+
+
+def token_times_from_attentions(weights: np.ndarray) -> np.ndarray:
+    """
+    Start time (seconds) of each token from the alignment heads' cross
+    attentions, shaped (heads, tokens, frames), as in the pipeline's word
+    timestamps: token k starts when row k - 1 first reaches its frame.
+    """
+    mean = weights.mean(axis=-2, keepdims=True)
+    std = weights.std(axis=-2, keepdims=True)
+    matrix = median_filter((weights - mean) / (std + 1e-8), ATTENTION_MEDIAN_FILTER_WIDTH).mean(axis=0)
+    text_indices, time_indices = dynamic_time_warping(-matrix)
+    jumps = np.diff(text_indices, prepend=-1) > 0
+    times = np.zeros(matrix.shape[0])
+    times[1:] = (time_indices[jumps] * TIME_PRECISION_S)[:matrix.shape[0] - 1]
+    return times
+
+
+def decoder_prompt(generation_config, language: str) -> list:
+    """Start-of-transcript, language, transcribe and no-timestamps tokens."""
+    return [generation_config.decoder_start_token_id, generation_config.lang_to_id[f"<|{language}|>"],
+            generation_config.task_to_id["transcribe"], generation_config.no_timestamps_token_id]
+
+
+def transcript_tokens(asr_pipeline, text: str, language: str) -> list:
+    """Decoder sequence (prompt, text tokens, end) of a transcript, for time_tokens."""
+    config = asr_pipeline.model.generation_config
+    return (decoder_prompt(config, language)
+            + asr_pipeline.tokenizer.encode(" " + text.strip(), add_special_tokens=False)
+            + [config.eos_token_id])
+
+
+def encode_window(asr_pipeline, audio: np.ndarray, sample_rate: int = 16000):
+    """Encoder hidden states of a clip that fits one window."""
+    model = asr_pipeline.model
+    features = asr_pipeline.feature_extractor(
+        audio, sampling_rate=sample_rate, return_tensors="pt").input_features
+    return model.get_encoder()(features.to(model.device)).last_hidden_state
+
+
+def time_tokens(asr_pipeline, encoder_hidden_states, sequence: list, num_samples: int,
+                sample_rate: int = 16000) -> list:
+    """
+    Word chunks of an already decoded sequence (prompt included): one
+    teacher-forced decoder pass for the cross-attentions, then DTW.
+    """
+    model, config = asr_pipeline.model, asr_pipeline.model.generation_config
+    # SDPA returns no attention weights; generate(return_token_timestamps=True) switches the same way
+    model.config._attn_implementation = "eager"
+    output = model(encoder_outputs=(encoder_hidden_states,),
+                   decoder_input_ids=torch.tensor([sequence], device=model.device),
+                   output_attentions=True)
+    num_frames = int(np.ceil(num_samples / sample_rate / TIME_PRECISION_S))
+    weights = torch.stack([output.cross_attentions[layer][0, head]
+                           for layer, head in config.alignment_heads])
+    times = token_times_from_attentions(weights[:, :, :num_frames].float().cpu().numpy())
+    return collate_word_timestamps(asr_pipeline.tokenizer, sequence, times.tolist())
+
+
+def transcribe_with_reference(asr_pipeline, audio: np.ndarray, reference_text: str, language: str,
+                              precision: str = "fp32", sample_rate: int = 16000,
+                              word_timestamps: bool = True) -> dict:
+    """Pipeline-style result of a single-window clip, decoded with the reference as a draft."""
+    model, tokenizer = asr_pipeline.model, asr_pipeline.tokenizer
+    config = model.generation_config
+    no_timestamps = config.no_timestamps_token_id
+    prompt = decoder_prompt(config, language)
+    reference = tokenizer.encode(" " + reference_text.strip(), add_special_tokens=False)
+    max_tokens = model.config.max_target_positions - len(prompt) - 1
+    suppress_tokens = list(config.suppress_tokens or []) + [no_timestamps]
+    begin_suppress_tokens = list(config.begin_suppress_tokens or [])
+
+    with torch.inference_mode(), precision_context(precision):
+        encoder_hidden_states = encode_window(asr_pipeline, audio, sample_rate)
+
+        cache = {"past_key_values": None}
+
+        def next_logits(tokens: list, cached: int) -> np.ndarray:
+            past_key_values = cache["past_key_values"]
+            if past_key_values is not None:
+                past_key_values = crop_key_value_cache(past_key_values, cached)
+            output = model(encoder_outputs=(encoder_hidden_states,),
+                           decoder_input_ids=torch.tensor([tokens], device=model.device),
+                           past_key_values=past_key_values, use_cache=True)
+            cache["past_key_values"] = output.past_key_values
+            logits = output.logits[0].float().cpu().numpy()
+            logits[:, suppress_tokens] = -np.inf
+            logits[:, no_timestamps + 1:] = -np.inf       # timestamp tokens
+            if 0 <= len(prompt) - 1 - cached < len(logits):
+                logits[len(prompt) - 1 - cached, begin_suppress_tokens] = -np.inf
+            return logits
+
+        tokens, log_probs, disagreements, passes = decode_with_reference(
+            next_logits, prompt, reference, config.eos_token_id, max_tokens)
+
+        sequence = prompt + tokens + [config.eos_token_id]
+        chunks = []
+        if word_timestamps and tokens:
+            chunks = time_tokens(asr_pipeline, encoder_hidden_states, sequence, len(audio), sample_rate)
+
+    print(f"[WhisperASRModel] Reference-guided decoding: {len(tokens)} tokens, "
+          f"{len(disagreements)} off the reference, in {passes} decoder passes")
+    return {"text": tokenizer.decode(tokens, skip_special_tokens=True), "chunks": chunks,
+            "tokens": sequence if not word_timestamps else [],
+            "token_log_probs": log_probs, "disagreement_positions": disagreements}
+
+
+def parse_pipeline_result(result: dict, sample_rate: int = 16000):
+    """Transcript and word locations (in samples) of one pipeline result."""
+    transcript = (result.get("text") or "").strip()
+
+    raw_chunks = result.get("chunks") or []
+    word_locations = []
+
+    for chunk in raw_chunks:
+        if not isinstance(chunk, dict):
+            continue
+
+        word  = (chunk.get("text") or chunk.get("word") or "").strip()
+        ts    = chunk.get("timestamp")
+
+        # Timestamps arrive as a tuple (start, end) in seconds.
+        # Either value can be None (e.g. at the very end of audio).
+        try:
+            start_s = float(ts[0]) if (ts and ts[0] is not None) else 0.0
+        except Exception:
+            start_s = 0.0
+
+        try:
+            end_s = float(ts[1]) if (ts and ts[1] is not None) else start_s + 0.2
+        except Exception:
+            end_s = start_s + 0.2
+
+        # Convert seconds → sample indices (used by pronunciationTrainer)
+        word_locations.append({
+            "word":     word,
+            "start_ts": start_s * sample_rate,
+            "end_ts":   end_s   * sample_rate,
+        })
+
+    return transcript, word_locations
+
+
 class WhisperASRModel(IASRModel):
     """
     Whisper wrapper using Hugging Face pipeline.
@@ -15,11 +517,22 @@ class WhisperASRModel(IASRModel):
       must be passed inside generate_kwargs so it reaches model.generate().
     - Task is always 'transcribe' (not 'translate') so we get source-language text.
     - Graceful handling of missing timestamps (returns sensible defaults).
+    - The pipeline is shared by every WhisperASRModel with the same model and
+      device (see get_whisper_pipeline); only the language differs per call.
+    - With WHISPER_SHORT_CLIP_FAST_PATH=1, clips that fit one 30 s window
+      bypass the chunked pipeline (see transcribe_window); longer audio
+      still goes through it.
+    - transcribeWithReference decodes with the expected sentence as a draft
+      (see decode_with_reference).
+    - Concurrent calls can be micro-batched (see ASRBatchScheduler).
+      transcribe() returns an immutable ASRResult and keeps no state; the
+      legacy processAudio/getTranscript pair keeps the last result per thread.
 
     Args:
         model_name:     HuggingFace model id, e.g. "openai/whisper-small"
         force_language: BCP-47 language code, e.g. 'en', 'hi', 'mr'
         device:         -1 for CPU, 0 for first GPU, etc.
+        precision:      'fp32', 'int8' or 'bf16' (defaults to WHISPER_PRECISION)
     """
 
     def __init__(
@@ -27,29 +540,33 @@ class WhisperASRModel(IASRModel):
         model_name: str = "openai/whisper-base",
         force_language: str = None,
         device: int = -1,
+        precision: str = None,
     ):
         self.force_language = force_language
+        self.precision = resolve_precision(precision or WHISPER_PRECISION)
         self.sample_rate = 16000
-        self._transcript = ""
-        self._word_locations = []
-
-        self.asr = pipeline(
-            "automatic-speech-recognition",
-            model=model_name,
-            device=device,
-            return_timestamps="word",
-            chunk_length_s=30,          # handle long audio gracefully
-            stride_length_s=[5, 5],     # overlap at chunk boundaries
-        )
+        self._results = threading.local()
+
+        self.asr = get_whisper_pipeline(model_name, device, self.precision)
+        self.scheduler = get_batch_scheduler(model_name, device, self.precision)
+        self.has_alignment_heads = supports_short_clip_path(self.asr)
+        self.short_clip_fast_path = WHISPER_SHORT_CLIP_FAST_PATH and self.has_alignment_heads
 
     # ------------------------------------------------------------------
-    def processAudio(self, audio: Union[np.ndarray, "torch.Tensor"]):
+    def transcribe(self, audio: Union[np.ndarray, "torch.Tensor"], word_timestamps: bool = True, *,
+                   language: str = None) -> ASRResult:
         """
-        Transcribe audio and store transcript + word timestamps.
+        Transcribe audio into an ASRResult; no state is kept on the model.
 
-        audio: torch.Tensor of shape (1, samples) or (samples,), or a numpy
-               array of the same shapes.  Sample rate must be 16 kHz.
+        audio:    torch.Tensor of shape (1, samples) or (samples,), or a numpy
+                  array of the same shapes.  Sample rate must be 16 kHz.
+        word_timestamps: False skips the cross-attention DTW pass that times
+                  the words (not for micro-batched calls), leaving the word
+                  locations empty; single-window results keep their
+                  decoder tokens for alignWords.
+        language: (keyword only) overrides force_language for this call.
         """
+        start = time.perf_counter()
         try:
             # ── 1. Normalise input to 1-D numpy float32 ────────────────
             if hasattr(audio, "detach"):
@@ -65,52 +582,106 @@ class WhisperASRModel(IASRModel):
             #    is NOT supported in recent transformers; it must go into
             #    generate_kwargs so it reaches model.generate().
             generate_kwargs = {"task": "transcribe"}
-            if self.force_language:
-                generate_kwargs["language"] = self.force_language
+            language = language or self.force_language
+            if language:
+                generate_kwargs["language"] = language
 
-            # ── 3. Run the pipeline ─────────────────────────────────────
-            result = self.asr(audio, generate_kwargs=generate_kwargs)
+            # ── 3. Run the pipeline (batched with concurrent requests if enabled,
+            #       or straight through generate() for a single-window clip)
+            if self.scheduler is not None:
+                result = self.scheduler.submit(audio, language).result()
+            elif self.short_clip_fast_path and len(audio) <= WINDOW_SECONDS * self.sample_rate:
+                result = transcribe_window(self.asr, audio, language, self.precision, self.sample_rate,
+                                           word_timestamps)
+            else:
+                with torch.inference_mode(), precision_context(self.precision):
+                    result = self.asr(audio, generate_kwargs=generate_kwargs,
+                                      return_timestamps="word" if word_timestamps else False)
 
-            # ── 4. Extract transcript ───────────────────────────────────
-            self._transcript = (result.get("text") or "").strip()
+            # ── 4. Extract transcript and word-level timestamps ─────────
+            transcript, word_locations = parse_pipeline_result(result, self.sample_rate)
+            tokens = result.get("tokens") or []
+            if (not word_timestamps and not tokens and transcript and language and self.has_alignment_heads
+                    and len(audio) <= WINDOW_SECONDS * self.sample_rate):
+                # The pipeline keeps no decoder tokens; the transcript's own
+                # tokens time the same words in alignWords
+                tokens = transcript_tokens(self.asr, transcript, language)
 
-            # ── 5. Extract word-level timestamps ───────────────────────
-            raw_chunks = result.get("chunks") or []
-            self._word_locations = []
+        except Exception as exc:
+            print(f"[WhisperASRModel] transcribe error: {exc!r}")
+            raise
+
+        return ASRResult.fromWordDicts(transcript, word_locations, time.perf_counter() - start)._replace(
+            tokens=tuple(tokens))
 
-            for chunk in raw_chunks:
-                if not isinstance(chunk, dict):
-                    continue
+    def transcribeWithReference(self, audio: Union[np.ndarray, "torch.Tensor"], reference_text: str,
+                                word_timestamps: bool = True) -> ASRResult:
+        """
+        transcribe() for a recording of reference_text: the same greedy
+        transcript, from one teacher-forced decoder pass when the reading is
+        correct. Long clips, and models without a forced language or without
+        alignment heads, fall back to transcribe().
+        """
+        if hasattr(audio, "detach"):
+            audio = audio.detach().cpu().numpy()
+        audio = np.array(audio, dtype=np.float32)
+        if audio.ndim == 2:
+            audio = audio[0]
+        if (not reference_text.strip() or not self.force_language or not self.has_alignment_heads
+                or len(audio) > WINDOW_SECONDS * self.sample_rate):
+            return self.transcribe(audio, word_timestamps=word_timestamps)
 
-                word  = (chunk.get("text") or chunk.get("word") or "").strip()
-                ts    = chunk.get("timestamp")
+        start = time.perf_counter()
+        try:
+            result = transcribe_with_reference(self.asr, audio, reference_text, self.force_language,
+                                               self.precision, self.sample_rate, word_timestamps)
+        except Exception as exc:
+            print(f"[WhisperASRModel] transcribeWithReference error: {exc!r}")
+            raise
+        transcript, word_locations = parse_pipeline_result(result, self.sample_rate)
+        return ASRResult.fromWordDicts(transcript, word_locations, time.perf_counter() - start)._replace(
+            tokens=tuple(result["tokens"]), token_log_probs=tuple(result["token_log_probs"]),
+            disagreement_positions=tuple(result["disagreement_positions"]))
 
-                # Timestamps arrive as a tuple (start, end) in seconds.
-                # Either value can be None (e.g. at the very end of audio).
-                try:
-                    start_s = float(ts[0]) if (ts and ts[0] is not None) else 0.0
-                except Exception:
-                    start_s = 0.0
+    def alignWords(self, audio: Union[np.ndarray, "torch.Tensor"], tokens: tuple = ()) -> tuple:
+        """
+        Word locations of audio from the tokens of its word_timestamps=False
+        result: only the cross-attention DTW pass runs, not the decoding.
+        Without tokens (clips longer than a window, no forced language) it
+        transcribes again.
+        """
+        if hasattr(audio, "detach"):
+            audio = audio.detach().cpu().numpy()
+        audio = np.array(audio, dtype=np.float32)
+        if audio.ndim == 2:
+            audio = audio[0]
+        if not tokens or not self.has_alignment_heads or len(audio) > WINDOW_SECONDS * self.sample_rate:
+            return self.transcribe(audio).word_locations
 
-                try:
-                    end_s = float(ts[1]) if (ts and ts[1] is not None) else start_s + 0.2
-                except Exception:
-                    end_s = start_s + 0.2
+        # The tokens come back from the client, so check them before the decoder sees them
+        model = self.asr.model
+        sequence = [int(token) for token in tokens]
+        if (len(sequence) > model.config.max_target_positions
+                or not all(0 <= token < model.config.vocab_size for token in sequence)):
+            raise ValueError("Invalid decoder tokens")
 
-                # Convert seconds → sample indices (used by pronunciationTrainer)
-                self._word_locations.append({
-                    "word":     word,
-                    "start_ts": start_s * self.sample_rate,
-                    "end_ts":   end_s   * self.sample_rate,
-                })
+        start = time.perf_counter()
+        with torch.inference_mode(), precision_context(self.precision):
+            chunks = time_tokens(self.asr, encode_window(self.asr, audio, self.sample_rate), sequence,
+                                 len(audio), self.sample_rate)
+        _, word_locations = parse_pipeline_result({"chunks": chunks}, self.sample_rate)
+        print(f"[WhisperASRModel] Word timestamps of {len(sequence)} tokens: {time.perf_counter() - start:.2f}s")
+        return ASRResult.fromWordDicts("", word_locations).word_locations
 
-        except Exception as exc:
-            print(f"[WhisperASRModel] processAudio error: {exc!r}")
-            raise
+    def processAudio(self, audio: Union[np.ndarray, "torch.Tensor"], language: str = None):
+        """Transcribe audio and keep the result for getTranscript/getWordLocations of this thread."""
+        self._results.last = self.transcribe(audio, language=language)
 
     # ------------------------------------------------------------------
     def getTranscript(self) -> str:
-        return self._transcript
+        result = getattr(self._results, "last", None)
+        return result.transcript if result else ""
 
     def getWordLocations(self) -> list:
-        return self._word_locations
\ No newline at end of file
+        result = getattr(self._results, "last", None)
+        return [location._asdict() for location in result.word_locations] if result else []